@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+
+# Extrude surface fault traces into dipping ShakeMap ruptures (the workflow of
+# read-fault.ipynb as a module and CLI).
+#
+# Every trace is projected to local UTM and each segment is extruded down-dip
+# (strike by the right-hand rule, dip direction = strike + 90) to zmax. At the
+# interior vertices the bottom point is the average of the extrusions of the
+# two adjacent segments, so neighbouring panels share their bottom corners.
+# The extrusion is array math over all vertices and all (dip, zmax)
+# combinations, and the top and bottom points of a trace go back to WGS84 in
+# one batched pyproj transform.
+#
+# For every trace, dip and zmax two files are written:
+#   NAME_dipDIP_zZMAXkm_extruded.geojson: one polygon per segment (z in m, negative down)
+#   NAME_dipDIP_zZMAXkm_shakemap.json: the ShakeMap rupture (one MultiPolygon:
+#       the surface trace, the bottom trace reversed, back to the start; depth in km)
+# and a manifest of all of them per trace file (TRACEFILE_manifest.json).
+#
+# Sweeps over dip and zmax ranges (--dip-range, --zmax-range) replace the
+# hand-made variants (dip18_z40, dip20_z20, dip60_z20, ...). The UTM projection
+# and the segment strikes of every trace are computed once for the whole sweep,
+# and the (trace, dip) combinations are written in parallel with --workers.
+#
+# Example usage:
+# python /Users/hyin/soft/shakemap-postprocess-tools/build-fault-files/extrude_fault.py event-examples/2025_kamchatka/kamchatka-trace.shp --dip 18 20 --zmax 20 40 --metadata event-examples/2025_kamchatka/rupture_online.json
+# python /Users/hyin/soft/shakemap-postprocess-tools/build-fault-files/extrude_fault.py event-examples/2025_kamchatka/kamchatka-trace.shp --dip-range 10 90 10 --zmax-range 10 100 10 --outdir sweep --workers 8
+
+import argparse
+import concurrent.futures
+import functools
+import itertools
+import json
+import math
+import os
+
+import numpy as np
+from pyproj import Transformer
+
+WGS84 = "EPSG:4326"
+
+# Placeholder event metadata of the ShakeMap rupture file (as in read-fault.ipynb)
+DEFAULT_METADATA = {
+    "reference": " ",
+    "id": " ",
+    "network": "",
+    "netid": " ",
+    "productcode": " ",
+    "time": " ",
+    "lat": 0.0,
+    "lon": 0.0,
+    "depth": 0.0,
+    "mag": 0.0,
+    "locstring": " ",
+    "mech": " ",
+    "reviewed": " ",
+    "rake": 0.0,
+}
+
+
+def read_traces(file):
+    """
+    Read the surface traces of a line shapefile (or any file GeoPandas reads).
+    Args:
+        file: Path to the trace file.
+    Returns:
+        traces: List of (n_vertices, 2) arrays of UTM coordinates (m), one per
+            LineString (MultiLineStrings are split into their parts).
+        utm_crs: Local UTM CRS of the file.
+    """
+    import geopandas as gpd
+
+    gdf = gpd.read_file(file)
+    utm_crs = gdf.estimate_utm_crs()
+    lines = gdf.to_crs(utm_crs).geometry.explode(index_parts=False)
+    traces = [np.asarray(line.coords)[:, :2] for line in lines if line is not None and not line.is_empty]
+    return traces, utm_crs
+
+
+def segment_strikes(xy):
+    """
+    Strike of every segment of a trace (right-hand rule, degrees from north).
+    Args:
+        xy: (n_vertices, 2) array of projected coordinates.
+    Returns:
+        (n_vertices - 1,) array of strikes in [0, 360).
+    """
+    d = np.diff(xy, axis=0)
+    return np.degrees(np.arctan2(d[:, 0], d[:, 1])) % 360
+
+
+def vertex_dip_vectors(strikes):
+    """
+    Horizontal unit dip-direction vectors of the segments, averaged at the vertices.
+    Args:
+        strikes: (n_segments,) array of segment strikes.
+    Returns:
+        (n_segments + 1, 2) array of (east, north) vectors: the dip direction of
+        the first/last segment at the ends and the mean of the two adjacent
+        segments at the interior vertices.
+    """
+    dipdir = np.radians(strikes + 90)
+    unit = np.stack([np.sin(dipdir), np.cos(dipdir)], axis=-1)
+    return np.concatenate([unit[:1], 0.5 * (unit[:-1] + unit[1:]), unit[-1:]])
+
+
+def extrude_trace(xy, dip, zmax, strikes=None):
+    """
+    Bottom points of a trace extruded down-dip, for any number of dips and depths.
+    Args:
+        xy: (n_vertices, 2) array of UTM coordinates (m).
+        dip: Dip(s) in degrees.
+        zmax: Depth(s) of the bottom edge in km, broadcastable against dip.
+        strikes: Segment strikes (segment_strikes(xy)), if already computed.
+    Returns:
+        bottom_xy: Array of shape (*shape, n_vertices, 2) with the UTM coordinates
+            of the bottom edge, shape being the broadcast shape of dip and zmax.
+        bottom_z: Array of shape (*shape) with the depth of the bottom edge (m, negative down).
+    """
+    if strikes is None:
+        strikes = segment_strikes(xy)
+    vectors = vertex_dip_vectors(strikes)
+    dip, zmax = np.broadcast_arrays(np.asarray(dip, dtype=float), np.asarray(zmax, dtype=float))
+    horizontal = zmax * 1000 / np.tan(np.radians(dip))
+    return xy + horizontal[..., None, None] * vectors, -zmax * 1000
+
+
+@functools.lru_cache(maxsize=None)
+def utm_transformer(crs):
+    """
+    UTM -> WGS84 transformer of a CRS (string or WKT), created once per process.
+    """
+    return Transformer.from_crs(crs, WGS84, always_xy=True)
+
+
+def to_wgs84(xy, bottom_xy, transformer):
+    """
+    Transform the top and all bottom edges of a trace to WGS84 in one call.
+    Returns:
+        top_ll: (n_vertices, 2) lon, lat of the surface trace.
+        bottom_ll: Array of the shape of bottom_xy with the lon, lat of the bottom edges.
+    """
+    points = np.concatenate([xy[None], bottom_xy.reshape(-1, *xy.shape)])
+    lon, lat = transformer.transform(points[..., 0].ravel(), points[..., 1].ravel())
+    lonlat = np.stack([lon, lat], axis=-1).reshape(points.shape)
+    return lonlat[0], lonlat[1:].reshape(bottom_xy.shape)
+
+
+def extruded_geojson(top_ll, bottom_ll, bottom_z, name):
+    """
+    FeatureCollection with one polygon per segment (z in m, negative down).
+    """
+    features = []
+    for i in range(len(top_ll) - 1):
+        ring = [
+            [*top_ll[i], 0.0],
+            [*top_ll[i + 1], 0.0],
+            [*bottom_ll[i + 1], bottom_z],
+            [*bottom_ll[i], bottom_z],
+            [*top_ll[i], 0.0],
+        ]
+        features.append(
+            {
+                "type": "Feature",
+                "properties": {},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        )
+    return {
+        "type": "FeatureCollection",
+        "name": name,
+        "crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:OGC:1.3:CRS84"}},
+        "features": features,
+    }
+
+
+def shakemap_rupture(top_ll, bottom_ll, depth_km, metadata=None):
+    """
+    ShakeMap rupture file contents: a single MultiPolygon with the surface
+    trace, the bottom trace reversed and the first point again (depth in km).
+    """
+    surface = [[float(lon), float(lat), 0.0] for lon, lat in top_ll]
+    bottom = [[float(lon), float(lat), float(depth_km)] for lon, lat in bottom_ll]
+    polygon = surface + bottom[::-1] + [surface[0]]
+    return {
+        "type": "FeatureCollection",
+        "metadata": {**DEFAULT_METADATA, **(metadata or {})},
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"rupture type": "rupture extent"},
+                "geometry": {"type": "MultiPolygon", "coordinates": [[polygon]]},
+            }
+        ],
+    }
+
+
+def variant_name(name, dip, zmax):
+    """
+    Base name of the outputs of a trace for one dip and zmax (e.g. kamchatka-trace_dip18_z40.0km).
+    """
+    return f"{name}_dip{float(dip):g}_z{float(zmax)}km"
+
+
+def write_json(data, path, indent=None):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp, path)
+
+
+def write_extrusions(xy, name, dips, zmaxs, transformer, outdir, metadata=None, strikes=None):
+    """
+    Extrude one trace for every (dip, zmax) combination and write the outputs.
+    Args:
+        xy: (n_vertices, 2) array of UTM coordinates (m).
+        name: Base name of the trace.
+        dips, zmaxs: Lists of dips (degrees) and depths (km).
+        transformer: UTM -> WGS84 transformer (always_xy).
+        outdir: Output directory.
+        metadata: Event metadata of the ShakeMap rupture files.
+        strikes: Segment strikes (segment_strikes(xy)), if already computed.
+    Returns:
+        List of dicts (name, dip, zmax, extruded, shakemap) of the written files.
+    """
+    dip, zmax = np.meshgrid(np.asarray(dips, dtype=float), np.asarray(zmaxs, dtype=float), indexing="ij")
+    bottom_xy, bottom_z = extrude_trace(xy, dip, zmax, strikes)
+    top_ll, bottom_ll = to_wgs84(xy, bottom_xy, transformer)
+
+    written = []
+    for i, j in itertools.product(range(dip.shape[0]), range(dip.shape[1])):
+        base = variant_name(name, dip[i, j], zmax[i, j])
+        extruded = os.path.join(outdir, f"{base}_extruded.geojson")
+        shakemap = os.path.join(outdir, f"{base}_shakemap.json")
+        write_json(extruded_geojson(top_ll, bottom_ll[i, j], float(bottom_z[i, j]), base), extruded)
+        write_json(shakemap_rupture(top_ll, bottom_ll[i, j], zmax[i, j], metadata), shakemap, indent=4)
+        written.append(
+            {"name": base, "dip": float(dip[i, j]), "zmax": float(zmax[i, j]), "extruded": extruded, "shakemap": shakemap}
+        )
+    return written
+
+
+def trace_names(file, ntraces):
+    """
+    Base names of the traces of a file: the file name, numbered if it holds several traces.
+    """
+    stem = os.path.splitext(os.path.basename(file))[0]
+    if ntraces == 1:
+        return [stem]
+    return [f"{stem}-{i}" for i in range(ntraces)]
+
+
+def read_metadata(file):
+    """
+    Event metadata from a JSON file: the "metadata" of a rupture file (e.g.
+    rupture_online.json) or a plain dict.
+    """
+    with open(file) as f:
+        data = json.load(f)
+    return data.get("metadata", data)
+
+
+def sweep_values(start, stop, step):
+    """
+    Values from start to stop (inclusive) in steps of step, e.g. a dip or zmax range.
+    """
+    if step <= 0:
+        raise ValueError(f"Step must be positive, got {step}")
+    n = int(math.floor((stop - start) / step + 1e-9)) + 1
+    return [round(start + i * step, 6) for i in range(n)]
+
+
+def _sweep_task(xy, strikes, name, dip, zmaxs, crs, outdir, metadata):
+    return write_extrusions(xy, name, [dip], zmaxs, utm_transformer(crs), outdir, metadata, strikes)
+
+
+def sweep_extrusions(traces, names, dips, zmaxs, crs, outdir, metadata=None, workers=1):
+    """
+    Write the extrusions of several traces for every (dip, zmax) combination.
+    Args:
+        traces: List of (n_vertices, 2) arrays of UTM coordinates (m).
+        names: Base names of the traces.
+        dips, zmaxs: Lists of dips (degrees) and depths (km).
+        crs: UTM CRS of the traces (string or WKT).
+        outdir: Output directory.
+        metadata: Event metadata of the ShakeMap rupture files.
+        workers: Number of worker processes (one task per trace and dip).
+    Returns:
+        strikes: List of the segment strikes of every trace.
+        written: List of dicts (trace, name, dip, zmax, extruded, shakemap),
+            ordered by trace, dip and zmax.
+    """
+    strikes = [segment_strikes(xy) for xy in traces]
+    tasks = [
+        (xy, trace_strikes, name, dip, zmaxs, crs, outdir, metadata)
+        for xy, trace_strikes, name in zip(traces, strikes, names)
+        for dip in dips
+    ]
+
+    if workers <= 1 or len(tasks) == 1:
+        results = [_sweep_task(*task) for task in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_sweep_task, *zip(*tasks)))
+
+    written = []
+    for task, records in zip(tasks, results):
+        written.extend({"trace": task[2], **record} for record in records)
+    return strikes, written
+
+
+def write_manifest(path, trace_file, crs, names, traces, strikes, written):
+    """
+    Write the manifest of the extrusions of a trace file.
+    The manifest lists the UTM CRS, every trace (name, segments, strikes) and
+    every variant (trace, name, dip, zmax and the output files relative to
+    the manifest).
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    manifest = {
+        "trace_file": os.path.abspath(trace_file),
+        "utm_crs": crs,
+        "traces": [
+            {"name": name, "n_segments": len(xy) - 1, "strikes": [round(float(s), 4) for s in trace_strikes]}
+            for name, xy, trace_strikes in zip(names, traces, strikes)
+        ],
+        "variants": [
+            {
+                **record,
+                "extruded": os.path.relpath(record["extruded"], base),
+                "shakemap": os.path.relpath(record["shakemap"], base),
+            }
+            for record in written
+        ],
+    }
+    write_json(manifest, path, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extrude surface fault traces into dipping ShakeMap rupture files."
+    )
+    parser.add_argument("traces", nargs="+", help="trace files (shapefile or any line file GeoPandas reads)")
+    parser.add_argument("-d", "--dip", nargs="+", type=float, default=[], help="dip(s) in degrees")
+    parser.add_argument("-z", "--zmax", nargs="+", type=float, default=[], help="depth(s) of the bottom edge in km")
+    parser.add_argument(
+        "--dip-range",
+        nargs=3,
+        type=float,
+        metavar=("START", "STOP", "STEP"),
+        help="sweep dips from START to STOP (inclusive) in steps of STEP degrees",
+    )
+    parser.add_argument(
+        "--zmax-range",
+        nargs=3,
+        type=float,
+        metavar=("START", "STOP", "STEP"),
+        help="sweep depths from START to STOP (inclusive) in steps of STEP km",
+    )
+    parser.add_argument("-o", "--outdir", help="output directory (default: the directory of each trace file)")
+    parser.add_argument(
+        "-m",
+        "--metadata",
+        help="JSON file with the event metadata of the ShakeMap rupture (e.g. rupture_online.json)",
+    )
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    args = parser.parse_args()
+
+    dips = sorted(set(args.dip + (sweep_values(*args.dip_range) if args.dip_range else [])))
+    zmaxs = sorted(set(args.zmax + (sweep_values(*args.zmax_range) if args.zmax_range else [])))
+    if not dips or not zmaxs:
+        parser.error("Give at least one dip (--dip/--dip-range) and one depth (--zmax/--zmax-range)")
+    if any(not 0 < dip <= 90 for dip in dips):
+        parser.error("Dips must be in (0, 90] degrees")
+
+    metadata = read_metadata(args.metadata) if args.metadata else None
+    for file in args.traces:
+        traces, utm_crs = read_traces(file)
+        crs = utm_crs.to_wkt()
+        names = trace_names(file, len(traces))
+        outdir = args.outdir or os.path.dirname(os.path.abspath(file))
+        os.makedirs(outdir, exist_ok=True)
+        strikes, written = sweep_extrusions(traces, names, dips, zmaxs, crs, outdir, metadata, args.workers)
+        manifest = os.path.join(outdir, f"{os.path.splitext(os.path.basename(file))[0]}_manifest.json")
+        write_manifest(manifest, file, crs, names, traces, strikes, written)
+        for xy, name in zip(traces, names):
+            print(f"{name}: {len(xy) - 1} segments")
+        print(f"{len(written)} ruptures ({len(dips)} dips x {len(zmaxs)} depths) written to {outdir}, manifest {manifest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 #!/bin/bash
 
 # Given a list of eventids's, this script will download the corresponding FSP files 
-# and generate rupture.txt files for each event using the shakemap_polygon.py script.
+# and generate rupture.txt files for each event using the shakemap_polygon_batch.py script.
 
 array=(
     us2000d7q6
@@ -45,6 +45,7 @@ fsp_file='/Users/hyin/soft/shakemap-postprocess-tools/comcat-search/us6000dher/u
 output_dir='/Users/hyin/soft/shakemap-postprocess-tools/comcat-search/us6000dher/'
 
 
+fsp_files=()
 for eventid in "${array[@]}"
 do
 	echo "$eventid"
@@ -52,8 +53,11 @@ do
     getproduct finite-fault "complete_inversion.fsp" -i ${eventid} -o ${eventpath}
     fsp_file="${eventpath}/${eventid}_us_1_complete_inversion.fsp"   # us6000dher_us_1_complete_inversion.fsp
     echo "Generated FSP file: ${fsp_file}"
-    python /Users/hyin/soft/shakemap-postprocess-tools/shakemap_polygon.py ${eventid} ${fsp_file} ${eventpath}
-    echo "Generated rupture.txt file for event ${eventid} at ${eventpath}/rupture.txt" 
+    fsp_files+=("${fsp_file}")
 done
 
-
+# Convert all FSP files in one process pool. Each shakemap_polygon.txt is written
+# next to its FSP file; events whose polygon file is newer than the FSP are skipped.
+python /Users/hyin/soft/shakemap-postprocess-tools/shakemap_polygon_batch.py "${fsp_files[@]}" \
+    --summary ${catalogdir}/fsp_polygon_summary.csv
+echo "Wrote summary of segment counts and trimmed dimensions to ${catalogdir}/fsp_polygon_summary.csv"
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+
+# Compare N ShakeMap grids of one event (point source, NP1, NP2, slab2,
+# reproduction) for one IMT.
+#
+# The calcDiff notebooks load every grid.xml in full with ShakeGrid, cut them
+# to a common region and interpolate each grid in memory. Here only the
+# requested IMT layer is read, memory-mapped from the binary cache of each
+# grid.xml (built on first use, see shakemap_utils/gridxml.py). The grids are
+# aligned once onto a shared geodict (the extent common to all grids, on the
+# lattice of the first grid) and the statistics are accumulated over chunks of
+# rows of that geodict, so memory holds one chunk of every grid at a time.
+#
+# As in the notebooks, cells where both grids of a pair are below --threshold
+# are left out of the difference statistics. Differences are grid i - grid j,
+# and all means are weighted by the cell area (R^2 dlat dlon cos(lat)).
+#
+# Example usage:
+# python /Users/hyin/soft/shakemap-postprocess-tools/compare_shakemaps/compare_shakemaps.py --eventpath /Users/hyin/shakemap_profiles/default/data/us60007idc --imt mmi --output /Users/hyin/shakemap_profiles/default/data/us60007idc/comparison
+# python /Users/hyin/soft/shakemap-postprocess-tools/compare_shakemaps/compare_shakemaps.py ps/products/grid.xml np2/products/grid.xml --labels Unconstrained np2 --imt mmi
+
+import argparse
+import itertools
+import json
+import math
+import os
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+
+SOFTPATH = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(SOFTPATH / "shakemap_utils"))
+from exposure import MMI_BIN_EDGES, exposure_from_sums, row_areas, slot_sums
+from gridxml import CHUNK_ROWS, load_imt
+
+# Variant directories (relative to the event path) compared by --eventpath, in order
+VARIANTS = ["ffsimmer_pointsource", "np1", "np2", "slab2", "shakemap_reproduction"]
+THRESHOLD = 1.0
+MMI_LEVELS = [4, 5, 6, 7, 8, 9]
+
+
+def shared_geodict(geodicts):
+    """
+    Extent common to all grids, on the lattice (origin and spacing) of the first grid.
+    Args:
+        geodicts: List of geodicts (see gridxml.read_grid_header).
+    Returns:
+        The shared geodict.
+    """
+    ref = geodicts[0]
+    dx, dy = ref["dx"], ref["dy"]
+    xmin = max(gd["xmin"] for gd in geodicts)
+    xmax = min(gd["xmax"] for gd in geodicts)
+    ymin = max(gd["ymin"] for gd in geodicts)
+    ymax = min(gd["ymax"] for gd in geodicts)
+
+    # Snap inwards onto the lattice of the first grid
+    eps = 1e-6
+    xmin = ref["xmin"] + math.ceil((xmin - ref["xmin"]) / dx - eps) * dx
+    xmax = ref["xmin"] + math.floor((xmax - ref["xmin"]) / dx + eps) * dx
+    ymin = ref["ymax"] - math.floor((ref["ymax"] - ymin) / dy + eps) * dy
+    ymax = ref["ymax"] - math.ceil((ref["ymax"] - ymax) / dy - eps) * dy
+    if xmax < xmin or ymax < ymin:
+        raise ValueError("The grids do not overlap")
+
+    return {
+        "xmin": xmin,
+        "xmax": xmax,
+        "ymin": ymin,
+        "ymax": ymax,
+        "dx": dx,
+        "dy": dy,
+        "nx": int(round((xmax - xmin) / dx)) + 1,
+        "ny": int(round((ymax - ymin) / dy)) + 1,
+    }
+
+
+def grid_coords(geodict, rows=None):
+    """
+    Longitudes of the columns and latitudes of the rows (row 0 at ymax) of a geodict.
+    """
+    if rows is None:
+        rows = slice(0, geodict["ny"])
+    lons = geodict["xmin"] + np.arange(geodict["nx"]) * geodict["dx"]
+    lats = geodict["ymax"] - np.arange(rows.start, rows.stop) * geodict["dy"]
+    return lons, lats
+
+
+def align_rows(layer, geodict, target, rows):
+    """
+    Bilinear interpolation of a layer onto a chunk of rows of another geodict.
+    Args:
+        layer: 2D array on geodict (row 0 at ymax).
+        geodict: Geodict of the layer.
+        target: Geodict to interpolate onto (inside the extent of geodict).
+        rows: Slice of target rows.
+    Returns:
+        float32 array of shape (len(rows), target nx).
+    """
+    lons, lats = grid_coords(target, rows)
+    col = np.clip((lons - geodict["xmin"]) / geodict["dx"], 0, geodict["nx"] - 1)
+    row = np.clip((geodict["ymax"] - lats) / geodict["dy"], 0, geodict["ny"] - 1)
+    c0 = np.minimum(np.floor(col).astype(int), geodict["nx"] - 2 if geodict["nx"] > 1 else 0)
+    r0 = np.minimum(np.floor(row).astype(int), geodict["ny"] - 2 if geodict["ny"] > 1 else 0)
+    c1 = np.minimum(c0 + 1, geodict["nx"] - 1)
+    r1 = np.minimum(r0 + 1, geodict["ny"] - 1)
+    fc = (col - c0).astype(np.float32)[None, :]
+    fr = (row - r0).astype(np.float32)[:, None]
+
+    top = layer[r0][:, c0] * (1 - fc) + layer[r0][:, c1] * fc
+    bottom = layer[r1][:, c0] * (1 - fc) + layer[r1][:, c1] * fc
+    return (top * (1 - fr) + bottom * fr).astype(np.float32)
+
+
+def compare_grids(
+    grid_files,
+    imt="mmi",
+    threshold=THRESHOLD,
+    levels=MMI_LEVELS,
+    chunk_rows=CHUNK_ROWS,
+    aligned_file=None,
+    bin_edges=MMI_BIN_EDGES,
+):
+    """
+    Pairwise difference and exceedance statistics of N grids for one IMT.
+    Args:
+        grid_files: List of grid.xml paths.
+        imt: IMT to compare.
+        threshold: Cells where both grids of a pair are below this value are
+            left out of the difference statistics.
+        levels: IMT levels of the exceedance statistics.
+        chunk_rows: Number of rows read and compared at a time.
+        aligned_file: If given, the aligned grids are written to this .npy file
+            (shape (N, ny, nx), float32) with the shared geodict in a .json
+            file next to it.
+        bin_edges: Bin edges of the binned area of every grid (see exposure.py),
+            in units of the IMT. None to skip the binned area.
+    Returns:
+        target: The shared geodict.
+        pairs: List of dicts with the difference statistics of every pair i < j.
+        exceedance: List of dicts with the area at or above every level, for
+            every grid and every pair.
+        binned: Binned and exceedance area of every grid on the shared
+            geodict (see exposure.exposure_from_sums), or None without bin_edges.
+    """
+    layers, geodicts = zip(*(load_imt(f, imt, chunk_rows=chunk_rows) for f in grid_files))
+    target = shared_geodict(geodicts)
+    n = len(grid_files)
+    pair_i, pair_j = (np.array(idx, dtype=int) for idx in zip(*itertools.combinations(range(n), 2)))
+    levels = np.asarray(levels, dtype=float)
+
+    aligned = None
+    if aligned_file is not None:
+        aligned = np.lib.format.open_memmap(aligned_file, mode="w+", dtype=np.float32, shape=(n, target["ny"], target["nx"]))
+
+    npairs = len(pair_i)
+    count = np.zeros(npairs, dtype=np.int64)
+    weight = np.zeros(npairs)
+    sum_diff = np.zeros(npairs)
+    sum_abs = np.zeros(npairs)
+    sum_sq = np.zeros(npairs)
+    max_abs = np.full(npairs, np.nan)
+    area_grid = np.zeros((n, len(levels)))
+    area_both = np.zeros((npairs, len(levels)))
+    bin_sums = 0
+
+    for start in range(0, target["ny"], chunk_rows):
+        rows = slice(start, min(start + chunk_rows, target["ny"]))
+        stack = np.stack([align_rows(layer, gd, target, rows) for layer, gd in zip(layers, geodicts)])
+        if aligned is not None:
+            aligned[:, rows] = stack
+        area = row_areas(target, rows)
+        if bin_edges is not None:
+            bin_sums = bin_sums + slot_sums(stack, area, bin_edges)
+
+        a, b = stack[pair_i], stack[pair_j]
+        valid = np.isfinite(a) & np.isfinite(b) & ~((a < threshold) & (b < threshold))
+        diff = np.where(valid, a - b, 0.0)
+        w = valid * area
+        count += valid.sum(axis=(1, 2))
+        weight += w.sum(axis=(1, 2))
+        sum_diff += (w * diff).sum(axis=(1, 2))
+        sum_abs += (w * np.abs(diff)).sum(axis=(1, 2))
+        sum_sq += (w * diff**2).sum(axis=(1, 2))
+        chunk_max = np.abs(diff).max(axis=(1, 2), initial=0.0)
+        max_abs = np.where(valid.any(axis=(1, 2)), np.fmax(max_abs, chunk_max), max_abs)
+
+        exceed = stack[:, None] >= levels[None, :, None, None]
+        area_grid += np.einsum("glrc,rc->gl", exceed, np.broadcast_to(area, stack.shape[1:]))
+        both = exceed[pair_i] & exceed[pair_j]
+        area_both += np.einsum("plrc,rc->pl", both, np.broadcast_to(area, stack.shape[1:]))
+
+    if aligned is not None:
+        aligned.flush()
+        del aligned
+        with open(os.path.splitext(aligned_file)[0] + ".json", "w") as f:
+            json.dump({"imt": imt, "grids": [str(g) for g in grid_files], "geodict": target}, f, indent=2)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_diff = sum_diff / weight
+        mean_abs = sum_abs / weight
+        rms = np.sqrt(sum_sq / weight)
+    pairs = [
+        {
+            "i": int(i),
+            "j": int(j),
+            "n_cells": int(count[k]),
+            "area_km2": weight[k],
+            "mean_diff": mean_diff[k],
+            "mean_abs_diff": mean_abs[k],
+            "rms_diff": rms[k],
+            "max_abs_diff": max_abs[k],
+        }
+        for k, (i, j) in enumerate(zip(pair_i, pair_j))
+    ]
+
+    exceedance = []
+    for k, (i, j) in enumerate(zip(pair_i, pair_j)):
+        for m, level in enumerate(levels):
+            either = area_grid[i, m] + area_grid[j, m] - area_both[k, m]
+            exceedance.append(
+                {
+                    "i": int(i),
+                    "j": int(j),
+                    "level": level,
+                    "area_i_km2": area_grid[i, m],
+                    "area_j_km2": area_grid[j, m],
+                    "area_both_km2": area_both[k, m],
+                    "area_either_km2": either,
+                    "area_ratio": area_grid[i, m] / area_grid[j, m] if area_grid[j, m] else np.nan,
+                    "jaccard": area_both[k, m] / either if either else np.nan,
+                }
+            )
+    binned = exposure_from_sums(bin_sums, bin_edges) if bin_edges is not None else None
+    return target, pairs, exceedance, binned
+
+
+def grid_label(grid_file):
+    """
+    Default label of a grid: the variant directory of .../VARIANT/products/grid.xml.
+    """
+    path = pathlib.Path(grid_file).resolve()
+    if path.parent.name == "products":
+        return path.parent.parent.name
+    return path.stem
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pairwise difference and exceedance statistics of ShakeMap grids for one IMT."
+    )
+    parser.add_argument("grids", nargs="*", help="grid.xml files to compare")
+    parser.add_argument(
+        "-e",
+        "--eventpath",
+        help=f"compare the grids of the variants of an event ({', '.join(VARIANTS)}) that exist",
+    )
+    parser.add_argument("-l", "--labels", nargs="+", help="labels of the grids (default: variant directory names)")
+    parser.add_argument("-i", "--imt", default="mmi", help="IMT to compare (default: mmi)")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help=f"leave out cells where both grids are below this value (default: {THRESHOLD})",
+    )
+    parser.add_argument(
+        "--levels",
+        nargs="+",
+        type=float,
+        default=MMI_LEVELS,
+        help=f"levels of the exceedance statistics (default: {' '.join(map(str, MMI_LEVELS))})",
+    )
+    parser.add_argument(
+        "--bin-edges",
+        nargs="+",
+        type=float,
+        default=None,
+        help="bin edges of the binned area, in units of the IMT "
+        "(default: 1 2 ... 10 for mmi, no binned area for other IMTs)",
+    )
+    parser.add_argument("-o", "--output", default=".", help="output directory (default: .)")
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=CHUNK_ROWS,
+        help=f"grid rows read and compared at a time (default: {CHUNK_ROWS})",
+    )
+    parser.add_argument(
+        "--save-aligned",
+        action="store_true",
+        help="also write the grids aligned on the shared geodict (aligned_IMT.npy/.json)",
+    )
+    args = parser.parse_args()
+
+    grid_files = list(args.grids)
+    if args.eventpath:
+        for variant in VARIANTS:
+            grid_file = os.path.join(args.eventpath, variant, "products", "grid.xml")
+            if os.path.exists(grid_file):
+                grid_files.append(grid_file)
+    if len(grid_files) < 2:
+        parser.error("At least two grids are needed")
+    labels = args.labels or [grid_label(f) for f in grid_files]
+    if len(labels) != len(grid_files):
+        parser.error(f"{len(labels)} labels given for {len(grid_files)} grids")
+
+    os.makedirs(args.output, exist_ok=True)
+    imt = args.imt.lower()
+    aligned_file = os.path.join(args.output, f"aligned_{imt}.npy") if args.save_aligned else None
+    bin_edges = args.bin_edges
+    if bin_edges is None and imt == "mmi":
+        bin_edges = MMI_BIN_EDGES
+    target, pairs, exceedance, binned = compare_grids(
+        grid_files, imt, args.threshold, args.levels, args.chunk_rows, aligned_file, bin_edges
+    )
+    print(
+        f"Shared grid: {target['nx']} x {target['ny']} cells, "
+        f"lon {target['xmin']:.4f}/{target['xmax']:.4f}, lat {target['ymin']:.4f}/{target['ymax']:.4f}"
+    )
+
+    pairs = pd.DataFrame(pairs)
+    exceedance = pd.DataFrame(exceedance)
+    for df in (pairs, exceedance):
+        df.insert(2, "label_i", [labels[i] for i in df["i"]])
+        df.insert(3, "label_j", [labels[j] for j in df["j"]])
+
+    if binned is not None:
+        edges = binned["bin_edges"]
+        binned = pd.DataFrame(
+            [
+                {
+                    "grid": g,
+                    "label": label,
+                    "bin_min": edges[k],
+                    "bin_max": edges[k + 1],
+                    "area_km2": binned["binned_area"][g, k],
+                    "area_fraction": binned["binned_fraction"][g, k],
+                    "exceedance_area_km2": binned["exceedance_area"][g, k],
+                    "exceedance_fraction": binned["exceedance_fraction"][g, k],
+                }
+                for g, label in enumerate(labels)
+                for k in range(len(edges) - 1)
+            ]
+        )
+
+    pairs_file = os.path.join(args.output, f"pairwise_{imt}.csv")
+    exceedance_file = os.path.join(args.output, f"exceedance_{imt}.csv")
+    pairs.to_csv(pairs_file, index=False)
+    exceedance.to_csv(exceedance_file, index=False)
+    saved = [pairs_file, exceedance_file]
+    if binned is not None:
+        binned_file = os.path.join(args.output, f"binned_area_{imt}.csv")
+        binned.to_csv(binned_file, index=False)
+        saved.append(binned_file)
+    print(pairs[["label_i", "label_j", "n_cells", "mean_diff", "rms_diff", "max_abs_diff"]].to_string(index=False))
+    print(f"Saved to: {', '.join(saved)}")
+
+
+if __name__ == "__main__":
+    main()
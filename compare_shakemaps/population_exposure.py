@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+# Population per MMI bin of the ShakeMap variants of one event, and the
+# pairwise changes between variants (PAGER-style exposure).
+#
+# The population raster (counts per pixel, e.g. LandScan or GPW counts) is
+# regridded once onto the shared geodict of the variants: every population
+# pixel is added to the ShakeMap cell nearest to its center. The result is
+# stored under POPULATION_CACHE_DIR, keyed on the raster and the geodict, so
+# later runs over the same region skip the raster entirely. Scoring a variant
+# is then one population-weighted histogram of its aligned grid
+# (exposure.slot_sums), however many variants are compared.
+#
+# The grids are either the aligned stack written by
+# compare_shakemaps.py --save-aligned, or grid.xml files / an event path that
+# are aligned here as in compare_shakemaps.py. Deltas are grid i - grid j.
+#
+# Example usage:
+# python /Users/hyin/soft/shakemap-postprocess-tools/compare_shakemaps/population_exposure.py --eventpath /Users/hyin/shakemap_profiles/default/data/us60007idc --population /path/to/landscan-global-2023.tif --output /Users/hyin/shakemap_profiles/default/data/us60007idc/comparison
+# python /Users/hyin/soft/shakemap-postprocess-tools/compare_shakemaps/population_exposure.py --aligned comparison/aligned_mmi.npy --population /path/to/landscan-global-2023.tif
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+
+from compare_shakemaps import VARIANTS, align_rows, grid_label, shared_geodict
+
+SOFTPATH = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(SOFTPATH / "shakemap_utils"))
+from exposure import MMI_BIN_EDGES, exposure_from_sums, slot_sums
+from gridxml import CHUNK_ROWS, load_imt
+
+POPULATION_CACHE_DIR = pathlib.Path(
+    os.environ.get(
+        "POPULATION_CACHE_DIR",
+        pathlib.Path.home() / ".cache" / "shakemap-postprocess-tools" / "population",
+    )
+)
+
+
+def regrid_population(raster, geodict):
+    """
+    Sum the pixels of a population raster onto the cells of a geodict.
+    Args:
+        raster: Path to the population count raster (any grid GMT can read).
+        geodict: Target geodict (row 0 at ymax).
+    Returns:
+        float64 array of shape (ny, nx) with the population of every cell.
+    """
+    import pygmt
+
+    # Pixels whose center is nearest to a cell of the geodict
+    region = [
+        geodict["xmin"] - geodict["dx"] / 2,
+        geodict["xmax"] + geodict["dx"] / 2,
+        geodict["ymin"] - geodict["dy"] / 2,
+        geodict["ymax"] + geodict["dy"] / 2,
+    ]
+    da = pygmt.grdcut(grid=raster, region=region)
+    ydim, xdim = da.dims[-2:]
+    lons = da[xdim].values
+    lats = da[ydim].values
+    pop = np.nan_to_num(np.asarray(da.values, dtype=float), nan=0.0)
+    pop[pop < 0] = 0.0  # nodata values stored as negative counts
+
+    col = np.rint((lons - geodict["xmin"]) / geodict["dx"]).astype(int)
+    row = np.rint((geodict["ymax"] - lats) / geodict["dy"]).astype(int)
+    inside = (row[:, None] >= 0) & (row[:, None] < geodict["ny"]) & (col[None, :] >= 0) & (col[None, :] < geodict["nx"])
+    cell = row[:, None] * geodict["nx"] + col[None, :]
+    weights = np.bincount(cell[inside], pop[inside], minlength=geodict["ny"] * geodict["nx"])
+    return weights.reshape(geodict["ny"], geodict["nx"])
+
+
+def population_weights(raster, geodict, cache_dir=POPULATION_CACHE_DIR):
+    """
+    Population of every cell of a geodict, from the cache if possible.
+    Args:
+        raster: Path to the population count raster.
+        geodict: Target geodict (row 0 at ymax).
+        cache_dir: Cache directory of the regridded populations.
+    Returns:
+        float64 array of shape (ny, nx).
+    """
+    st = os.stat(raster)
+    ident = json.dumps([os.path.abspath(raster), st.st_size, st.st_mtime_ns, geodict], sort_keys=True)
+    cache_file = pathlib.Path(cache_dir) / f"{hashlib.sha1(ident.encode()).hexdigest()}.npy"
+    try:
+        return np.load(cache_file)
+    except (OSError, ValueError):
+        pass
+
+    weights = regrid_population(raster, geodict)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_name(f"{cache_file.stem}.{os.getpid()}.tmp.npy")
+        np.save(tmp, weights)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        print(f"WARNING: Could not cache the regridded population in {cache_file}: {e}")
+    return weights
+
+
+def population_exposure(chunks, weights, bin_edges=MMI_BIN_EDGES):
+    """
+    Population per bin of many aligned grids.
+    Args:
+        chunks: Iterable of (rows, values) with a slice of rows of the geodict
+            and the grids on those rows, shape (n_grids, n_rows, nx).
+        weights: Population of every cell (population_weights).
+        bin_edges: Increasing bin edges (default: MMI 1 to 10).
+    Returns:
+        Dict of arrays (see exposure.exposure_from_sums), with the areas
+        being populations.
+    """
+    sums = 0
+    for rows, values in chunks:
+        sums = sums + slot_sums(values, weights[rows], bin_edges)
+    return exposure_from_sums(sums, bin_edges)
+
+
+def exposure_deltas(stats, labels):
+    """
+    Pairwise population changes between grids.
+    Args:
+        stats: Result of population_exposure.
+        labels: Labels of the grids.
+    Returns:
+        DataFrame with one row per pair i < j and bin: the population of the
+        bin and at or above its lower edge for both grids, and their deltas (i - j).
+    """
+    edges = stats["bin_edges"]
+    binned = stats["binned_area"]
+    exceed = stats["exceedance_area"]
+    rows = []
+    for i, j in itertools.combinations(range(len(labels)), 2):
+        for k in range(len(edges) - 1):
+            rows.append(
+                {
+                    "i": i,
+                    "j": j,
+                    "label_i": labels[i],
+                    "label_j": labels[j],
+                    "bin_min": edges[k],
+                    "bin_max": edges[k + 1],
+                    "population_i": binned[i, k],
+                    "population_j": binned[j, k],
+                    "delta_population": binned[i, k] - binned[j, k],
+                    "exceedance_i": exceed[i, k],
+                    "exceedance_j": exceed[j, k],
+                    "delta_exceedance": exceed[i, k] - exceed[j, k],
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def aligned_chunks(grid_files, imt, chunk_rows=CHUNK_ROWS):
+    """
+    Align grid.xml files onto their shared geodict, in chunks of rows.
+    Returns:
+        target: The shared geodict.
+        chunks: Generator of (rows, values) for population_exposure.
+    """
+    layers, geodicts = zip(*(load_imt(f, imt, chunk_rows=chunk_rows) for f in grid_files))
+    target = shared_geodict(geodicts)
+
+    def chunks():
+        for start in range(0, target["ny"], chunk_rows):
+            rows = slice(start, min(start + chunk_rows, target["ny"]))
+            yield rows, np.stack([align_rows(layer, gd, target, rows) for layer, gd in zip(layers, geodicts)])
+
+    return target, chunks()
+
+
+def stack_chunks(aligned_file, chunk_rows=CHUNK_ROWS):
+    """
+    Chunks of rows of the aligned stack written by compare_shakemaps.py --save-aligned.
+    Returns:
+        meta: Contents of the .json next to the stack (imt, grids, geodict).
+        chunks: Generator of (rows, values) for population_exposure.
+    """
+    with open(os.path.splitext(aligned_file)[0] + ".json") as f:
+        meta = json.load(f)
+    stack = np.load(aligned_file, mmap_mode="r")
+    ny = meta["geodict"]["ny"]
+    chunks = ((rows, stack[:, rows]) for rows in (slice(i, min(i + chunk_rows, ny)) for i in range(0, ny, chunk_rows)))
+    return meta, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Population per MMI bin of ShakeMap variants and the pairwise changes."
+    )
+    parser.add_argument("grids", nargs="*", help="grid.xml files to compare")
+    parser.add_argument(
+        "-e",
+        "--eventpath",
+        help=f"compare the grids of the variants of an event ({', '.join(VARIANTS)}) that exist",
+    )
+    parser.add_argument("-a", "--aligned", help="aligned stack from compare_shakemaps.py --save-aligned")
+    parser.add_argument("-p", "--population", required=True, help="population count raster")
+    parser.add_argument("-l", "--labels", nargs="+", help="labels of the grids (default: variant directory names)")
+    parser.add_argument("-i", "--imt", default="mmi", help="IMT of the bins (default: mmi)")
+    parser.add_argument(
+        "--bin-edges",
+        nargs="+",
+        type=float,
+        default=MMI_BIN_EDGES,
+        help="bin edges (default: 1 2 ... 10)",
+    )
+    parser.add_argument("-o", "--output", default=".", help="output directory (default: .)")
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=CHUNK_ROWS,
+        help=f"grid rows processed at a time (default: {CHUNK_ROWS})",
+    )
+    args = parser.parse_args()
+
+    if args.aligned:
+        meta, chunks = stack_chunks(args.aligned, args.chunk_rows)
+        grid_files, target, imt = meta["grids"], meta["geodict"], meta["imt"]
+    else:
+        grid_files = list(args.grids)
+        if args.eventpath:
+            for variant in VARIANTS:
+                grid_file = os.path.join(args.eventpath, variant, "products", "grid.xml")
+                if os.path.exists(grid_file):
+                    grid_files.append(grid_file)
+        if not grid_files:
+            parser.error("No grids given")
+        imt = args.imt.lower()
+        target, chunks = aligned_chunks(grid_files, imt, args.chunk_rows)
+    labels = args.labels or [grid_label(f) for f in grid_files]
+    if len(labels) != len(grid_files):
+        parser.error(f"{len(labels)} labels given for {len(grid_files)} grids")
+
+    weights = population_weights(args.population, target)
+    stats = population_exposure(chunks, weights, args.bin_edges)
+
+    edges = stats["bin_edges"]
+    per_grid = pd.DataFrame(
+        [
+            {
+                "grid": g,
+                "label": label,
+                "bin_min": edges[k],
+                "bin_max": edges[k + 1],
+                "population": stats["binned_area"][g, k],
+                "population_fraction": stats["binned_fraction"][g, k],
+                "exceedance_population": stats["exceedance_area"][g, k],
+            }
+            for g, label in enumerate(labels)
+            for k in range(len(edges) - 1)
+        ]
+    )
+    deltas = exposure_deltas(stats, labels)
+
+    os.makedirs(args.output, exist_ok=True)
+    population_file = os.path.join(args.output, f"population_{imt}.csv")
+    delta_file = os.path.join(args.output, f"population_delta_{imt}.csv")
+    per_grid.to_csv(population_file, index=False)
+    deltas.to_csv(delta_file, index=False)
+    print(f"Population on the shared grid: {weights.sum():.0f}")
+    print(per_grid.pivot(index=["bin_min", "bin_max"], columns="label", values="population").round().to_string())
+    print(f"Saved to: {population_file}, {delta_file}")
+
+
+if __name__ == "__main__":
+    main()
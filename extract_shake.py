@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import argparse
+import concurrent.futures
 import json
 import pathlib
 import shutil
@@ -18,16 +19,200 @@ def get_data_path():
     return pathlib.Path(config["profiles"][config["profile"]]["data_path"])
 
 
-def get_station_data(stationfile):
-    sdict = {}
+STREAM_CHUNK = 1 << 20  # characters read at a time from the station list
+# Characters that can continue a JSON number
+NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+
+def iter_station_list(stationfile, chunk_size=STREAM_CHUNK):
+    """
+    Read a ShakeMap stationlist.json incrementally.
+    The top-level object is decoded one member at a time, and the members of
+    the "features" array one feature at a time, so only a single feature (plus
+    a read buffer) is held in memory.
+    Args:
+        stationfile: Path to the stationlist.json file.
+        chunk_size: Number of characters read at a time.
+    Yields:
+        ("member", key, value) for every top-level member other than "features",
+        ("features", "features", None) where the features array starts and
+        ("feature", index, feature) for every feature, in file order.
+    """
+    decoder = json.JSONDecoder()
     with open(stationfile, "rt") as fobj:
-        jdict = json.load(fobj)
-        sdict["type"] = jdict["type"]
-        sdict["references"] = jdict["references"]
-        sdict["features"] = []
-        for feature in jdict["features"]:
-            if feature["properties"]["station_type"] == "seismic":
-                sdict["features"].append(feature)
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = fobj.read(chunk_size)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def skip(chars):
+            # Skip whitespace and the given separators, return the next character
+            nonlocal pos
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or buf[pos] in chars):
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return buf[pos] if pos < len(buf) else ""
+                fill()
+
+        def decode():
+            # Decode the next value, reading more input until it is complete
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    # A number split across chunks decodes as its first part ("-1." -> -1),
+                    # so it is only complete once a character that cannot continue it follows
+                    number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                    if not number or (end < len(buf) and buf[end] not in NUMBER_CHARS):
+                        pos = end
+                        return value
+                    if eof:
+                        if end < len(buf):
+                            raise json.JSONDecodeError("Invalid number", buf, end)
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        if skip("") != "{":
+            raise ValueError(f"{stationfile} is not a JSON object")
+        pos += 1
+        while skip(",") != "}":
+            key = decode()
+            skip(":")
+            if key != "features":
+                yield "member", key, decode()
+                continue
+            if skip("") != "[":
+                raise ValueError(f"features in {stationfile} is not a list")
+            pos += 1
+            yield "features", key, None
+            index = 0
+            while skip(",") != "]":
+                yield "feature", index, decode()
+                index += 1
+            pos += 1
+
+
+def station_type_is(*station_types):
+    """
+    Predicate: keep features whose station_type is one of station_types (e.g. "seismic").
+    """
+    return lambda feature: feature["properties"].get("station_type") in station_types
+
+
+def network_in(*networks):
+    """
+    Predicate: keep features from the given networks (e.g. "CI", "NC").
+    """
+    return lambda feature: feature["properties"].get("network") in networks
+
+
+def within_distance(max_distance, metric="repi"):
+    """
+    Predicate: keep features within max_distance km of the event.
+    Uses properties["distances"][metric] ("repi", "rhypo", "rrup", "rjb"),
+    falling back to properties["distance"]. Features without a distance are dropped.
+    """
+
+    def predicate(feature):
+        props = feature["properties"]
+        distance = (props.get("distances") or {}).get(metric, props.get("distance"))
+        try:
+            return float(distance) <= max_distance
+        except (TypeError, ValueError):
+            return False
+
+    return predicate
+
+
+def station_imts(feature):
+    """
+    Names of the IMTs with a value at a station (lower case, e.g. "pga", "sa(1.0)",
+    "mmi" for the station intensity).
+    """
+    props = feature["properties"]
+    imts = set()
+    for channel in props.get("channels") or []:
+        for amp in channel.get("amplitudes") or []:
+            if amp.get("value") not in (None, "null"):
+                imts.add(amp["name"].lower())
+    if props.get("intensity") not in (None, "null"):
+        imts.add("mmi")
+    return imts
+
+
+def has_imt(*imts):
+    """
+    Predicate: keep features with a value for at least one of the IMTs.
+    """
+    wanted = {imt.lower() for imt in imts}
+    return lambda feature: not wanted.isdisjoint(station_imts(feature))
+
+
+def filter_station_data(stationfile, outfile, predicates):
+    """
+    Stream a stationlist.json and write the features that pass all predicates.
+    Kept features are written to outfile as they are read, so memory use does
+    not grow with the size of the station list.
+    Args:
+        stationfile: Path to the input stationlist.json.
+        outfile: Path to the filtered output file.
+        predicates: List of functions feature -> bool (e.g. station_type_is("seismic")).
+    Returns:
+        (number of features kept, number of features read)
+    """
+    n_kept = 0
+    n_read = 0
+    with open(outfile, "wt") as fobj:
+        fobj.write("{")
+        sep = ""
+        in_features = False
+        for kind, key, value in iter_station_list(stationfile):
+            if kind == "member":
+                if in_features:
+                    fobj.write("]")
+                    in_features = False
+                fobj.write(f"{sep}{json.dumps(key)}: {json.dumps(value)}")
+                sep = ", "
+            elif kind == "features":
+                fobj.write(f'{sep}"features": [')
+                sep = ", "
+                in_features = True
+            else:
+                n_read += 1
+                if all(predicate(value) for predicate in predicates):
+                    fobj.write(", " if n_kept else "")
+                    json.dump(value, fobj)
+                    n_kept += 1
+        if in_features:
+            fobj.write("]")
+        fobj.write("}")
+    return n_kept, n_read
+
+
+def get_station_data(stationfile, predicates=None):
+    """
+    Station list with only the features that pass all predicates (default: seismic stations).
+    """
+    if predicates is None:
+        predicates = [station_type_is("seismic")]
+    sdict = {"features": []}
+    for kind, key, value in iter_station_list(stationfile):
+        if kind == "member":
+            sdict[key] = value
+        elif kind == "feature" and all(predicate(value) for predicate in predicates):
+            sdict["features"].append(value)
     return sdict
 
 
@@ -73,68 +258,243 @@ def get_info_event(info_file):
     return event
 
 
+def index_folder(folder):
+    """
+    Index a getproduct download folder by event, version and product type.
+    File names look like EVENTID_SOURCE_VERSION_TYPE.json (e.g.
+    us6000jllz_us_2_stationlist.json). Files that do not follow this pattern
+    are skipped.
+    Args:
+        folder: Directory where getproduct output was downloaded.
+    Returns:
+        Dict of (eventid, version) -> {product type: [files]}.
+    """
+    index = {}
+    for file in pathlib.Path(folder).glob("*.json"):
+        parts = file.with_suffix("").name.split("_")
+        if len(parts) < 4 or not parts[2].isdigit():
+            continue
+        key = (parts[0], int(parts[2]))
+        index.setdefault(key, {}).setdefault(parts[3], []).append(file)
+    return index
+
+
+def select_versions(index, eventid="all", versions=None):
+    """
+    Select the products of one event (or all) and some versions from an index.
+    With a single eventid only the files of that event are kept. If none of
+    the files carry that id (e.g. the download used an alias id), every file
+    in the folder is taken to belong to it, as before.
+    Args:
+        index: Result of index_folder.
+        eventid: Event id to select, or "all".
+        versions: Versions to keep (None for all).
+    Returns:
+        Dict of (eventid, version) -> {product type: [files]}.
+    """
+    if eventid != "all" and any(key[0] == eventid for key in index):
+        index = {key: files for key, files in index.items() if key[0] == eventid}
+    selected = {}
+    for (key_eventid, version), files in index.items():
+        if eventid != "all":
+            key_eventid = eventid
+        if versions is None or version in versions:
+            for ftype, ffiles in files.items():
+                selected.setdefault((key_eventid, version), {}).setdefault(ftype, []).extend(ffiles)
+    return selected
+
+
+def link_or_copy(src, dst):
+    """
+    Place src at dst as a hardlink, falling back to a reflink (copy-on-write
+    clone, Linux only) and then to a regular copy when the filesystem does not
+    support it (e.g. across devices).
+    """
+    src = pathlib.Path(src)
+    dst = pathlib.Path(dst)
+    if dst.is_dir():
+        dst = dst / src.name
+    if dst.exists() or dst.is_symlink():
+        if dst.exists() and os.path.samefile(src, dst):
+            return dst
+        dst.unlink()
+    try:
+        os.link(src, dst)
+        return dst
+    except OSError:
+        pass
+    try:
+        import fcntl
+
+        FICLONE = 0x40049409
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return dst
+    except (ImportError, OSError):
+        pass
+    shutil.copy2(src, dst)
+    return dst
+
+
+def station_predicates(no_dyfi=False, networks=None, max_distance=None, distance_metric="repi", imts=None):
+    """
+    Station list predicates for the command line filter options.
+    """
+    predicates = []
+    if no_dyfi:
+        predicates.append(station_type_is("seismic"))
+    if networks is not None:
+        predicates.append(network_in(*networks))
+    if max_distance is not None:
+        predicates.append(within_distance(max_distance, distance_metric))
+    if imts is not None:
+        predicates.append(has_imt(*imts))
+    return predicates
+
+
+def extract_version(files, event_path, filters):
+    """
+    Extract the products of one event version into a ShakeMap event directory.
+    Args:
+        files: Dict of product type -> [files] for the version (see index_folder).
+        event_path: ShakeMap event directory to write to.
+        filters: Keyword arguments for station_predicates. Passed as plain values
+            (not predicates) so the function can run in a worker process.
+    Returns:
+        event_path
+    """
+    predicates = station_predicates(**filters)
+    event_path = pathlib.Path(event_path)
+    if not event_path.exists():
+        event_path.mkdir(parents=True)
+    for ftype, ffiles in files.items():
+        for file in ffiles:
+            if ftype == "stationlist":
+                print("Working on stationlist.json ...")
+                if predicates:
+                    if filters.get("no_dyfi"):
+                        print(f"DYFI data is being discarded...")
+                    file_name, file_extension = os.path.splitext(file.name)
+                    suffix = "_no-dyfi" if len(predicates) == 1 and filters.get("no_dyfi") else "_filtered"
+                    outfile = f"{event_path}/{file_name}{suffix}{file_extension}"
+                    print(f"Writing {outfile}...")
+                    n_kept, n_read = filter_station_data(file, outfile, predicates)
+                    print(f"Kept {n_kept} of {n_read} stations.")
+                    if os.path.isfile(f"{event_path}/instrumented_dat.json"):
+                        os.remove(f"{event_path}/instrumented_dat.json")
+                    os.symlink(outfile, f"{event_path}/instrumented_dat.json")
+                else:
+                    print(f"Writing {file.name} to {event_path}")
+                    link_or_copy(file, event_path)
+
+            elif ftype == "info":
+                print("Working on event.xml...")
+                event_data = get_info_event(file)
+                outfile = event_path / "event.xml"
+                print(f"Writing {outfile}...")
+                # print(str(event_data))
+                write_event_file(event_data, outfile)
+            elif ftype == "rupture":
+                print(f"Writing {file.name} to {event_path}")
+                link_or_copy(file, event_path)
+                if os.path.isfile(f"{event_path}/rupture.json"):
+                    os.remove(f"{event_path}/rupture.json")
+                os.symlink(f"{event_path}/{file.name}", f"{event_path}/rupture.json")
+    return event_path
+
+
 def main():
     parser = argparse.ArgumentParser(description="Process some integers.")
     parser.add_argument(
         "folder", help="Directory where getproduct output was downloaded."
     )
-    parser.add_argument("eventid", help="Desired eventid to extract to ShakeMap.")
-    
     parser.add_argument(
-        "version", type=int, help="Desired version to extract to ShakeMap."
+        "eventid",
+        help="Desired eventid to extract to ShakeMap, or 'all' for every event in the folder.",
+    )
+
+    parser.add_argument(
+        "version",
+        type=int,
+        nargs="*",
+        help="Desired version(s) to extract to ShakeMap.",
+    )
+    parser.add_argument(
+        "-a", "--all-versions", action="store_true", default=False, help="Extract every version in the folder"
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=os.cpu_count(), help="Number of versions extracted in parallel"
     )
     parser.add_argument(
         "-n", "--no-dyfi", action="store_true", default=False, help="Turn off DYFI"
     )
+    parser.add_argument(
+        "--network",
+        nargs="+",
+        default=None,
+        help="Keep only stations from these networks (e.g. CI NC).",
+    )
+    parser.add_argument(
+        "--max-distance",
+        type=float,
+        default=None,
+        help="Keep only stations within this distance (km) of the event.",
+    )
+    parser.add_argument(
+        "--distance-metric",
+        default="repi",
+        choices=["repi", "rhypo", "rrup", "rjb"],
+        help="Distance used by --max-distance (default: repi).",
+    )
+    parser.add_argument(
+        "--imt",
+        nargs="+",
+        default=None,
+        help="Keep only stations with a value for at least one of these IMTs (e.g. pga sa(1.0) mmi).",
+    )
     args = parser.parse_args()
+    if not args.version and not args.all_versions:
+        parser.error("Specify at least one version or --all-versions")
+    filters = dict(
+        no_dyfi=args.no_dyfi,
+        networks=args.network,
+        max_distance=args.max_distance,
+        distance_metric=args.distance_metric,
+        imts=args.imt,
+    )
+
     data_path = get_data_path()
-    # Check if no_dyfi is set
-    if args.no_dyfi:
-        event_path = data_path / args.eventid / f"official_v{args.version:02}_no-dyfi"
-    else:
-        event_path = data_path / args.eventid / f"official_v{args.version:02}"
-    if not event_path.exists():
-        event_path.mkdir(parents=True)
     input_folder = pathlib.Path(args.folder) # / args.eventid
-    for file in input_folder.glob("*.json"):
-        # print(f"File: {str(file)}")
-        parts = file.with_suffix("").name.split("_")
-        version = int(parts[2]) 
-        ftype = parts[3]    # check the filetype 
-        # print(f"ftype: {str(ftype)}, version: {str(version)}")
-        if version != args.version: # Check the version matches the specified one
-            continue
-        if ftype == "stationlist":
-            print("Working on stationlist.json ...")
-            station_data = {}
-            if args.no_dyfi:
-                print(f"DYFI data is being discarded...")
-                station_data = get_station_data(file)
-                file_name, file_extension = os.path.splitext(file.name)
-                outfile = f"{event_path}/{file_name}_no-dyfi{file_extension}"
-                print(f"Writing {outfile}...")
-                with open(outfile, "wt") as fobj:
-                    json.dump(station_data, fobj)
-                if os.path.isfile(f"{event_path}/instrumented_dat.json"):
-                    os.remove(f"{event_path}/instrumented_dat.json")
-                os.symlink(outfile, f"{event_path}/instrumented_dat.json")
-            else:
-                print(f"Writing {file.name} to {event_path}")
-                shutil.copy(file, event_path)
-
-        elif ftype == "info":
-            print("Working on event.xml...")
-            event_data = get_info_event(file)
-            outfile = event_path / "event.xml"
-            print(f"Writing {outfile}...")
-            # print(str(event_data))
-            write_event_file(event_data, outfile)
-        elif ftype == "rupture":
-            print(f"Writing {file.name} to {event_path}")
-            shutil.copy(file, event_path)
-            if os.path.isfile(f"{event_path}/rupture.json"):
-                os.remove(f"{event_path}/rupture.json")
-            os.symlink(f"{event_path}/{file.name}", f"{event_path}/rupture.json")
+    versions = None if args.all_versions else args.version
+    index = select_versions(index_folder(input_folder), args.eventid, versions)
+    if not index:
+        print(f"No matching products found in {input_folder}")
+        return
+
+    jobs = {}
+    for (eventid, version), files in sorted(index.items()):
+        # Check if no_dyfi is set
+        if args.no_dyfi:
+            event_path = data_path / eventid / f"official_v{version:02}_no-dyfi"
+        else:
+            event_path = data_path / eventid / f"official_v{version:02}"
+        jobs[(eventid, version)] = (files, event_path)
+
+    if len(jobs) == 1 or args.workers <= 1:
+        for files, event_path in jobs.values():
+            extract_version(files, event_path, filters)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(extract_version, files, event_path, filters): key
+            for key, (files, event_path) in jobs.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            eventid, version = futures[future]
+            event_path = future.result()
+            print(f"Extracted {eventid} version {version} to {event_path}")
 
 
 if __name__ == "__main__":
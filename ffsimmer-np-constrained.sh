@@ -2,6 +2,10 @@
 
 set -euo pipefail
 
+# NOTE: this script runs the variants one after another through the shared
+# $eventpath/current link. run_ffsimmer_variants.py takes the same -u/-c/-r/-s
+# flags and runs the variants concurrently, each with its own ShakeMap profile.
+
 usage() {
     echo "Usage: $0 [-u] [-c] [-r] [-s] EVENTID"
     echo "  -u : run unconstrained (ffsimmer_pointsource)"
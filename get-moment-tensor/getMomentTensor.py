@@ -1,24 +1,111 @@
 #!/usr/bin/env python
 
 
+import argparse
+import concurrent.futures
 import json
+import os
 import pathlib
-import sys
+import time
 from datetime import datetime
+from urllib.parse import urlparse
 
 import requests
 
 EVENT_URL_TEMPLATE = (
     "https://earthquake.usgs.gov/earthquakes/feed/v1.0/detail/{eventid}.geojson"
 )
+# The detail feed can be pointed at a stand-in server or at a local directory of
+# {eventid}.geojson files (e.g. for testing without network access).
+EVENT_SOURCE = os.environ.get("COMCAT_DETAIL_SOURCE", EVENT_URL_TEMPLATE)
 
-def get_moment_tensor(eventid):
-    url = EVENT_URL_TEMPLATE.format(eventid=eventid)
-    response = requests.get(url)
+# Local cache of detail GeoJSON responses, keyed by event id
+CACHE_DIR = pathlib.Path(
+    os.environ.get(
+        "COMCAT_CACHE_DIR",
+        pathlib.Path.home() / ".cache" / "shakemap-postprocess-tools" / "comcat-detail",
+    )
+)
+CACHE_TTL = 7 * 24 * 3600  # seconds
+CACHE_MAX_ENTRIES = 1000
+MAX_WORKERS = 4
+
+
+def read_cached_detail(eventid, cache_dir=CACHE_DIR, ttl=CACHE_TTL):
+    """
+    Return the cached detail GeoJSON for an event, or None if missing or older than ttl seconds.
+    """
+    cache_file = pathlib.Path(cache_dir) / f"{eventid}.geojson"
+    try:
+        if time.time() - cache_file.stat().st_mtime > ttl:
+            return None
+        with open(cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cached_detail(eventid, jdict, cache_dir=CACHE_DIR):
+    cache_dir = pathlib.Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_dir / f"{eventid}.geojson.{os.getpid()}.tmp"
+    with open(tmp, "wt") as f:
+        json.dump(jdict, f)
+    os.replace(tmp, cache_dir / f"{eventid}.geojson")
+
+
+def evict_cache(cache_dir=CACHE_DIR, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+    """
+    Remove cached responses older than ttl seconds, then the oldest ones beyond max_entries.
+    """
+    cache_dir = pathlib.Path(cache_dir)
+    if not cache_dir.is_dir():
+        return
+    entries = sorted(cache_dir.glob("*.geojson"), key=lambda f: f.stat().st_mtime, reverse=True)
+    now = time.time()
+    for i, cache_file in enumerate(entries):
+        if i >= max_entries or now - cache_file.stat().st_mtime > ttl:
+            cache_file.unlink(missing_ok=True)
+
+
+def fetch_event_detail(eventid, source=EVENT_SOURCE, session=None):
+    """
+    Get the ComCat detail GeoJSON for an event from a URL template or a local directory.
+    """
+    parsed = urlparse(source)
+    if parsed.scheme in ("", "file"):
+        local_dir = pathlib.Path(parsed.path if parsed.scheme == "file" else source)
+        local_file = local_dir / f"{eventid}.geojson"
+        if not local_file.exists():
+            raise Exception(f"Could not find {local_file}")
+        with open(local_file) as f:
+            return json.load(f)
+
+    url = source.format(eventid=eventid)
+    response = (session or requests).get(url, timeout=30)
     if response.status_code != 200:
         msg = f"Could not retrieve any data from {url}"
         raise Exception(msg)
-    jdict = response.json()
+    return response.json()
+
+
+def get_event_detail(eventid, source=EVENT_SOURCE, session=None, cache_dir=CACHE_DIR, ttl=CACHE_TTL):
+    """
+    Detail GeoJSON for an event, from the local cache if it is fresh enough.
+    Set cache_dir to None to bypass the cache.
+    """
+    if cache_dir is not None:
+        jdict = read_cached_detail(eventid, cache_dir, ttl)
+        if jdict is not None:
+            return jdict
+    jdict = fetch_event_detail(eventid, source, session)
+    if cache_dir is not None:
+        write_cached_detail(eventid, jdict, cache_dir)
+    return jdict
+
+
+def get_moment_tensor(eventid, source=EVENT_SOURCE, session=None, cache_dir=CACHE_DIR, ttl=CACHE_TTL):
+    jdict = get_event_detail(eventid, source, session, cache_dir, ttl)
     lon, lat, depth = jdict["geometry"]["coordinates"]
     event_props = {
         "id": jdict["id"],
@@ -34,6 +121,57 @@ def get_moment_tensor(eventid):
 
     return (event_props, jdict["properties"]["products"]["moment-tensor"][0])
 
+
+def get_moment_tensors(eventids, max_workers=MAX_WORKERS, source=EVENT_SOURCE, cache_dir=CACHE_DIR, ttl=CACHE_TTL):
+    """
+    Resolve many events over one pooled HTTP session with at most max_workers requests in flight.
+
+    Returns:
+        Dict of eventid -> (event_props, moment_dict), or the exception raised for that event.
+    """
+    results = {}
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(get_moment_tensor, eventid, source, session, cache_dir, ttl): eventid
+                for eventid in eventids
+            }
+            for future in concurrent.futures.as_completed(futures):
+                eventid = futures[future]
+                try:
+                    results[eventid] = future.result()
+                except Exception as e:
+                    results[eventid] = e
+    if cache_dir is not None:
+        evict_cache(cache_dir, ttl)
+    return results
+
+
+def write_moment_tensor(eventid, outdir, event_dict, moment_dict):
+    """
+    Write EVENTID_event.json and (if available) EVENTID_tensor.json to outdir.
+    Returns the path to the tensor file, or None if there is no moment tensor.
+    """
+    outdir = pathlib.Path(outdir)
+    if not outdir.exists():
+        outdir.mkdir(parents=True)
+    event_file = outdir / f"{eventid}_event.json"
+    moment_file = outdir / f"{eventid}_tensor.json"
+    # print(f"Writing event data to {event_file}")
+    with open(event_file, "wt") as fobj:
+        event_dict = dict(event_dict, time=event_dict["time"].isoformat())
+        json.dump(event_dict, fobj)
+
+    if moment_dict is None:
+        return None
+    # print(f"Writing moment tensor data to {moment_file}")
+    with open(moment_file, "wt") as fobj:
+        json.dump(moment_dict, fobj)
+    return moment_file
+
 def get_nps(file):
     """
     Takes a tensor.json file and calculates NP1 and NP2
@@ -73,27 +211,57 @@ def get_nps(file):
         return np1, np2
     
 
-if __name__ == "__main__":
-    eventid = sys.argv[1]
-    outdir = pathlib.Path(sys.argv[2])
-    if not outdir.exists():
-        outdir.mkdir(parents=True)
-    event_dict, moment_dict = get_moment_tensor(eventid)
-    event_file = outdir / f"{eventid}_event.json"
-    moment_file = outdir / f"{eventid}_tensor.json"
-    # print(f"Writing event data to {event_file}")
-    with open(event_file, "wt") as fobj:
-        event_dict["time"] = event_dict["time"].isoformat()
-        json.dump(event_dict, fobj)
+def main():
+    parser = argparse.ArgumentParser(
+        description="Get the moment tensor of ComCat events and print NP1 and NP2 (strike dip rake)."
+    )
+    parser.add_argument("eventid", nargs="?", help="ComCat event ID")
+    parser.add_argument("outdir", nargs="?", help="Directory to write EVENTID_event.json and EVENTID_tensor.json")
+    parser.add_argument(
+        "--batch", nargs="+", metavar="EVENTID",
+        help="Resolve many events; files are written to OUTROOT/EVENTID/ and one line per event is printed",
+    )
+    parser.add_argument("--outroot", default=".", help="Output root directory for --batch (default: .)")
+    parser.add_argument(
+        "--source", default=EVENT_SOURCE,
+        help="Detail feed URL template with {eventid}, or a local directory of EVENTID.geojson files "
+        "(default: $COMCAT_DETAIL_SOURCE or the ComCat detail feed)",
+    )
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Maximum concurrent requests for --batch")
+    parser.add_argument("--ttl", type=float, default=CACHE_TTL, help="Cache lifetime in seconds")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the local cache")
+    args = parser.parse_args()
+    cache_dir = None if args.no_cache else CACHE_DIR
 
-    if moment_dict is not None:
-        # print(f"Writing moment tensor data to {moment_file}")
-        with open(moment_file, "wt") as fobj:
-            json.dump(moment_dict, fobj)
+    if args.batch:
+        results = get_moment_tensors(args.batch, args.workers, args.source, cache_dir, args.ttl)
+        for eventid in args.batch:
+            result = results[eventid]
+            if isinstance(result, Exception):
+                print(f"{eventid} ERROR {result}")
+                continue
+            moment_file = write_moment_tensor(eventid, pathlib.Path(args.outroot) / eventid, *result)
+            if moment_file is None:
+                print(f"{eventid} NONE")
+                continue
+            np1, np2 = get_nps(moment_file)
+            print(eventid, *np1, *np2)
+        return
+
+    if args.eventid is None or args.outdir is None:
+        parser.error("EVENTID and OUTDIR are required unless --batch is given")
+    event_dict, moment_dict = get_moment_tensor(args.eventid, args.source, cache_dir=cache_dir, ttl=args.ttl)
+    # The workflow scripts run one event per call, so the cache is bounded here too
+    if cache_dir is not None:
+        evict_cache(cache_dir, args.ttl)
+    moment_file = write_moment_tensor(args.eventid, args.outdir, event_dict, moment_dict)
     # Print Nodal Plane info
     np1, np2 = get_nps(moment_file)
     print(
         np1[0], np1[1], np1[2],
         np2[0], np2[1], np2[2],
     )
-        
+
+
+if __name__ == "__main__":
+    main()
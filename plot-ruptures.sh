@@ -21,97 +21,36 @@ else
 fi
 
 ##############################################
-echo "Plotting NP1"
+echo "Plotting NP1, NP2, Point Source equivalent and Slab2-pinned Rupture"
 ##############################################
-# check if the directory exists: 
-if [[ -f "$eventpath/np1/products/rupt_quads.txt" ]]; then
-    echo "Plotting $eventpath/np1/products."
-    python ${softpath}plot_ruptquads/plot_ruptquads.py \
-      --file_path ${eventpath}/np1/products \
-      --cmt ${eventpath}/${eventid}_tensor.json \
-      --np 1 \
-      --region="${REGION}" \
-      --topo True \
-      --contours True
-    mv ${eventpath}/np1/products/ruptures_map-view.png ${eventpath}/np1/products/ruptures_contours.png
-
-    python ${softpath}plot_ruptquads/plot_ruptquads.py \
-      --file_path ${eventpath}/np1/products \
-      --ruptquads True \
-      --cmt ${eventpath}/${eventid}_tensor.json \
-      --np 1 \
-      --region="${REGION}" \
-      --psha True \
-      --topo True
-
-    # Create contour and epicenter QGIS layers
-    python ${softpath}qgis-utils/ffsimmer2qgis.py --productdir ${eventpath}/np1/products --eventxml ${eventpath}/np1/event.xml
-    cp /Users/hyin/usgs_mendenhall/ffsimmer/styles-cpts/qgis-qmls/*.qml  ${eventpath}/np1/products/
-fi
-
-##############################################
-echo "Plotting NP2"
-##############################################
-if [[ -f "$eventpath/np2/products/rupt_quads.txt" ]]; then
+# All variant maps are drawn by one process, so the topo, PSHA, Slab2 and GEM
+# fault layers are clipped to the region once. Each products directory gets
+# ruptures_contours.png (topo + MMI contours) and ruptures_map-view.png
+# (rupt_quads + PSHA + topo); plot_ruptquads.py skips a map whose input
+# (cont_mmi.json or rupt_quads.txt) is missing.
+productdirs=()
+for variant in np1 np2 ffsimmer_pointsource slab2; do
+  if [[ -d "$eventpath/$variant/products" ]]; then
+    echo "Plotting $eventpath/$variant/products."
+    productdirs+=("${eventpath}/${variant}/products")
+  fi
+done
+
+if [[ ${#productdirs[@]} -gt 0 ]]; then
   python ${softpath}plot_ruptquads/plot_ruptquads.py \
-    --file_path ${eventpath}/np2/products \
+    --batch "${productdirs[@]}" \
     --cmt ${eventpath}/${eventid}_tensor.json \
-    --np 2 \
     --region="${REGION}" \
-    --topo True \
-    --contours True
-  mv ${eventpath}/np2/products/ruptures_map-view.png ${eventpath}/np2/products/ruptures_contours.png
-
-  python ${softpath}plot_ruptquads/plot_ruptquads.py \
-    --file_path ${eventpath}/np2/products \
-    --ruptquads True \
-    --cmt ${eventpath}/${eventid}_tensor.json \
-    --np 2 \
-    --region="${REGION}" \
-    --psha True \
-    --topo True
-
-  python ${softpath}qgis-utils/ffsimmer2qgis.py --productdir ${eventpath}/np2/products --eventxml ${eventpath}/np2/event.xml
-  cp /Users/hyin/usgs_mendenhall/ffsimmer/styles-cpts/qgis-qmls/*.qml  ${eventpath}/np2/products/
+    --workers 2
 fi
-##############################################
-echo "Plotting Point Source equivalent"
-############################################## 
-
-python ${softpath}plot_ruptquads/plot_ruptquads.py \
-  --file_path ${eventpath}/ffsimmer_pointsource/products \
-  --region="${REGION}" \
-  --topo True \
-  --contours True
-mv ${eventpath}/ffsimmer_pointsource/products/ruptures_map-view.png ${eventpath}/ffsimmer_pointsource/products/ruptures_contours.png
-
-python ${softpath}plot_ruptquads/plot_ruptquads.py \
-  --file_path ${eventpath}/ffsimmer_pointsource/products \
-  --ruptquads True \
-  --region="${REGION}" \
-  --psha True \
-  --topo True
-
-##############################################
-echo "Plotting Slab2-pinned Rupture"
-##############################################
-if [[ -f "$eventpath/slab2/products/rupt_quads.txt" ]]; then
-  echo "[INFO] Subduction Interface (Slab2) dir is complete. Plotting."
-  python ${softpath}plot_ruptquads/plot_ruptquads.py \
-    --file_path ${eventpath}/slab2/products \
-    --region="${REGION}" \
-    --topo True \
-    --contours True \
-    --ruptquads True
-  mv ${eventpath}/slab2/products/ruptures_map-view.png ${eventpath}/slab2/products/ruptures_contours.png
 
-  python ${softpath}plot_ruptquads/plot_ruptquads.py \
-    --file_path ${eventpath}/slab2/products \
-    --ruptquads True \
-    --region="${REGION}" \
-    --topo True \
-    --ruptquads True
-fi
+# Create contour and epicenter QGIS layers
+for variant in np1 np2; do
+  if [[ -f "$eventpath/$variant/products/rupt_quads.txt" ]]; then
+    python ${softpath}qgis-utils/ffsimmer2qgis.py --productdir ${eventpath}/${variant}/products --eventxml ${eventpath}/${variant}/event.xml
+    cp /Users/hyin/usgs_mendenhall/ffsimmer/styles-cpts/qgis-qmls/*.qml  ${eventpath}/${variant}/products/
+  fi
+done
 
 ##############################################
 echo "Plotting current ShakeMap Reproduction"
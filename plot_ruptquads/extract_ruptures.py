@@ -1,12 +1,17 @@
 import pandas as pd
 import pygmt
 import os
-import math
-import numpy as np
 import argparse
 from shapely.geometry import Point, LineString
 from pathlib import Path
 import xml.etree.ElementTree as ET
+import sys
+import tempfile
+
+## Import the shared rupt_quads.txt reader and rupture dimension kernels
+sys.path.append("/Users/hyin/soft/shakemap-postprocess-tools/shakemap_utils")
+from ruptquads import read_ruptquads, ruptquads_to_dataframe, write_gmt_segments
+from custom_utils import rupture_dimensions
 
 
 # Parse command line arguments
@@ -26,62 +31,6 @@ rgn = args.region.split('/')
 rgn = [float(coord) for coord in rgn]  # Convert to float
 
 
-def parse_rupture_file(file):
-    ruptures = []  # List to store all ruptures
-    current_rupture = []  # Temporary list to store points for the current rupture
-
-    with open(file, "r") as file:
-        for line in file:
-            line = line.strip()
-            if line.startswith("#Origin"):
-                # Start of a new rupture, reset the current rupture
-                current_rupture = []
-            elif line == ">":
-                # End of the current rupture, process and store it
-                if len(current_rupture) == 5:  # Ensure there are 5 points
-                    rupture = {
-                        "p1": current_rupture[0],
-                        "p2": current_rupture[1],
-                        "p3": current_rupture[2],
-                        "p4": current_rupture[3],
-                    }
-                    ruptures.append(rupture)
-                current_rupture = []  # Reset for the next rupture
-            elif line:
-                # Parse a point (lat, lon, depth)
-                point = tuple(map(float, line.split()))
-                current_rupture.append(point)
-    data = []
-    for idx, rupture in enumerate(ruptures):
-        data.append({
-            "rupture_id": idx + 1,
-            "p1_lat": rupture["p1"][0], "p1_lon": rupture["p1"][1], "p1_depth": rupture["p1"][2],
-            "p2_lat": rupture["p2"][0], "p2_lon": rupture["p2"][1], "p2_depth": rupture["p2"][2],
-            "p3_lat": rupture["p3"][0], "p3_lon": rupture["p3"][1], "p3_depth": rupture["p3"][2],
-            "p4_lat": rupture["p4"][0], "p4_lon": rupture["p4"][1], "p4_depth": rupture["p4"][2],
-        })
-    
-    return pd.DataFrame(data)
-
-
-
-def haversine(lat1, lon1, lat2, lon2):
-    """
-    Calculate the great-circle distance between two points on the Earth.
-    Args:
-        lat1, lon1: Latitude and longitude of point 1 in decimal degrees.
-        lat2, lon2: Latitude and longitude of point 2 in decimal degrees.
-    Returns:
-        Distance in kilometers.
-    """
-    R = 6371.0  # Radius of the Earth in kilometers
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
 def parse_ruptjson(file):
     """
     Parse a JSON file containing rupture data.
@@ -120,11 +69,8 @@ def parse_eventxml(file):
 #                   CALCULATIONS                #
 ###################################################
 
-ruptures = parse_rupture_file(file)
-
-ruptures["fault_length_km"] = ruptures.apply(lambda row: haversine(row["p1_lat"], row["p1_lon"], row["p2_lat"], row["p2_lon"]), axis=1)
-ruptures["fault_width_km"] = np.sqrt((ruptures.apply(lambda row: haversine(row["p1_lat"], row["p1_lon"], row["p4_lat"], row["p4_lon"]), axis=1)**2)+ (ruptures["p4_depth"]**2))
-ruptures["aspect_ratio"] = ruptures["fault_length_km"] / ruptures["fault_width_km"]
+corners, _ = read_ruptquads(file)
+ruptures = ruptquads_to_dataframe(corners).assign(**rupture_dimensions(corners))
 
 # Calculate average aspect ratio
 avg_aspect = ruptures["aspect_ratio"].mean()
@@ -177,25 +123,14 @@ projection = 'M0/0/30c'
 
 fig.basemap(region=rgn, projection=projection, frame=True)
 fig.coast(shorelines=False, region=rgn, projection=projection, water='204/212/219')
-## Plot Fault ruptures (iterate over each fault)
-for index, row in ruptures.iterrows():
-    # Extract points for the fault rupture
-    p1 = [row['p1_lon'],row['p1_lat']]
-    p2 = [row['p2_lon'],row['p2_lat']]
-    p3 = [row['p3_lon'],row['p3_lat']]
-    p4 = [row['p4_lon'],row['p4_lat']]
-    p5 = [row['p1_lon'], row['p1_lat']]  # Closing the polygon
-
-    if index == 0:
-        # Only add label for the first fault to avoid duplicate legend entries
-        # Plot the rupture plane projected to the surface
-        fig.plot(x=[p1[0], p2[0], p3[0], p4[0], p5[0]], y=[p1[1], p2[1], p3[1], p4[1],p5[1]], pen='4p,darkblue',  transparency=90, label=f"Fault Realizations +S.5c", region=rgn, projection=projection)
-        # Plot the updip edge
-        fig.plot(x=[p1[0], p2[0]], y=[p1[1], p2[1]], pen='4p,darkred',  transparency=80, label=f"Fault Updip edge +S.5c", region=rgn, projection=projection)
-    else:
-        fig.plot(x=[p1[0], p2[0], p3[0], p4[0], p5[0]], y=[p1[1], p2[1], p3[1], p4[1],p5[1]], pen='4p,darkblue',  transparency=90, region=rgn, projection=projection)
-        fig.plot(x=[p1[0], p2[0]], y=[p1[1], p2[1]], pen='4p,darkred',  transparency=80, region=rgn, projection=projection)
-    
+## Plot all fault ruptures in one GMT call each for the outlines and the updip edges
+with tempfile.TemporaryDirectory() as tmpdir:
+    polygons = write_gmt_segments(corners, os.path.join(tmpdir, 'rupture_polygons.txt'))
+    updip_edges = write_gmt_segments(corners, os.path.join(tmpdir, 'rupture_updip.txt'), updip=True)
+    # Plot the rupture planes projected to the surface
+    fig.plot(data=polygons, pen='4p,darkblue',  transparency=90, label=f"Fault Realizations +S.5c", region=rgn, projection=projection)
+    # Plot the updip edges
+    fig.plot(data=updip_edges, pen='4p,darkred',  transparency=80, label=f"Fault Updip edge +S.5c", region=rgn, projection=projection)
 
 
 # Plot hypocenter
@@ -1,63 +1,124 @@
 #!/usr/bin/env python
 
-
-
-def main():
-    import pandas as pd
-    import pygmt
-    from pygmt.params import Position
-    import os
-    import math
+import pandas as pd
+import pygmt
+from pygmt.params import Position
+import os
+import math
+import numpy as np
+import argparse
+import concurrent.futures
+from shapely.geometry import Point, LineString
+from pathlib import Path
+import tempfile
+# import xml.etree.ElementTree as ET
+
+import sys
+## Import functions from custom_utils.py
+sys.path.append("/Users/hyin/soft/shakemap-postprocess-tools/shakemap_utils")
+from custom_utils import rupture_dimensions, parse_ruptjson, parse_eventxml, parse_im_json
+from ruptquads import read_ruptquads, ruptquads_to_dataframe, write_gmt_segments
+import map_layers
+sys.path.append("/Users/hyin/soft/shakemap-postprocess-tools/get-moment-tensor")
+from getMomentTensor import get_nps
+
+###
+# To test or run as a standalone script in a products directory, try using the following command:
+# python /Users/hyin/soft/shakemap-postprocess-tools/plot_ruptquads/plot_ruptquads.py --file_path . --eventxml ../event.xml --cmt '/Users/hyin/shakemap_profiles/default/data/us6000rsy1/us6000rsy1_tensor.json' --np 1
+#
+# To render the maps of several variants of one event from a single process, with the
+# static layers (topo, PSHA, Slab2, GEM faults) clipped to the region only once:
+# python /Users/hyin/soft/shakemap-postprocess-tools/plot_ruptquads/plot_ruptquads.py --batch EVENTPATH/np1/products EVENTPATH/np2/products --region=-75/-70/-20/-15 --cmt EVENTPATH/EVENTID_tensor.json --workers 2
+
+# Map file names written by the batch mode
+CONTOURS_MAP = 'ruptures_contours.png'
+RUPTURES_MAP = 'ruptures_map-view.png'
+
+
+def plot_cmt(cmt, file_path):
+    import matplotlib.pyplot as plt
+    from obspy.imaging.beachball import beach
     import numpy as np
-    import argparse
-    from shapely.geometry import Point, LineString
-    from pathlib import Path
-    # import xml.etree.ElementTree as ET
-
-    import sys
-    ## Import functions from custom_utils.py
-    sys.path.append("/Users/hyin/soft/shakemap-postprocess-tools/shakemap_utils")
-    from custom_utils import parse_ruptquads, haversine, parse_ruptjson, parse_eventxml, parse_im_json
-    sys.path.append("/Users/hyin/soft/shakemap-postprocess-tools/get-moment-tensor")
-    from getMomentTensor import get_nps
-
-    ###
-    # To test or run as a standalone script in a products directory, try using the following command:
-    # python /Users/hyin/soft/shakemap-postprocess-tools/plot_ruptquads/plot_ruptquads.py --file_path . --eventxml ../event.xml --cmt '/Users/hyin/shakemap_profiles/default/data/us6000rsy1/us6000rsy1_tensor.json' --np 1
 
-    # Parse command line arguments
-    parser = argparse.ArgumentParser(description="Parse rupt_quads.txt file and plot fault planes.")
-    parser.add_argument('--file_path', type=str, required=True, help='Path to the shakemap event directory')
-    parser.add_argument('--region', type=str, default='None', help='Region in the format xmin/xmax/ymin/ymax')
-    parser.add_argument('--eventxml', type=str, default=None, help='Path to the rupture event.xml file (optional). Will assume the file is one level up from the file_path if none is provided.')
-    parser.add_argument('--faultgeometry', type=str, default=None, help='Path to a rupture.json fault geometry file (optional).')
-    parser.add_argument('--ruptquads', type=str, default=None, help='Path to a rupt_quads.txt file or set to True for the default location (optional).')
-    parser.add_argument('--contours', type=str, default=None, help='Path to a contour json file containing MMI contours OR set to "True" to look for the default location (optional).')
-    parser.add_argument('--topo', type=str, default=None, help='True or False. Whether to plot the topo grid. If True, will look for the topo grid in the default location. (optional)')
-    parser.add_argument('--psha', type=str, default=None, help='True or False. Whether to plot the psha grid. If True, will look for the psha grid in the default location. (optional)')
-    parser.add_argument('--cmt', type=str, default=None, help='Moment Tensor solution file saved as a json (e.g. us6000rsy1_event.json). If provided, will plot the beachball on the map.')
-    parser.add_argument(
-        '--np',
-        type=int,
-        choices=[1, 2],
-        default=None,
-        help='Specify which nodal plane to highlight (1 or 2). Only relevant if --cmt is provided.'
+    # s1 = float(cmt['properties']['nodal-plane-1-strike'])
+    # d1 = float(cmt['properties']['nodal-plane-1-dip'])
+    # r1 = float(cmt['properties']['nodal-plane-1-rake'])
+
+    mrr1 = float(cmt['properties']['tensor-mrr'])
+    mtt1 = float(cmt['properties']['tensor-mtt'])
+    mpp1 = float(cmt['properties']['tensor-mpp'])
+    mrt1 = float(cmt['properties']['tensor-mrt'])
+    mrp1 = float(cmt['properties']['tensor-mrp'])
+    mtp1 = float(cmt['properties']['tensor-mtp'])
+
+    # Moment tensor
+    mt = [
+        mrr1,
+        mtt1,
+        mpp1,
+        mrt1,
+        mrp1,
+        mtp1,
+    ]
+
+    # Create figure and axes explicitly
+    fig, ax = plt.subplots(figsize=(4, 4))
+
+    # Create beachball (returns a PatchCollection)
+    width = 200
+    bb = beach(
+        mt,
+        xy=(0, 0),
+        width=width,
+        facecolor="black",
+        linewidth=1
     )
 
-    args = parser.parse_args()
+    # Add to axes
+    ax.add_collection(bb)
+    r = width / 1.9
 
+    # Scale the figure to fit the beachball
+    ax.set_xlim(-r, r)
+    ax.set_ylim(-r, r)
 
-    # Validate: --np only makes sense if --cmt is provided
-    if args.np is not None and args.cmt is None:
-        parser.error("--np requires --cmt to be specified")
+    ax.set_aspect("equal")
+    ax.axis("off")
 
+    eventid = cmt["properties"]["eventsourcecode"]
 
-    file_path = args.file_path
-
+    plt.savefig(
+        f'{file_path}/moment-tensor.png',
+        dpi=300,
+        bbox_inches="tight",
+        pad_inches=0,
+        transparent=True
+    )
+    plt.close(fig)
+
+
+def plot_map(file_path, rgn=None, eventxml=None, faultgeometry=None, ruptquads=False, contours=None,
+             topo=False, psha=False, cmt=None, nodal_plane=None, layers=None, outfile='ruptures_map-view.png'):
+    """
+    Plot the map of one ShakeMap products directory.
+    Args:
+        file_path: Path to the shakemap products directory.
+        rgn: Region [xmin, xmax, ymin, ymax]. Determined from the ruptures if None.
+        eventxml: Path to the event.xml file. Defaults to the file one level up from file_path.
+        faultgeometry: Path to a rupture.json fault geometry file (optional).
+        ruptquads: Whether to plot the rupt_quads.txt realizations in file_path.
+        contours: Path to a contour json file, or 'True' for the default location (optional).
+        topo, psha: Whether to plot the topo and PSHA grids.
+        cmt: Moment tensor json file (optional).
+        nodal_plane: Nodal plane (1 or 2) to annotate. Only used with cmt.
+        layers: Dict of pre-clipped static layers from map_layers.prepare_static_layers.
+            Layers that are not in the dict are clipped to the region here.
+        outfile: Name of the map written to file_path.
+    """
+    layers = dict(layers or {})
 
-    # Check if ruptquads flag was set
     # Check if there is a rupt_quads.txt file in the provided file_path
-    if args.ruptquads is not None:
+    if ruptquads:
         if os.path.exists(file_path+'/rupt_quads.txt'):
             file = os.path.join(file_path, 'rupt_quads.txt')
         else:
@@ -66,75 +127,12 @@ def main():
     else:
         file=None
 
-    def plot_cmt(cmt): 
-        import matplotlib.pyplot as plt
-        from obspy.imaging.beachball import beach
-        import numpy as np
-
-        # s1 = float(cmt['properties']['nodal-plane-1-strike'])
-        # d1 = float(cmt['properties']['nodal-plane-1-dip'])
-        # r1 = float(cmt['properties']['nodal-plane-1-rake'])
-
-        mrr1 = float(cmt['properties']['tensor-mrr'])
-        mtt1 = float(cmt['properties']['tensor-mtt'])
-        mpp1 = float(cmt['properties']['tensor-mpp'])
-        mrt1 = float(cmt['properties']['tensor-mrt'])
-        mrp1 = float(cmt['properties']['tensor-mrp'])
-        mtp1 = float(cmt['properties']['tensor-mtp'])
-
-        # Moment tensor
-        mt = [
-            mrr1,
-            mtt1,
-            mpp1,
-            mrt1,
-            mrp1,
-            mtp1,
-        ]
-
-        # Create figure and axes explicitly
-        fig, ax = plt.subplots(figsize=(4, 4))
-
-        # Create beachball (returns a PatchCollection)
-        width = 200
-        bb = beach(
-            mt,
-            xy=(0, 0),
-            width=width,
-            facecolor="black",
-            linewidth=1
-        )
-
-        # Add to axes
-        ax.add_collection(bb)
-        r = width / 1.9
-
-        # Scale the figure to fit the beachball
-        ax.set_xlim(-r, r)
-        ax.set_ylim(-r, r)
-
-        ax.set_aspect("equal")
-        ax.axis("off")
-
-        eventid = cmt["properties"]["eventsourcecode"]
-
-        plt.savefig(
-            f'{file_path}/moment-tensor.png',
-            dpi=300,
-            bbox_inches="tight",
-            pad_inches=0,
-            transparent=True
-        ) 
-    
     ###################################################
     #                   CALCULATIONS                #
     ###################################################
     if file is not None:
-        ruptures = parse_ruptquads(file)
-
-        ruptures["fault_length_km"] = ruptures.apply(lambda row: haversine(row["p1_lat"], row["p1_lon"], row["p2_lat"], row["p2_lon"]), axis=1)
-        ruptures["fault_width_km"] = np.sqrt((ruptures.apply(lambda row: haversine(row["p1_lat"], row["p1_lon"], row["p4_lat"], row["p4_lon"]), axis=1)**2)+ (ruptures["p4_depth"]**2))
-        ruptures["aspect_ratio"] = ruptures["fault_length_km"] / ruptures["fault_width_km"]
+        corners, _ = read_ruptquads(file)
+        ruptures = ruptquads_to_dataframe(corners).assign(**rupture_dimensions(corners))
 
         # Calculate average aspect ratio
         avg_aspect = ruptures["aspect_ratio"].mean()
@@ -148,20 +146,20 @@ def main():
         # print(f"Average downdip depth: {avg_downdip_depth:.2f} km")
 
     ## Get hypocenter from the event.xml file
-    if args.eventxml is not None:
-        lat, lon, depth = parse_eventxml(args.eventxml)
+    if eventxml is not None:
+        lat, lon, depth = parse_eventxml(eventxml)
         print(f'lat, lon, depth = ',lat, lon, depth)
     else:
         eventpath = Path(file_path).parents[0] / 'event.xml'
         lat, lon, depth = parse_eventxml(eventpath)
         # print(f"Using default event XML file at: {eventpath}.")
 
-    hypocenter = [lon, lat]                                                 
+    hypocenter = [lon, lat]
 
     # Check if rupture.json file is provided
     ruptjson=None
-    if args.faultgeometry is not None:
-        ruptjson = args.faultgeometry
+    if faultgeometry is not None:
+        ruptjson = faultgeometry
         if not os.path.exists(ruptjson):
             print(f"Rupture JSON file not found at {ruptjson}. Continue plotting without USGS fault geometry.")
             ruptjson = None
@@ -169,7 +167,7 @@ def main():
             print(f"Rupture JSON file found at {ruptjson}. Proceeding with parsing.")
 
     # Check if region is provided
-    if args.region == 'None':
+    if rgn is None:
         print("No region provided. Automatically determining region from rupture data.")
         min_lon = min(ruptures["p1_lon"].min(), ruptures["p2_lon"].min(), ruptures["p3_lon"].min(), ruptures["p4_lon"].min())
         max_lon = max(ruptures["p1_lon"].max(), ruptures["p2_lon"].max(), ruptures["p3_lon"].max(), ruptures["p4_lon"].max())
@@ -180,21 +178,31 @@ def main():
         rgn = [min_lon-lon_buffer, max_lon+lon_buffer, min_lat-lat_buffer, max_lat+lat_buffer]  # Add some padding to the region
         print(f"Determined region: {rgn}")
 
-    else: 
-        rgn = args.region.split('/')
+    else:
         print(f"Using provided region: {rgn}")
-        rgn = [float(coord) for coord in rgn]  # Convert to float
+
+    # Clip the static layers that were not prepared by the caller (see plot_batch):
+    # cached region subsets of the grids and the fault segments that intersect the region
+    layer_dir = tempfile.TemporaryDirectory()
+    layers.update(map_layers.prepare_static_layers(
+        rgn,
+        layer_dir.name,
+        topo=topo and "topo" not in layers,
+        psha=psha and "psha" not in layers,
+        slab2="slab2" not in layers,
+        faults="faults" not in layers,
+    ))
 
     ### Read in CMT if provided
-    if args.cmt is not None: 
-        cmtfile = args.cmt
+    if cmt is not None:
+        cmtfile = cmt
         print(f"CMT solution provided: {cmtfile}")
 
         import json
         with open(cmtfile, 'r') as json_file:
-            cmt = json.load(json_file)
+            cmt_json = json.load(json_file)
 
-        plot_cmt(cmt)
+        plot_cmt(cmt_json, file_path)
 
 
     ###################################################
@@ -209,9 +217,9 @@ def main():
 
     fig.basemap(region=rgn, projection=projection, frame=True)
 
-    if args.psha == "True":
+    if psha:
         ## Plot PSHA
-        psha='/Users/hyin/usgs_mendenhall/ffsimmer/map-layers/psha/GEM-GSHM_PGA-475y-rock_v2023/v2023_1_pga_475_rock_3min.tif'
+        psha_grid = layers["psha"]
         # create CPT with values less than 0.1 set to transparent
         pygmt.makecpt(
             cmap="bilbao",
@@ -220,29 +228,29 @@ def main():
             reverse=True
         )
         fig.grdimage(
-            grid=psha,
+            grid=psha_grid,
             cmap=True,
-            shading=True,
+            shading=layers.get("psha_shading", True),
             transparency=40,
         )
         fig.colorbar(frame='af+lSeismic Hazard PGA (g) 475 yr. (GEM)', position=Position("BL", cstype="outside", offset=(-11.5, 0.5)),length=5,width=0.5, orientation='horizontal')  # forces horizontal
 
     fig.coast(shorelines=False, region=rgn, projection=projection, water='204/212/219')
 
-    if args.topo == "True":
+    if topo:
         # Plot Topo
-        topo = '/Users/hyin/usgs_mendenhall/topo/global_srtm15p/SRTM15_V2.7.nc' #@todo: Figure out the best way to un-hard code this
+        topo_grid = layers["topo"] #@todo: Figure out the best way to un-hard code this
         fig.grdimage(
-            grid=topo,
+            grid=topo_grid,
             cmap="gray",
-            shading=True,
+            shading=layers.get("topo_shading", True),
             transparency=70,
         )
 
 
     # Plot Slab2.0
-    slab2 = '/Users/hyin/usgs_mendenhall/ffsimmer/map-layers/faults/slab2.0/slab2.gmt'
-    # @todo: update so contours plot with color according to their depth 
+    slab2 = layers["slab2"]
+    # @todo: update so contours plot with color according to their depth
     # /Users/hyin/usgs_mendenhall/ffsimmer/map-layers/faults/slab2.0/Slab2Distribute_Mar2018
     fig.plot(
         data=slab2,
@@ -251,7 +259,7 @@ def main():
     )
 
     # Plot GEM faults
-    faults_global = "/Users/hyin/usgs_mendenhall/ffsimmer/map-layers/faults/gem-global-active-faults-master/gmt/gem_active_faults_harmonized.gmt"
+    faults_global = layers["faults"]
     fig.plot(
         data=faults_global,
         pen="3p,darkolivegreen",
@@ -268,7 +276,7 @@ def main():
     # )
 
     # # EFSM geojson not plotting for some reason
-    # # Plot EFSM 20 
+    # # Plot EFSM 20
     # efsm20 = '/Users/hyin/usgs_mendenhall/ffsimmer/map-layers/faults/efsm_2020_europe-faults/EFSM20_GeoJSON/EFSM20_efsm20_cf_top.geojson'
     # fig.plot(
     #     data=efsm20,
@@ -276,38 +284,26 @@ def main():
     #     label="EFSM20",
     # )
 
-    # @todo: Add logic to check if the faults are in the region and plot only relevant fault databases
-
     if file is not None:
-        ## Plot Fault ruptures (iterate over each fault)
-        for index, row in ruptures.iterrows():
-            # Extract points for the fault rupture
-            p1 = [row['p1_lon'],row['p1_lat']]
-            p2 = [row['p2_lon'],row['p2_lat']]
-            p3 = [row['p3_lon'],row['p3_lat']]
-            p4 = [row['p4_lon'],row['p4_lat']]
-            p5 = [row['p1_lon'], row['p1_lat']]  # Closing the polygon
-
-            if index == 0:
-                # Only add label for the first fault to avoid duplicate legend entries
-                # Plot the rupture plane projected to the surface
-                fig.plot(x=[p1[0], p2[0], p3[0], p4[0], p5[0]], y=[p1[1], p2[1], p3[1], p4[1],p5[1]], pen='2p,darkblue',  transparency=70, label=f"Fault Realizations +S.5c", region=rgn, projection=projection)
-                # Plot the updip edge
-                fig.plot(x=[p1[0], p2[0]], y=[p1[1], p2[1]], pen='2p,darkred',  transparency=50, label=f"Fault Updip edge +S.5c", region=rgn, projection=projection)
-            else:
-                fig.plot(x=[p1[0], p2[0], p3[0], p4[0], p5[0]], y=[p1[1], p2[1], p3[1], p4[1],p5[1]], pen='2p,darkblue',  transparency=70, region=rgn, projection=projection)
-                fig.plot(x=[p1[0], p2[0]], y=[p1[1], p2[1]], pen='2p,darkred',  transparency=50, region=rgn, projection=projection)
+        ## Plot all fault ruptures in one GMT call each for the outlines and the updip edges
+        with tempfile.TemporaryDirectory() as tmpdir:
+            polygons = write_gmt_segments(corners, os.path.join(tmpdir, 'rupture_polygons.txt'))
+            updip_edges = write_gmt_segments(corners, os.path.join(tmpdir, 'rupture_updip.txt'), updip=True)
+            # Plot the rupture planes projected to the surface
+            fig.plot(data=polygons, pen='2p,darkblue',  transparency=70, label=f"Fault Realizations +S.5c", region=rgn, projection=projection)
+            # Plot the updip edges
+            fig.plot(data=updip_edges, pen='2p,darkred',  transparency=50, label=f"Fault Updip edge +S.5c", region=rgn, projection=projection)
 
     ## Plot MMI contours if available
-    if args.contours is not None:   
-        if args.contours == 'True':
+    if contours is not None:
+        if contours == 'True':
             print("Contour file argument provided but no path specified. Trying the default location.")
             contfile = os.path.join(file_path,'cont_mmi.json')
-        else:   
+        else:
             # Check to make sure the provided contour file exists
-            contfile = args.contours
+            contfile = contours
         # either way, check that the contfile exists before trying to parse and plot
-        # If it exists, plot it, if it doesn't, don't. 
+        # If it exists, plot it, if it doesn't, don't.
         if os.path.exists(contfile):
             gdf = parse_im_json(contfile)
             pygmt.makecpt(cmap="/Users/hyin/usgs_mendenhall/ffsimmer/styles-cpts/mmi_discrete_20bins.cpt")
@@ -329,7 +325,7 @@ def main():
         print(f"Plotting fault geometry from {ruptjson}")
         gdf = gpd.read_file(ruptjson)
 
-        # Calc updip edge 
+        # Calc updip edge
         geom = gdf.geometry.iloc[0]  # assuming one multipolygon
         coords = np.array(geom.geoms[0].exterior.coords)
         pts = coords.shape[0]
@@ -350,33 +346,161 @@ def main():
         fig.text(position="BR", offset="-2c/2c", text=f"Avg. downdip depth: {avg_downdip_depth:.2f} km" ,font="20p,Helvetica,black")
 
     ## Plot the CMT solution and the nodal plane if provided
-    if args.cmt is not None:
+    if cmt is not None:
         # print("Plotting the beachball on the map.")
-        # Plot the Obspy beachball PNG on the PyGMT figure 
+        # Plot the Obspy beachball PNG on the PyGMT figure
         # PyGMT version 0.16.X does not allow position arguments like "TL", so I've updated to PyGMT 0.18.X
         fig.image(
             imagefile=f"{file_path}/moment-tensor.png",
             position=Position("TL",offset="1c,1c"),
             width="3c",
         )
-        if args.np is not None:
-            np1, np2 = get_nps(args.cmt)
-            if args.np == 1:
+        if nodal_plane is not None:
+            np1, np2 = get_nps(cmt)
+            if nodal_plane == 1:
                 strike = np1[0]
                 dip = np1[1]
                 rake = np1[2]
-            if args.np == 2:
+            if nodal_plane == 2:
                 strike = np2[0]
                 dip = np2[1]
                 rake = np2[2]
-            fig.text(position="TL", offset='5c/-1.2c', text=f"Nodal Plane {args.np}", font="20p,Helvetica,black")
+            fig.text(position="TL", offset='5c/-1.2c', text=f"Nodal Plane {nodal_plane}", font="20p,Helvetica,black")
             fig.text(position="TL", offset='5c/-2.2c', text=f"Strike: {strike}\N{DEGREE SIGN}", font="20p,Helvetica,black")
             fig.text(position="TL", offset='5c/-3.2c', text=f"Dip: {dip}\N{DEGREE SIGN}", font="20p,Helvetica,black")
 
     fig.legend()
 
 
-    fig.savefig(file_path+'/ruptures_map-view.png')
+    fig.savefig(os.path.join(file_path, outfile))
+    layer_dir.cleanup()
+
+
+def batch_jobs(product_dirs, rgn, cmt=None):
+    """
+    Build the maps that plot-ruptures.sh draws for each variant's products directory.
+    Every directory gets a contour map (CONTOURS_MAP, topo + MMI contours) if it has
+    cont_mmi.json and a rupture map (RUPTURES_MAP, rupt_quads + PSHA + topo) if it has
+    rupt_quads.txt. The nodal plane annotation is taken from the variant name (np1/np2).
+    Args:
+        product_dirs: List of products directories (e.g. EVENTPATH/np1/products).
+        rgn: Region [xmin, xmax, ymin, ymax] shared by all maps.
+        cmt: Moment tensor json file (optional).
+    Returns:
+        List of keyword argument dicts for plot_map (without layers).
+    """
+    jobs = []
+    for file_path in product_dirs:
+        variant = Path(file_path).resolve().parent
+        nodal_plane = {'np1': 1, 'np2': 2}.get(variant.name) if cmt is not None else None
+        common = dict(
+            file_path=str(file_path),
+            rgn=rgn,
+            cmt=cmt,
+            nodal_plane=nodal_plane,
+            topo=True,
+        )
+        if os.path.exists(os.path.join(file_path, 'cont_mmi.json')):
+            jobs.append(dict(common, contours='True', outfile=CONTOURS_MAP))
+        if os.path.exists(os.path.join(file_path, 'rupt_quads.txt')):
+            jobs.append(dict(common, ruptquads=True, psha=True, outfile=RUPTURES_MAP))
+    return jobs
+
+
+def plot_batch(product_dirs, rgn, cmt=None, workers=1):
+    """
+    Render the maps of several products directories of one event.
+    The static layers are clipped to the shared region once and every map is drawn
+    from the clipped files. With workers > 1 the maps are drawn in a process pool
+    (each worker keeps its own GMT session).
+    Args:
+        product_dirs: List of products directories.
+        rgn: Region [xmin, xmax, ymin, ymax] shared by all maps.
+        cmt: Moment tensor json file (optional).
+        workers: Number of worker processes.
+    """
+    jobs = batch_jobs(product_dirs, rgn, cmt)
+    if not jobs:
+        print("No rupt_quads.txt or cont_mmi.json found in the provided directories.")
+        return
+
+    # Maps of the same directory share moment-tensor.png, so they are drawn by the same worker
+    by_dir = {}
+    for job in jobs:
+        by_dir.setdefault(job['file_path'], []).append(job)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        layers = map_layers.prepare_static_layers(rgn, workdir)
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(plot_jobs, dir_jobs, layers) for dir_jobs in by_dir.values()]
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+        else:
+            for dir_jobs in by_dir.values():
+                plot_jobs(dir_jobs, layers)
+
+
+def plot_jobs(jobs, layers):
+    for job in jobs:
+        plot_map(layers=layers, **job)
+        print(f"Wrote {os.path.join(job['file_path'], job['outfile'])}")
+
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Parse rupt_quads.txt file and plot fault planes.")
+    parser.add_argument('--file_path', type=str, default=None, help='Path to the shakemap event directory')
+    parser.add_argument('--batch', type=str, nargs='+', default=None, help='Render the contour and rupture maps of several products directories (e.g. the np1, np2, slab2 and ffsimmer_pointsource products) in one process. Requires --region.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for --batch (default: 1)')
+    parser.add_argument('--region', type=str, default='None', help='Region in the format xmin/xmax/ymin/ymax')
+    parser.add_argument('--eventxml', type=str, default=None, help='Path to the rupture event.xml file (optional). Will assume the file is one level up from the file_path if none is provided.')
+    parser.add_argument('--faultgeometry', type=str, default=None, help='Path to a rupture.json fault geometry file (optional).')
+    parser.add_argument('--ruptquads', type=str, default=None, help='Path to a rupt_quads.txt file or set to True for the default location (optional).')
+    parser.add_argument('--contours', type=str, default=None, help='Path to a contour json file containing MMI contours OR set to "True" to look for the default location (optional).')
+    parser.add_argument('--topo', type=str, default=None, help='True or False. Whether to plot the topo grid. If True, will look for the topo grid in the default location. (optional)')
+    parser.add_argument('--psha', type=str, default=None, help='True or False. Whether to plot the psha grid. If True, will look for the psha grid in the default location. (optional)')
+    parser.add_argument('--cmt', type=str, default=None, help='Moment Tensor solution file saved as a json (e.g. us6000rsy1_event.json). If provided, will plot the beachball on the map.')
+    parser.add_argument(
+        '--np',
+        type=int,
+        choices=[1, 2],
+        default=None,
+        help='Specify which nodal plane to highlight (1 or 2). Only relevant if --cmt is provided.'
+    )
+
+    args = parser.parse_args()
+
+
+    # Validate: --np only makes sense if --cmt is provided
+    if args.np is not None and args.cmt is None:
+        parser.error("--np requires --cmt to be specified")
+    if (args.file_path is None) == (args.batch is None):
+        parser.error("Specify either --file_path or --batch")
+
+    if args.region == 'None':
+        rgn = None
+    else:
+        rgn = [float(coord) for coord in args.region.split('/')]  # Convert to float
+
+    if args.batch is not None:
+        if rgn is None:
+            parser.error("--batch requires --region")
+        plot_batch(args.batch, rgn, cmt=args.cmt, workers=args.workers)
+        return
+
+    plot_map(
+        args.file_path,
+        rgn=rgn,
+        eventxml=args.eventxml,
+        faultgeometry=args.faultgeometry,
+        ruptquads=args.ruptquads is not None,
+        contours=args.contours,
+        topo=args.topo == "True",
+        psha=args.psha == "True",
+        cmt=args.cmt,
+        nodal_plane=args.np,
+    )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+
+# Run the ffsimmer ShakeMap variants for one event (point source, NP1, NP2,
+# slab2 and the ShakeMap reproduction) concurrently.
+#
+# ffsimmer-np-constrained.sh runs these one after another because they all
+# share the $eventpath/current symlink. Here every variant gets its own
+# ShakeMap profile: a private HOME with a profiles.conf whose data_path
+# contains only EVENTID/current -> the variant directory. Each "shake" run then
+# sees its own "current" and the variants can run side by side.
+#
+# A variant is skipped only if it completed before with the same inputs
+# (event.xml, model.conf, rupture.json, station files, shake modules); see
+# shakemap_utils/stage_cache.py.
+#
+# Example usage:
+# python /Users/hyin/soft/shakemap-postprocess-tools/run_ffsimmer_variants.py -u -c -s us6000rsy1 --workers 4
+
+import argparse
+import concurrent.futures
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+
+from configobj import ConfigObj
+
+from write_model_conf import model_conf_text, write_model_conf
+
+PROFILE_CONF = pathlib.Path.home() / ".shakemap" / "profiles.conf"
+SOFTPATH = pathlib.Path(__file__).resolve().parent
+
+sys.path.append(str(SOFTPATH / "shakemap_utils"))
+import stage_cache
+
+SHAKE_MODULES = ["select", "assemble", "-c", "test", "model", "contour", "mapping", "info", "gridxml", "raster"]
+FFSIM_NSIM = 20
+FFSIM_TRUE_GRID = True
+
+# directory (relative to the event path) that holds the per-variant profiles
+RUNS_DIR = ".variant_runs"
+
+
+def get_profile():
+    config = ConfigObj(str(PROFILE_CONF))
+    return config["profiles"][config["profile"]]
+
+
+def make_variant_env(eventid, variant_dir, run_dir, profile):
+    """
+    Build an isolated ShakeMap profile for one variant.
+    Args:
+        eventid: ComCat event id.
+        variant_dir: Directory of the variant (e.g. EVENTPATH/np1).
+        run_dir: Scratch directory for the variant's profile.
+        profile: Section of the real profiles.conf for the active profile.
+    Returns:
+        Environment for subprocesses, with HOME pointing at the private profile.
+    """
+    home = run_dir / "home"
+    data_path = run_dir / "data"
+    if run_dir.exists():
+        shutil.rmtree(run_dir)
+    (home / ".shakemap").mkdir(parents=True)
+    (data_path / eventid).mkdir(parents=True)
+    (data_path / eventid / "current").symlink_to(variant_dir.resolve())
+
+    # Everything else in HOME (e.g. ~/.strec for the select module) is shared
+    real_home = pathlib.Path.home()
+    for entry in real_home.iterdir():
+        if entry.name != ".shakemap":
+            (home / entry.name).symlink_to(entry)
+
+    config = ConfigObj()
+    config.filename = str(home / ".shakemap" / "profiles.conf")
+    config["profile"] = "variant"
+    config["profiles"] = {
+        "variant": {
+            "install_path": profile["install_path"],
+            "data_path": str(data_path),
+        }
+    }
+    config.write()
+
+    env = os.environ.copy()
+    env["HOME"] = str(home)
+    return env
+
+
+def run_shake(eventid, modules, variant_dir, env):
+    """
+    Run "shake" for one variant, logging to VARIANT_DIR/log.txt.
+    """
+    with open(variant_dir / "log.txt", "wt") as log:
+        result = subprocess.run(
+            ["shake", eventid, *modules],
+            cwd=variant_dir,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"shake failed for {variant_dir.name}, see {variant_dir / 'log.txt'}")
+
+
+def collect_products(variant_dir, copy_model_conf=False):
+    """
+    Move rupt_quads.txt and the log into the variant's products/ directory.
+    """
+    products = variant_dir / "products"
+    products.mkdir(exist_ok=True)
+    if (variant_dir / "rupt_quads.txt").exists():
+        shutil.move(variant_dir / "rupt_quads.txt", products / "rupt_quads.txt")
+    if copy_model_conf:
+        shutil.copy(variant_dir / "model.conf", products / "model.conf")
+    if (variant_dir / "log.txt").exists():
+        shutil.move(variant_dir / "log.txt", products / "log.txt")
+
+
+def new_variant_dir(eventpath, name):
+    """
+    Recreate EVENTPATH/NAME with the sm_create event.xml.
+    """
+    variant_dir = eventpath / name
+    if variant_dir.exists():
+        print(f"Directory {name} already exists. Deleting {name} directory.")
+        shutil.rmtree(variant_dir)
+    variant_dir.mkdir()
+    shutil.copy(eventpath / "sm_create_input" / "event.xml", variant_dir)
+    return variant_dir
+
+
+def is_current(variant_dir, digests, force):
+    """
+    True if the variant already finished with the same inputs.
+    """
+    if not force and stage_cache.is_complete(variant_dir, digests):
+        print(f"[INFO] {variant_dir.name} is complete and its inputs are unchanged. Skipping.")
+        return True
+    return False
+
+
+def run_pointsource(eventid, eventpath, profile, force=False):
+    variant_dir = eventpath / "ffsimmer_pointsource"
+    digests = stage_cache.input_digests({
+        "event.xml": eventpath / "sm_create_input" / "event.xml",
+        "command": " ".join(SHAKE_MODULES),
+    })
+    if is_current(variant_dir, digests, force):
+        return variant_dir
+    variant_dir = new_variant_dir(eventpath, variant_dir.name)
+    env = make_variant_env(eventid, variant_dir, eventpath / RUNS_DIR / variant_dir.name, profile)
+    run_shake(eventid, SHAKE_MODULES, variant_dir, env)
+    collect_products(variant_dir)
+    stage_cache.mark_complete(variant_dir, variant_dir.name, digests)
+    return variant_dir
+
+
+def run_nodal_plane(eventid, eventpath, profile, name, strike, dip, force=False):
+    variant_dir = eventpath / name
+    model_conf = model_conf_text(FFSIM_NSIM, FFSIM_TRUE_GRID, strike, dip)
+    digests = stage_cache.input_digests({
+        "event.xml": eventpath / "sm_create_input" / "event.xml",
+        "model.conf": model_conf,
+        "command": " ".join(SHAKE_MODULES),
+    })
+    if is_current(variant_dir, digests, force):
+        return variant_dir
+    variant_dir = new_variant_dir(eventpath, name)
+    write_model_conf(variant_dir / "model.conf", FFSIM_NSIM, FFSIM_TRUE_GRID, strike, dip)
+    env = make_variant_env(eventid, variant_dir, eventpath / RUNS_DIR / variant_dir.name, profile)
+    run_shake(eventid, SHAKE_MODULES, variant_dir, env)
+    collect_products(variant_dir, copy_model_conf=True)
+    stage_cache.mark_complete(variant_dir, name, digests)
+    return variant_dir
+
+
+def run_slab2(eventid, eventpath, profile, force=False):
+    variant_dir = eventpath / "slab2"
+    variant_dir.mkdir(exist_ok=True)
+    env = make_variant_env(eventid, variant_dir, eventpath / RUNS_DIR / variant_dir.name, profile)
+    # STREC results are only reused for the same origin
+    event_xml = eventpath / "sm_create_input" / "event.xml"
+    if not (variant_dir / "event.xml").exists() or (
+        stage_cache.sha256_file(variant_dir / "event.xml") != stage_cache.sha256_file(event_xml)
+    ):
+        shutil.copy(event_xml, variant_dir)
+        (variant_dir / "strec_results.json").unlink(missing_ok=True)
+    if (variant_dir / "strec_results.json").exists():
+        print("[INFO] Using existing STREC results")
+    else:
+        run_shake(eventid, ["select"], variant_dir, env)
+    with open(variant_dir / "strec_results.json") as fobj:
+        strec = json.load(fobj)
+    print(f"     SLAB2_STRIKE: {strec['SlabModelStrike']}")
+    print(f"     SLAB2_DIP: {strec['SlabModelDip']}")
+    strike, dip = strec["SlabModelStrike"], strec["SlabModelDip"]
+
+    digests = stage_cache.input_digests({
+        "event.xml": variant_dir / "event.xml",
+        "strec_results.json": variant_dir / "strec_results.json",
+        "model.conf": model_conf_text(FFSIM_NSIM, FFSIM_TRUE_GRID, strike, dip),
+        "command": " ".join(SHAKE_MODULES),
+    })
+    if is_current(variant_dir, digests, force):
+        return variant_dir
+    stage_cache.clear(variant_dir)
+    write_model_conf(variant_dir / "model.conf", FFSIM_NSIM, FFSIM_TRUE_GRID, strike, dip)
+    run_shake(eventid, SHAKE_MODULES, variant_dir, env)
+    collect_products(variant_dir, copy_model_conf=True)
+    stage_cache.mark_complete(variant_dir, variant_dir.name, digests)
+    return variant_dir
+
+
+def run_reproduction(eventid, eventpath, profile, force=False):
+    variant_dir = eventpath / "shakemap_reproduction"
+    alternate = eventpath / "shakemap_fault.txt"
+    if alternate.exists():
+        modules = ["assemble", "-c", "rupture config", "model", "rupture", "contour", "mapping", "info", "gridxml", "raster"]
+    else:
+        modules = SHAKE_MODULES
+
+    # Everything from sm_create (event.xml, rupture.json, station files, ...) is an input
+    inputs = {
+        str(path.relative_to(eventpath)): path
+        for path in sorted((eventpath / "sm_create_input").rglob("*"))
+        if path.is_file()
+    }
+    inputs["shakemap_fault.txt"] = alternate
+    inputs["command"] = " ".join(modules)
+    digests = stage_cache.input_digests(inputs)
+    if is_current(variant_dir, digests, force):
+        return variant_dir
+
+    if variant_dir.exists():
+        print("Directory shakemap_reproduction already exists. Deleting shakemap_reproduction directory.")
+        shutil.rmtree(variant_dir)
+    shutil.copytree(eventpath / "sm_create_input", variant_dir)
+    env = make_variant_env(eventid, variant_dir, eventpath / RUNS_DIR / variant_dir.name, profile)
+
+    # Check if alternate rupture file exists
+    if alternate.exists():
+        print("Using alternate ShakeMap Polygon File (shakemap_fault.txt)")
+        (variant_dir / "rupture.json").unlink(missing_ok=True)
+        shutil.copy(alternate, variant_dir)
+        run_shake(eventid, modules, variant_dir, env)
+        shutil.copy(variant_dir / "products" / "rupture.json", variant_dir / "rupture.json")
+    else:
+        run_shake(eventid, modules, variant_dir, env)
+    collect_products(variant_dir)
+    stage_cache.mark_complete(variant_dir, variant_dir.name, digests)
+    return variant_dir
+
+
+def get_nodal_planes(eventid, eventpath):
+    """
+    Fetch the moment tensor and return the NP1 and NP2 (strike, dip, rake).
+    """
+    output = subprocess.run(
+        [sys.executable, str(SOFTPATH / "get-moment-tensor" / "getMomentTensor.py"), eventid, str(eventpath)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    values = [float(value) for value in output[-6:]]
+    return values[:3], values[3:]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the ffsimmer ShakeMap variants for an event concurrently."
+    )
+    parser.add_argument("eventid", help="ComCat event ID")
+    parser.add_argument("-u", "--unconstrained", action="store_true", help="run unconstrained (ffsimmer_pointsource)")
+    parser.add_argument("-c", "--constrained", action="store_true", help="run constrained (NP1/NP2)")
+    parser.add_argument("-r", "--reproduction", action="store_true", help="run reproduction")
+    parser.add_argument("-s", "--subduction", action="store_true", help="run subduction interface constraint")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="Maximum number of variants to run at once (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true",
+        help="Re-run the selected variants even if their inputs are unchanged",
+    )
+    args = parser.parse_args()
+    if not (args.unconstrained or args.constrained or args.reproduction or args.subduction):
+        parser.error("No variants selected.")
+
+    eventid = args.eventid
+    profile = get_profile()
+    eventpath = pathlib.Path(profile["data_path"]) / eventid
+    eventpath.mkdir(parents=True, exist_ok=True)
+
+    # sm_create uses the shared "current" directory, so it runs before anything else
+    if (eventpath / "current").is_symlink() or (eventpath / "current").exists():
+        print(f"Directory {eventpath}/current already exists. Deleting current directory.")
+        if (eventpath / "current").is_symlink():
+            (eventpath / "current").unlink()
+        else:
+            shutil.rmtree(eventpath / "current")
+    if (eventpath / "sm_create_input" / "event.xml").exists():
+        print("sm_create has already been run. Skipping")
+    else:
+        print("Running sm_create")
+        subprocess.run(["sm_create", eventid], check=True)
+        shutil.move(eventpath / "current", eventpath / "sm_create_input")
+
+    # Each variant decides for itself whether its inputs changed since it last completed
+    jobs = {}
+    if args.reproduction:
+        jobs["shakemap_reproduction"] = (run_reproduction, eventid, eventpath, profile, args.force)
+    if args.unconstrained:
+        jobs["ffsimmer_pointsource"] = (run_pointsource, eventid, eventpath, profile, args.force)
+    if args.constrained:
+        np1, np2 = get_nodal_planes(eventid, eventpath)
+        print(f"NP1 strike, dip rake: {np1[0]} {np1[1]} {np1[2]}")
+        for name, (strike, dip, _) in (("np1", np1), ("np2", np2)):
+            jobs[name] = (run_nodal_plane, eventid, eventpath, profile, name, strike, dip, args.force)
+    if args.subduction:
+        jobs["slab2"] = (run_slab2, eventid, eventpath, profile, args.force)
+
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {}
+        for name, (func, *func_args) in jobs.items():
+            print(f"[INFO] Starting {name}")
+            futures[pool.submit(func, *func_args)] = name
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                variant_dir = future.result()
+                print(f"[INFO] {name} finished. Products in {variant_dir / 'products'}")
+            except Exception as e:
+                print(f"[ERROR] {name} failed: {e}")
+                failed.append(name)
+
+    shutil.rmtree(eventpath / RUNS_DIR, ignore_errors=True)
+    if failed:
+        sys.exit(f"Failed variants: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
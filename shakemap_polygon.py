@@ -5,6 +5,7 @@
 
 import argparse
 import datetime
+import itertools
 import pathlib
 import sys
 import typing
@@ -15,6 +16,8 @@ import numpy.typing as npt
 SM_PROFILE = pathlib.Path.home() / ".shakemap" / "profiles.conf"
 # 2021-10-25 17:04:20
 TIMESTR = "%Y-%m-%d %H:%M:%S"
+# fraction of slip kept when trimming segment edges
+RETAIN_FRACTION = 0.9
 
 FLOATPAT = r"[-+]?[0-9]*\.?[0-9]*"
 COLUMNS = [
@@ -58,6 +61,35 @@ def counterclockwise_sort(points: list) -> list:
     return sorted(points, key=angle_to_center)
 
 
+def trim_index(slip_sum: npt.NDArray, retain_fraction: float) -> int:
+    """
+    Find how far to trim a slip profile symmetrically from both ends.
+
+    Equivalent to growing k from 1 until profile[k:-1-k] holds no more than
+    retain_fraction of the total slip, but computed from a single cumulative
+    sum instead of re-summing shrinking slices.
+
+    Args:
+        slip_sum (np.array):
+            1D slip profile (slip summed along rows or columns).
+        retain_fraction (float):
+            Fraction of the total slip used as the trimming threshold.
+    Returns:
+        int:
+            The first k that meets the threshold; the trimmed edges are at
+            indices k - 1 and -k. Returns 1 (no trimming) if the profile has
+            no slip.
+    """
+    total = slip_sum.sum(dtype=np.float64)
+    if total <= 0:
+        return 1
+    n = len(slip_sum)
+    csum = np.concatenate(([0.0], np.cumsum(slip_sum, dtype=np.float64)))
+    k = np.arange(1, n + 1)
+    kept = csum[np.maximum(n - 1 - k, k)] - csum[k]
+    return int(k[np.argmax(kept / total <= retain_fraction)])
+
+
 class ShakeRupture:
     def __init__(self, eventid: str, fsp_file: pathlib.Path) -> None:
         """
@@ -79,6 +111,11 @@ class ShakeRupture:
         """
         Read an FSP format file and return segment data/metadata.
 
+        The file is walked once: header lines update the current segment and
+        the numeric block that follows them is converted in one bulk call and
+        organized into the segment's record array, without seeking back to the
+        start of the file for each segment.
+
         Args:
             fobj (File-like object):
                 Open fsp file.
@@ -86,80 +123,83 @@ class ShakeRupture:
            list:
                 List of segment dictionaries, including metadata and data.
         """
-        # read the header information for the segments
-        segments = self.read_fsp_headers(fobj)
-        # now populate the segments with arrays of data
-        for segment in segments:
-            fobj.seek(0)
+        segments = []
+        segment: dict[str, typing.Any] = {}
+        spacing: dict[str, typing.Any] = {"dx": None, "dz": None}
+        nlines = 0
+        for line in fobj:
+            nlines += 1
+            if line.startswith("%"):
+                self.parse_header_line(line.strip("%").strip(), segment, spacing)
+                continue
+            if not len(segment):
+                continue
+
+            # first data line of a segment, read the rest of its block
+            segment["dx"] = spacing["dx"]
+            segment["dz"] = spacing["dz"]
+            segment["nlines"] = nlines - 1
+            segment["nx"] = int(segment["length"] / segment["dx"])
+            segment["nz"] = int(segment["width"] / segment["dz"])
             nrows = segment["nx"] * segment["nz"]
-            data = np.loadtxt(fobj, skiprows=segment["nlines"], max_rows=nrows)
-            data_array = self.organize_data(data, segment["nx"], segment["nz"])
-            segment["data"] = data_array
+            block = line + "".join(itertools.islice(fobj, nrows - 1))
+            nlines += nrows - 1
+            values = np.fromstring(block, sep=" ")
+            if values.size % nrows:
+                raise ValueError(
+                    f"Segment {segment['segment']}: expected {nrows} rows of data"
+                )
+            data = values.reshape((nrows, -1))
+            segment["data"] = self.organize_data(data, segment["nx"], segment["nz"])
+            segments.append(segment)
+            segment = {}
         return segments
 
-    def read_fsp_headers(self, fobj: typing.TextIO) -> list[dict[str, typing.Any]]:
+    def parse_header_line(
+        self,
+        commline: str,
+        segment: dict[str, typing.Any],
+        spacing: dict[str, typing.Any],
+    ) -> None:
         """
-        Read FSP format headers and return segment metadata.
+        Update segment metadata from a single FSP header line.
 
         Args:
-            fobj (File-like object):
-                Open fsp file.
+            commline (str):
+                Header line with the leading "%" removed.
+            segment (dict):
+                Metadata of the segment currently being read, updated in place.
+            spacing (dict):
+                Subfault spacing ("dx", "dz"), shared by all segments and
+                updated in place.
         Returns:
-           list:
-                List of segment dictionaries with metadata.
+           None
         """
-        segments = []
-        segment: dict[str, typing.Any] = {}
-        dx = None
-        dz = None
-        nlines = 0
-        for line in fobj.readlines():
-            nlines += 1
-            if not line.startswith("%"):  # end of segment
-                if len(segment):
-                    segment["dx"] = dx
-                    segment["dz"] = dz
-                    segment["nlines"] = nlines - 1
-                    segment["nx"] = int(segment["length"] / segment["dx"])
-                    segment["nz"] = int(segment["width"] / segment["dz"])
-                    segments.append(segment.copy())
-                    segment = {}
-                    continue
-                else:
-                    continue
-
-            commline = line.strip("%").strip()
-            if commline.startswith("Invs : Dx"):
-                parts = commline.split(":")[1].split()
-                dx = float(parts[2])
-                dz = float(parts[6])
-                continue
-            if commline.startswith("Size"):
-                parts = commline.split()
-                segment["segment"] = 1
-                segment["length"] = float(parts[4])
-                segment["width"] = float(parts[8])
-                continue
-            if commline.startswith("SEGMENT"):
-                parts = commline.split(":")
-                segment["segment"] = int(parts[0].split()[-1])
-                angleparts = parts[1].strip().split()
-                segment["strike"] = float(angleparts[2])
-                segment["dip"] = float(angleparts[6])
-                continue
-            if commline.startswith("LEN"):
-                parts = commline.split()
-                segment["length"] = float(parts[2])
-                segment["width"] = float(parts[6])
-                continue
-            if commline.startswith("hypocenter"):
-                parts = commline.split(":")[1].split(",")
-                xstring = parts[0].split("=")[1].strip()
-                ystring = parts[1].split("=")[1].strip()
-                segment["hypo_x"] = float(xstring)
-                segment["hypo_y"] = float(ystring)
-                continue
-        return segments
+        if commline.startswith("Invs : Dx"):
+            parts = commline.split(":")[1].split()
+            spacing["dx"] = float(parts[2])
+            spacing["dz"] = float(parts[6])
+        elif commline.startswith("Size"):
+            parts = commline.split()
+            segment["segment"] = 1
+            segment["length"] = float(parts[4])
+            segment["width"] = float(parts[8])
+        elif commline.startswith("SEGMENT"):
+            parts = commline.split(":")
+            segment["segment"] = int(parts[0].split()[-1])
+            angleparts = parts[1].strip().split()
+            segment["strike"] = float(angleparts[2])
+            segment["dip"] = float(angleparts[6])
+        elif commline.startswith("LEN"):
+            parts = commline.split()
+            segment["length"] = float(parts[2])
+            segment["width"] = float(parts[6])
+        elif commline.startswith("hypocenter"):
+            parts = commline.split(":")[1].split(",")
+            xstring = parts[0].split("=")[1].strip()
+            ystring = parts[1].split("=")[1].strip()
+            segment["hypo_x"] = float(xstring)
+            segment["hypo_y"] = float(ystring)
 
     def organize_data(
         self, data: npt.NDArray, nx: int, ny: int
@@ -184,20 +224,29 @@ class ShakeRupture:
             data_array[column] = data[:, icol].reshape((ny, nx))
         return data_array
 
-    def write_rupture(self, event_path: pathlib.Path) -> pathlib.Path:
+    def write_rupture(
+        self,
+        event_path: pathlib.Path,
+        retain_fraction: float = RETAIN_FRACTION,
+        filename: str = "shakemap_polygon.txt",
+    ) -> pathlib.Path:
         """
         Write ShakeMap compatible polygon text file with trimmed edges.
 
         Args:
             event_path (pathlib.Path):
                 Path to directory where finite fault event products should be written.
+            retain_fraction (float):
+                Slip fraction threshold used to trim the segment edges.
+            filename (str):
+                Name of the polygon text file.
         Returns:
            pathlib.Path:
                 Path to polygon text file.
         """
-        polygon_file = pathlib.Path(event_path) / "shakemap_polygon.txt"
+        polygon_file = pathlib.Path(event_path) / filename
         tnow = datetime.datetime.now()
-        ordered_points = self.get_segment_corners()
+        ordered_points, _ = self.get_segment_corners(retain_fraction)
         with open(polygon_file, "wt") as fobj:
             fobj.write("# Source: USGS NEIC Rapid Finite Fault\n")
             fobj.write(f"# Eventid: {self.eventid}\n")
@@ -212,15 +261,29 @@ class ShakeRupture:
 
         return polygon_file
 
-    def get_segment_corners(self) -> dict:
+    def get_segment_corners(
+        self, retain_fraction: float = RETAIN_FRACTION
+    ) -> tuple[dict, dict]:
         """
-        Write ShakeMap compatible polygon text file with trimmed edges.
+        Find the trimmed corners of each fault segment.
 
+        Rows and columns are trimmed symmetrically from both edges of the
+        segment until the remaining cells hold no more than retain_fraction of
+        the total slip.
+
+        Args:
+            retain_fraction (float):
+                Fraction of the segment's slip used as the trimming threshold.
         Returns:
-           list:
+           dict:
                 lon/lat/depth coordinates denoting trimmed corners of fault segments.
+           dict:
+                Per-segment trim diagnostics: fraction of slip retained inside
+                the trimmed corners and the number of rows/columns trimmed
+                from each edge.
         """
         segdict = {}
+        diagnostics = {}
         for segment in self.segments:
             slip = segment["data"]["slip"]
             latitude = segment["data"]["latitude"]
@@ -228,27 +291,13 @@ class ShakeRupture:
             depth = segment["data"]["depth"]
             total_slip = slip.sum()
 
-            slip_row_sum = slip.sum(axis=0)
-            trim_sum = slip_row_sum.sum()
-            colidx = 0
-            while trim_sum / total_slip > 0.9:
-                colidx += 1
-                leftedge = colidx
-                rightedge = -1 - colidx
-                trim_sum = slip_row_sum[leftedge:rightedge].sum()
-            leftedge -= 1
-            rightedge += 1
-
-            slip_col_sum = slip.sum(axis=1)
-            trim_sum = slip_col_sum.sum()
-            rowidx = 0
-            while trim_sum / total_slip > 0.9:
-                rowidx += 1
-                bottomedge = rowidx
-                topedge = -1 - rowidx
-                trim_sum = slip_col_sum[bottomedge:topedge].sum()
-            bottomedge -= 1
-            topedge += 1
+            colidx = trim_index(slip.sum(axis=0), retain_fraction)
+            leftedge = colidx - 1
+            rightedge = -colidx
+
+            rowidx = trim_index(slip.sum(axis=1), retain_fraction)
+            bottomedge = rowidx - 1
+            topedge = -rowidx
 
             lat_corner1 = latitude[bottomedge, leftedge]
             lat_corner2 = latitude[bottomedge, rightedge]
@@ -274,7 +323,19 @@ class ShakeRupture:
                 ]
             )
             segdict[segment["segment"]] = ordered_points
-        return segdict
+
+            nz, nx = slip.shape
+            retained = slip[bottomedge : nz - rowidx + 1, leftedge : nx - colidx + 1]
+            diagnostics[segment["segment"]] = {
+                "retained_slip": float(retained.sum() / total_slip),
+                "trimmed_cols": int(colidx - 1),
+                "trimmed_rows": int(rowidx - 1),
+                "nx": int(nx),
+                "nz": int(nz),
+                "nx_trimmed": int(retained.shape[1]),
+                "nz_trimmed": int(retained.shape[0]),
+            }
+        return segdict, diagnostics
 
 def main():
     # executes only if the script is called from the command line
@@ -284,6 +345,12 @@ def main():
     parser.add_argument("eventid", help="ComCat event ID")
     parser.add_argument("fsp_file", help="Path to FSP file")
     parser.add_argument("output_dir", help="Directory to write shakemap_polygon.txt")
+    parser.add_argument(
+        "--retain-fraction",
+        type=float,
+        default=RETAIN_FRACTION,
+        help=f"Slip fraction threshold for trimming segment edges (default: {RETAIN_FRACTION})",
+    )
 
     args = parser.parse_args()
 
@@ -291,7 +358,7 @@ def main():
     output_path = pathlib.Path(args.output_dir)
 
     rupture = ShakeRupture(args.eventid, fsp_path)
-    polygon_file = rupture.write_rupture(output_path)
+    polygon_file = rupture.write_rupture(output_path, args.retain_fraction)
 
     print(f"Wrote polygon file to: {polygon_file}")
 
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+# Convert many FSP finite-fault files to ShakeMap polygon files in one process
+# pool, instead of starting a new interpreter per event.
+#
+# Example usage:
+# python /Users/hyin/soft/shakemap-postprocess-tools/shakemap_polygon_batch.py \
+#     /Users/hyin/shakemap_profiles/default/data/ --summary fsp_summary.csv
+
+import argparse
+import concurrent.futures
+import csv
+import os
+import pathlib
+
+from shakemap_polygon import RETAIN_FRACTION, ShakeRupture
+
+FSP_PATTERN = "*complete_inversion.fsp"
+SUMMARY_FIELDS = [
+    "eventid",
+    "fsp_file",
+    "polygon_file",
+    "status",
+    "n_segments",
+    "segment",
+    "nx",
+    "nz",
+    "nx_trimmed",
+    "nz_trimmed",
+    "length_km",
+    "width_km",
+    "retained_slip",
+]
+
+
+def find_fsp_files(paths: list[str]) -> list[pathlib.Path]:
+    """
+    Expand a list of FSP files and/or directories into FSP files.
+
+    Args:
+        paths (list):
+            FSP files, or directories that are searched recursively for
+            files matching FSP_PATTERN.
+    Returns:
+        list:
+            Sorted, de-duplicated list of FSP file paths.
+    """
+    fsp_files = set()
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            fsp_files.update(path.rglob(FSP_PATTERN))
+        else:
+            fsp_files.add(path)
+    return sorted(fsp_files)
+
+
+def eventid_from_fsp(fsp_file: pathlib.Path) -> str:
+    """
+    ComCat event id from an FSP file name (e.g. us6000dher_us_1_complete_inversion.fsp).
+    """
+    return fsp_file.name.split("_")[0]
+
+
+def is_up_to_date(fsp_file: pathlib.Path, polygon_file: pathlib.Path) -> bool:
+    """
+    True if the polygon file exists and is newer than the FSP file.
+    """
+    return (
+        polygon_file.exists()
+        and polygon_file.stat().st_mtime >= fsp_file.stat().st_mtime
+    )
+
+
+def convert_fsp(
+    fsp_file: pathlib.Path,
+    output_dir: pathlib.Path,
+    filename: str,
+    retain_fraction: float,
+    force: bool = False,
+) -> list[dict]:
+    """
+    Convert one FSP file and return its summary rows.
+
+    Errors are recorded in the status column instead of raised, so one bad
+    file does not stop the rest of the batch.
+
+    Args:
+        fsp_file (pathlib.Path):
+            Path to the FSP file.
+        output_dir (pathlib.Path):
+            Directory to write the polygon file to.
+        filename (str):
+            Name of the polygon file.
+        retain_fraction (float):
+            Slip fraction threshold used to trim the segment edges.
+        force (bool):
+            Convert even if the polygon file is newer than the FSP file.
+    Returns:
+        list:
+            One summary row per segment (a single row if failed).
+    """
+    eventid = eventid_from_fsp(fsp_file)
+    polygon_file = output_dir / filename
+    row = {
+        "eventid": eventid,
+        "fsp_file": str(fsp_file),
+        "polygon_file": str(polygon_file),
+    }
+    # Up-to-date files are still parsed (cheap) so their summary rows are complete
+    skip = not force and is_up_to_date(fsp_file, polygon_file)
+    status = "skipped" if skip else "converted"
+
+    try:
+        rupture = ShakeRupture(eventid, fsp_file)
+        if not rupture.segments:
+            return [{**row, "status": "failed: no segments found"}]
+        if not skip:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            rupture.write_rupture(output_dir, retain_fraction, filename)
+        _, diagnostics = rupture.get_segment_corners(retain_fraction)
+    except Exception as e:
+        return [{**row, "status": f"failed: {e}"}]
+
+    # corners sit at subfault centers, so the polygon spans (n - 1) cells
+    spacing = {segment["segment"]: segment for segment in rupture.segments}
+    rows = []
+    for segid, diag in diagnostics.items():
+        rows.append(
+            {
+                **row,
+                "status": status,
+                "n_segments": len(diagnostics),
+                "segment": segid,
+                "nx": diag["nx"],
+                "nz": diag["nz"],
+                "nx_trimmed": diag["nx_trimmed"],
+                "nz_trimmed": diag["nz_trimmed"],
+                "length_km": (diag["nx_trimmed"] - 1) * spacing[segid]["dx"],
+                "width_km": (diag["nz_trimmed"] - 1) * spacing[segid]["dz"],
+                "retained_slip": f"{diag['retained_slip']:.4f}",
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate ShakeMap polygon files from many FSP inputs in parallel."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help=f"FSP files and/or directories to search for {FSP_PATTERN}",
+    )
+    parser.add_argument(
+        "--output-root",
+        default=None,
+        help="Write each polygon file to OUTPUT_ROOT/EVENTID/ (default: next to the FSP file)",
+    )
+    parser.add_argument(
+        "--filename",
+        default="shakemap_polygon.txt",
+        help="Name of the polygon file (default: shakemap_polygon.txt)",
+    )
+    parser.add_argument(
+        "--retain-fraction",
+        type=float,
+        default=RETAIN_FRACTION,
+        help=f"Slip fraction threshold for trimming segment edges (default: {RETAIN_FRACTION})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--summary",
+        default="fsp_polygon_summary.csv",
+        help="Path to the CSV summary table (default: fsp_polygon_summary.csv)",
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="Convert even if the output is up to date"
+    )
+    args = parser.parse_args()
+
+    fsp_files = find_fsp_files(args.paths)
+    if not fsp_files:
+        parser.error("No FSP files found.")
+
+    rows = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {}
+        for fsp_file in fsp_files:
+            if args.output_root is not None:
+                output_dir = pathlib.Path(args.output_root) / eventid_from_fsp(fsp_file)
+            else:
+                output_dir = fsp_file.parent
+            future = pool.submit(
+                convert_fsp,
+                fsp_file,
+                output_dir,
+                args.filename,
+                args.retain_fraction,
+                args.force,
+            )
+            futures[future] = fsp_file
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            print(f"{result[0]['eventid']}: {result[0]['status']}")
+            rows.extend(result)
+
+    rows.sort(key=lambda row: (row["eventid"], row.get("segment", 0)))
+    with open(args.summary, "wt", newline="") as fobj:
+        writer = csv.DictWriter(fobj, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Wrote summary table to: {args.summary}")
+
+
+if __name__ == "__main__":
+    main()
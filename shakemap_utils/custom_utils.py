@@ -1,17 +1,18 @@
 import pandas as pd
 import pygmt
 import os
-import math
 import numpy as np
 import argparse
 from shapely.geometry import Point, LineString
 from pathlib import Path
 import xml.etree.ElementTree as ET
 import json
+import functools
 
 def haversine(lat1, lon1, lat2, lon2):
     """
     Calculate the great-circle distance between two points on the Earth.
+    Works element-wise on NumPy arrays or DataFrame columns as well as scalars.
     Args:
         lat1, lon1: Latitude and longitude of point 1 in decimal degrees.
         lat2, lon2: Latitude and longitude of point 2 in decimal degrees.
@@ -19,14 +20,44 @@ def haversine(lat1, lon1, lat2, lon2):
         Distance in kilometers.
     """
     R = 6371.0  # Radius of the Earth in kilometers
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
     dlat = lat2 - lat1
     dlon = lon2 - lon1
-    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
     return R * c
 
 
+def rupture_dimensions(corners):
+    """
+    Calculate the dimensions of every rupture realization at once.
+    Length is the great-circle distance along the updip edge (p1-p2). Width combines
+    the surface distance p1-p4 with the depth of p4, as in the original per-row
+    calculation; dip uses the depth difference p4-p1, so for ruptures whose top is
+    not at the surface the two disagree.
+    Args:
+        corners: float array of shape (n_ruptures, 4, 3) with (lat, lon, depth) of
+            corners p1..p4 (see ruptquads.read_ruptquads).
+    Returns:
+        Dict of arrays (one value per realization): fault_length_km, fault_width_km,
+        fault_dip_deg, fault_area_km2 and aspect_ratio. Can be passed straight to
+        DataFrame.assign.
+    """
+    corners = np.asarray(corners, dtype=np.float64)
+    p1, p2, p4 = corners[:, 0], corners[:, 1], corners[:, 3]
+    length = haversine(p1[:, 0], p1[:, 1], p2[:, 0], p2[:, 1])
+    horizontal = haversine(p1[:, 0], p1[:, 1], p4[:, 0], p4[:, 1])
+    width = np.sqrt(horizontal**2 + p4[:, 2]**2)
+    dip = np.degrees(np.arctan2(p4[:, 2] - p1[:, 2], horizontal))
+    return {
+        "fault_length_km": length,
+        "fault_width_km": width,
+        "fault_dip_deg": dip,
+        "fault_area_km2": length * width,
+        "aspect_ratio": length / width,
+    }
+
+
 def parse_ruptjson(file):
     """
     Parse a JSON file containing rupture data.
@@ -66,118 +97,231 @@ def get_geometry_type(json_path):
     geometry_type = features[0]["geometry"]["type"]
     return geometry_type
 
-def dims_from_ruptjson(file):
+# Distance (m) within which ring vertices are taken as shared by two rings
+ADJACENT_TOL = 100.0
+
+# Per-ring result of rupture_segments (lengths in m, depths in km)
+SEGMENT_DTYPE = np.dtype([
+    ("feature", "i4"),
+    ("polygon", "i4"),
+    ("ring", "i4"),
+    ("dip_row", "i4"),        # along-dip level, 0 = top row
+    ("strike_index", "i4"),   # position along strike within the level
+    ("n_top", "i4"),          # top-edge vertices
+    ("strike_length", "f8"),
+    ("dip_length", "f8"),
+    ("z_top", "f8"),
+    ("z_bottom", "f8"),
+])
+
+
+def _rupture_rings(data):
+    """
+    All polygon rings of a rupture GeoJSON dict, with their feature, polygon and ring numbers.
+    Point and line geometries are skipped. Missing z values are 0.
+    """
+    rings, ids = [], []
+    for f, feature in enumerate(data.get("features", [])):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            continue
+        for p, polygon in enumerate(polygons):
+            for r, ring in enumerate(polygon):
+                coords = np.array([(c[0], c[1], c[2] if len(c) > 2 else 0.0) for c in ring], dtype=float)
+                rings.append(coords)
+                ids.append((f, p, r))
+    return rings, ids
+
+
+@functools.lru_cache(maxsize=None)
+def _utm_transformer(epsg):
+    from pyproj import Transformer
+
+    return Transformer.from_crs("EPSG:4326", f"EPSG:{epsg}", always_xy=True)
+
+
+def utm_epsg(lon, lat):
+    """
+    EPSG code of the UTM zone containing a point (WGS84 326xx north, 327xx south).
+    """
+    zone = int((lon + 180) // 6) % 60 + 1
+    return (32600 if lat >= 0 else 32700) + zone
+
+
+def _dip_levels(xyz, ring_of, position, n_top, tol=ADJACENT_TOL):
+    """
+    Along-dip level of every ring from the adjacency of the rings.
+    Ring b is directly below ring a when at least two of its top-edge vertices
+    (all of them for shorter edges) are within tol (m) of bottom-edge vertices
+    of a. The level of a ring is 0 if no ring is above it, else one more than
+    the deepest level above it.
+    """
+    nrings = len(n_top)
+    limit = n_top[ring_of]
+    is_top = position < limit
+    is_bottom = (position >= limit) & (position < 2 * limit)
+    top_idx = np.flatnonzero(is_top)
+    bottom_idx = np.flatnonzero(is_bottom)
+
+    # Top vertices of every ring close to the bottom edge of another ring
+    dist = np.linalg.norm(xyz[top_idx, None, :] - xyz[None, bottom_idx, :], axis=2)
+    t, b = np.nonzero(dist <= tol)
+    below, above = ring_of[top_idx[t]], ring_of[bottom_idx[b]]
+    keep = below != above
+    pairs = np.unique(np.column_stack([top_idx[t][keep], above[keep]]), axis=0)
+    shared = np.zeros((nrings, nrings), dtype=int)
+    np.add.at(shared, (ring_of[pairs[:, 0]], pairs[:, 1]), 1)
+    is_above = shared >= np.minimum(n_top, 2)[:, None]
+
+    level = np.zeros(nrings, dtype=int)
+    for _ in range(nrings):
+        new = np.where(is_above, level[None, :] + 1, 0).max(axis=1, initial=0)
+        if np.array_equal(new, level):
+            break
+        level = new
+    return level
+
+
+def rupture_segments(data):
+    """
+    Along-strike and along-dip dimensions of every ring of a ShakeMap rupture.
+    Every ring is one segment: its top edge (n vertices), the bottom edge in
+    reverse and the first vertex again. All rings are projected to the local
+    UTM zone in one transform (z from km to m), and the lengths are computed
+    on the concatenated coordinate array:
+        - strike_length: 3D length of the top edge,
+        - dip_length: 3D distance from the first top vertex to the bottom
+          vertex below it (the second to last point of the ring).
+    A ring whose top edge lies on the bottom edge of another ring is one
+    along-dip level (dip_row) below it; rings with no ring above them are on
+    level 0. The rings of a level form its along-strike chain, whatever their
+    depth ranges, so along-strike, along-dip and mixed segmentation are all
+    described.
+    Args:
+        data: Rupture GeoJSON dict (e.g. json.load of rupture.json) or path to it.
+    Returns:
+        Structured array with one entry per ring (see SEGMENT_DTYPE). Empty for
+        point sources.
+    """
+    if not isinstance(data, dict):
+        with open(data, "r") as f:
+            data = json.load(f)
+    rings, ids = _rupture_rings(data)
+    segments = np.zeros(len(rings), dtype=SEGMENT_DTYPE)
+    if not rings:
+        return segments
+
+    sizes = np.array([len(ring) for ring in rings])
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    coords = np.concatenate(rings)
+    transformer = _utm_transformer(utm_epsg(coords[:, 0].mean(), coords[:, 1].mean()))
+    x, y = transformer.transform(coords[:, 0], coords[:, 1])
+    xyz = np.column_stack([x, y, coords[:, 2] * 1000.0])
+
+    # Lengths of all consecutive pairs, summed over the top edge of every ring
+    n_top = (sizes - 1) // 2
+    ring_of = np.repeat(np.arange(len(rings)), sizes)
+    position = np.arange(len(coords)) - np.repeat(starts, sizes)
+    steps = np.linalg.norm(np.diff(xyz, axis=0), axis=1)
+    top = (position[:-1] < n_top[ring_of[:-1]] - 1) & (ring_of[:-1] == ring_of[1:])
+    strike_length = np.bincount(ring_of[:-1][top], steps[top], minlength=len(rings))
+    dip_length = np.linalg.norm(xyz[starts] - xyz[starts + sizes - 2], axis=1)
+
+    z_top = np.minimum.reduceat(coords[:, 2], starts)
+    z_bottom = np.maximum.reduceat(coords[:, 2], starts)
+    dip_row = _dip_levels(xyz, ring_of, position, n_top)
+    order = np.lexsort((np.arange(len(rings)), dip_row))
+    strike_index = np.empty(len(rings), dtype=int)
+    strike_index[order] = np.arange(len(rings)) - np.searchsorted(dip_row[order], dip_row[order])
+
+    ids = np.array(ids)
+    segments["feature"], segments["polygon"], segments["ring"] = ids.T
+    segments["dip_row"] = dip_row
+    segments["strike_index"] = strike_index
+    segments["n_top"] = n_top
+    segments["strike_length"] = strike_length
+    segments["dip_length"] = dip_length
+    segments["z_top"] = z_top
+    segments["z_bottom"] = z_bottom
+    return segments
+
+
+def rupture_length_width(segments):
+    """
+    Total length and width of a rupture from its segments (rupture_segments).
+    The length is the along-strike length of a level (the sum over its
+    segments), averaged over the along-dip levels; the width is the sum over
+    the levels of their mean down-dip width.
+    Returns:
+        length, width in meters (NaN for point sources).
+    """
+    if len(segments) == 0:
+        return float("nan"), float("nan")
+    nrows = segments["dip_row"].max() + 1
+    row_length = np.bincount(segments["dip_row"], segments["strike_length"], minlength=nrows)
+    row_width = np.bincount(segments["dip_row"], segments["dip_length"], minlength=nrows)
+    row_count = np.bincount(segments["dip_row"], minlength=nrows)
+    return float(row_length.mean()), float((row_width / row_count).sum())
+
+
+def dims_from_ruptjson(file, verbose=True):
     """
     Parse a JSON file containing rupture data and calculate the length and width of the rupture.
+    Handles single and multi-segment ruptures, along strike (e.g. Türkiye),
+    along dip (e.g. Kamchatka, 2004 Sumatra) or both (see rupture_segments).
     Args:
         file: Path to the JSON file.
+        verbose: Print the dimensions.
     Returns:
-        length and width of the rupture in meters. 
+        length and width of the rupture in meters (NaN for point sources).
     """
-    import geopandas as gpd
-    import pandas as pd
-    import numpy as np
-    from shapely.ops import transform
-    # json_path = '/Users/hyin/shakemap_profiles/default/data/us6000f65h/shakemap_reproduction/rupture.json'      # single segment
-    # json_path = '/Users/hyin/shakemap_profiles/default/data/us6000jllz/shakemap_reproduction/rupture.json'    # multi-segment along-strike (Türkiye)
-    # json_path = '/Users/hyin/shakemap_profiles/default/data/us6000qw60/shakemap_reproduction/rupture.json'      # multi-segment along-dip (Kamchatka)
-    # json_path = '/Users/hyin/shakemap_profiles/default/data/official20041226005853450_30/rupture.json'    # 2004 Sumatra (multi-segment along-dip)
-
-    # Check if the geometry type is a point, MultiPolygon or something else?
-    type = get_geometry_type(file)
-    if type == 'Point': 
-        print (f"Geometry type: {type}, SKIPPING")
-        length=float('nan')
-        width=float('nan')
-    else: 
-        gdf = gpd.read_file(file)
-        # Estimate appropriate UTM CRS
-        utm_crs = gdf.estimate_utm_crs()
-
-        # Reproject to meters (this drops Z, so we'll reattach it manually later)
-        gdf_utm = gdf.to_crs(utm_crs)
-        def scale_z(x, y, z=None):
-            if z is None:
-                return (x, y)
-            return (x, y, z * 1000.0)
-
-        # Convert the Z coordinate from km to m
-        gdf_utm["geometry"] = gdf_utm["geometry"].apply(
-            lambda geom: transform(scale_z, geom)
-        )
-
-        geom = gdf_utm.geometry.iloc[0]
-
-        dip_segment_id = 0
-        along_dip_counts = 0   # number of rings per polygon
-        top_edges = []          # for detecting along-strike segmentation
-        rows = []
-
-        for poly in geom.geoms:
-            # collect all rings (exterior + interiors)
-            # For ShakeMap rupture.json files, each ring corresponds to a unique segment, 
-            # but can be either along-strike segements (usually representing a discontinuous fault) or along-dip (usually representing a subduction interface)
-            # each ring can contain a complex geometry with many top-edge vertices, so we calculate along-strike length 
-            rings = [poly.exterior] + list(poly.interiors)
-            print(f"Number of rings {len(rings)}")
-            
-            total_length = 0
-            total_width = 0
-            for ring in rings:
-                coords = list(ring.coords)  # pull coordinates for each ring
-                along_strike_segments = (((len(coords) -1)/2)) -1
-                print(f"Along-strike segments {int(along_strike_segments)}")
-                # Calc along-dip length
-                dip_length = 0
-                # Find the two points that deliniate along-dip vector
-                dip_length += np.linalg.norm(np.array(coords[0]) - np.array(coords[-2]))
-                # Calc along-strike length
-                strike_length = 0
-                for i in range(int(along_strike_segments)): 
-                    strike_length += np.linalg.norm(np.array(coords[i+1]) - np.array(coords[i]))
-                for j, (x, y, z) in enumerate(coords):
-                    rows.append({
-                        "dip_segment_id": dip_segment_id,
-                        "vertex_id": j,
-                        "x": x,
-                        "y": y,
-                        "z": z,
-                        "strike_length": strike_length,
-                        "dip_length": dip_length
-                    })
-                print(f"Segement length along-strike (m): {strike_length}")
-                print(f"Segement width along-dip (m): {dip_length}")
-                print(dip_length)
-
-                dip_segment_id += 1
-                total_length += strike_length
-                total_width += dip_length
-
-        df = pd.DataFrame(rows)
-        # Check the number of unique depth values
-        dip_segments = df['z'].nunique() - 1
-
-        for i in range(len(rings)): 
-            if dip_segments > 1:
-                width = total_width
-                length = total_length / dip_segments
-            elif along_strike_segments > 1: 
-                length = total_length
-                # Confirm only 1 along-dip segment
-                if dip_segments > 1: 
-                    print("Error: More than 1 along-dip segment detected when calculating length for along-strike segmentation. Check the geometry and segmentation logic.")
-                print(f"Along-dip segments: {dip_segments}")
-                width = dip_length  # assumes that if there is >1 along-strike segment then there is only 1 along-dip segment
-            else: 
-                length = total_length 
-                width = total_width
-
+    segments = rupture_segments(file)
+    if len(segments) == 0:
+        if verbose:
+            print(f"Geometry type: {get_geometry_type(file)}, SKIPPING")
+        return float("nan"), float("nan")
+
+    length, width = rupture_length_width(segments)
+    if verbose:
         print(f"Total length (m): {length}")
         print(f"Total width (m): {width}")
-        print(f"Number of along-dip segments: {dip_segments}")
+        print(f"Number of along-dip segments: {segments['dip_row'].max() + 1}")
     return length, width
 
 
+def dims_from_ruptjsons(files):
+    """
+    Rupture dimensions of many rupture.json files (e.g. the whole event catalog).
+    Args:
+        files: Iterable of rupture.json paths.
+    Returns:
+        DataFrame with one row per file: file, length_m, width_m, n_segments,
+        n_dip_rows and n_top_vertices (NaN dimensions for point sources or
+        unreadable files).
+    """
+    rows = []
+    for file in files:
+        try:
+            segments = rupture_segments(file)
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"WARNING: Could not read the rupture geometry of {file}: {e}")
+            segments = np.zeros(0, dtype=SEGMENT_DTYPE)
+        length, width = rupture_length_width(segments)
+        rows.append({
+            "file": str(file),
+            "length_m": length,
+            "width_m": width,
+            "n_segments": len(segments),
+            "n_dip_rows": int(segments["dip_row"].max()) + 1 if len(segments) else 0,
+            "n_top_vertices": int(segments["n_top"].sum()),
+        })
+    return pd.DataFrame(rows)
+
+
 def parse_ruptquads(file):
     """
     Parse a rupt_quads.txt file containing rupture plane realization geometries (produced by ShakeMap)
@@ -186,41 +330,9 @@ def parse_ruptquads(file):
     Returns:
         Pandas dataframe with corners of ruptures
     """
-    ruptures = []  # List to store all ruptures
-    current_rupture = []  # Temporary list to store points for the current rupture
-
-    with open(file, "r") as file:
-        for line in file:
-            line = line.strip()
-            if line.startswith("#Origin"):
-                # Start of a new rupture, reset the current rupture
-                current_rupture = []
-            elif line == ">":
-                # End of the current rupture, process and store it
-                if len(current_rupture) == 5:  # Ensure there are 5 points
-                    rupture = {
-                        "p1": current_rupture[0],
-                        "p2": current_rupture[1],
-                        "p3": current_rupture[2],
-                        "p4": current_rupture[3],
-                    }
-                    ruptures.append(rupture)
-                current_rupture = []  # Reset for the next rupture
-            elif line:
-                # Parse a point (lat, lon, depth)
-                point = tuple(map(float, line.split()))
-                current_rupture.append(point)
-    data = []
-    for idx, rupture in enumerate(ruptures):
-        data.append({
-            "rupture_id": idx + 1,
-            "p1_lat": rupture["p1"][0], "p1_lon": rupture["p1"][1], "p1_depth": rupture["p1"][2],
-            "p2_lat": rupture["p2"][0], "p2_lon": rupture["p2"][1], "p2_depth": rupture["p2"][2],
-            "p3_lat": rupture["p3"][0], "p3_lon": rupture["p3"][1], "p3_depth": rupture["p3"][2],
-            "p4_lat": rupture["p4"][0], "p4_lon": rupture["p4"][1], "p4_depth": rupture["p4"][2],
-        })
-    
-    return pd.DataFrame(data)
+    from ruptquads import read_ruptquads
+
+    return read_ruptquads(file, as_dataframe=True)
 
 def parse_im_json(file):
     """
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+# Area-weighted exposure statistics of ShakeMap grids (area per MMI bin, area
+# at or above each MMI level and the area fractions).
+#
+# calcDiff_v03.ipynb builds one boolean mask and one masked sum per MMI bin per
+# grid. Here every grid is binned in a single np.digitize pass and the weights
+# are summed per bin with one np.bincount over all grids, so the cost does not
+# depend on the number of bins. Values below the first edge, at or above the
+# last edge and NaN go to their own slots, so the exceedance area at every
+# edge is a cumulative sum of the same counts.
+#
+# The statistics are additive over cells, so large grids can be processed in
+# chunks of rows (exposure_stats_chunks, grid_exposure). The weights are the
+# cell areas by default (cell_area), but any per-cell weight (e.g. population)
+# can be used.
+
+import json
+import os
+
+import numpy as np
+
+from gridxml import CHUNK_ROWS, load_imt
+
+EARTH_RADIUS = 6371.0  # km
+# Bins [1, 2), [2, 3), ... [9, 10) as in calcDiff_v03.ipynb
+MMI_BIN_EDGES = np.linspace(1, 10, 10)
+
+
+def cell_area(geodict, lats):
+    """
+    Area (km^2) of the cells of a geodict along rows at the given latitudes.
+    """
+    dlat = np.deg2rad(geodict["dy"])
+    dlon = np.deg2rad(geodict["dx"])
+    return EARTH_RADIUS**2 * dlat * dlon * np.cos(np.deg2rad(lats))
+
+
+def row_areas(geodict, rows=None):
+    """
+    Cell areas (km^2) of a chunk of rows (row 0 at ymax), shape (n_rows, 1).
+    """
+    if rows is None:
+        rows = slice(0, geodict["ny"])
+    lats = geodict["ymax"] - np.arange(rows.start, rows.stop) * geodict["dy"]
+    return cell_area(geodict, lats)[:, None]
+
+
+def slot_sums(values, weights, bin_edges=MMI_BIN_EDGES):
+    """
+    Sum of the weights of the cells in every bin slot, for many grids at once.
+    Args:
+        values: Array of shape (n_grids, ...) (e.g. (n_grids, ny, nx)).
+        weights: Weights broadcastable to values.shape[1:] (e.g. cell areas (ny, 1)).
+        bin_edges: Increasing bin edges.
+    Returns:
+        Array of shape (n_grids, len(bin_edges) + 2). Slot 0 holds values below
+        the first edge, slot k (1 <= k < len(bin_edges)) the bin
+        [edge k-1, edge k), slot len(bin_edges) values at or above the last
+        edge and the last slot NaN values.
+    """
+    values = np.asarray(values)
+    edges = np.asarray(bin_edges, dtype=float)
+    ngrids = values.shape[0]
+    nslots = len(edges) + 2
+    slot = np.digitize(values, edges)
+    slot[np.isnan(values)] = nslots - 1
+    slot = slot.reshape(ngrids, -1) + (np.arange(ngrids) * nslots)[:, None]
+    w = np.broadcast_to(weights, values.shape).reshape(ngrids, -1)
+    return np.bincount(slot.ravel(), w.ravel(), minlength=ngrids * nslots).reshape(ngrids, nslots)
+
+
+def exposure_from_sums(sums, bin_edges=MMI_BIN_EDGES):
+    """
+    Exposure statistics from the slot sums of slot_sums.
+    Returns:
+        Dict of arrays (first axis: grid):
+            - bin_edges, bin_centers: the bins.
+            - binned_area: weight in every bin [edge k, edge k+1), (n_grids, n_bins).
+            - exceedance_area: weight at or above every edge, (n_grids, n_edges).
+            - total_area: weight of all non-NaN cells, (n_grids,).
+            - binned_fraction, exceedance_fraction: the areas over total_area.
+    """
+    edges = np.asarray(bin_edges, dtype=float)
+    n = len(edges)
+    binned = sums[:, 1:n]
+    exceedance = sums[:, 1 : n + 1][:, ::-1].cumsum(axis=1)[:, ::-1]
+    total = sums[:, :-1].sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "bin_edges": edges,
+            "bin_centers": 0.5 * (edges[:-1] + edges[1:]),
+            "binned_area": binned,
+            "exceedance_area": exceedance,
+            "total_area": total,
+            "binned_fraction": binned / total[:, None],
+            "exceedance_fraction": exceedance / total[:, None],
+        }
+
+
+def exposure_stats(values, weights, bin_edges=MMI_BIN_EDGES):
+    """
+    Binned area, exceedance area and area fractions of many grids at once.
+    Args:
+        values: Aligned grids, shape (n_grids, ...).
+        weights: Cell weights broadcastable to values.shape[1:] (e.g. row_areas(geodict)).
+        bin_edges: Increasing bin edges (default: MMI 1 to 10).
+    Returns:
+        Dict of arrays (see exposure_from_sums).
+    """
+    return exposure_from_sums(slot_sums(values, weights, bin_edges), bin_edges)
+
+
+def exposure_stats_chunks(chunks, bin_edges=MMI_BIN_EDGES):
+    """
+    exposure_stats accumulated over chunks (e.g. rows) of the grids.
+    Args:
+        chunks: Iterable of (values, weights) as for exposure_stats.
+        bin_edges: Increasing bin edges.
+    Returns:
+        Dict of arrays (see exposure_from_sums).
+    """
+    sums = None
+    for values, weights in chunks:
+        chunk = slot_sums(values, weights, bin_edges)
+        sums = chunk if sums is None else sums + chunk
+    if sums is None:
+        raise ValueError("No chunks to accumulate")
+    return exposure_from_sums(sums, bin_edges)
+
+
+def aligned_exposure(aligned_file, bin_edges=MMI_BIN_EDGES, chunk_rows=CHUNK_ROWS):
+    """
+    Exposure statistics of the aligned grids written by compare_shakemaps --save-aligned.
+    Args:
+        aligned_file: The aligned .npy file (with its .json geodict next to it).
+        bin_edges: Increasing bin edges.
+        chunk_rows: Number of rows processed at a time.
+    Returns:
+        Dict of arrays (see exposure_from_sums).
+    """
+    with open(os.path.splitext(aligned_file)[0] + ".json") as f:
+        geodict = json.load(f)["geodict"]
+    stack = np.load(aligned_file, mmap_mode="r")
+    chunks = (
+        (stack[:, rows], row_areas(geodict, rows))
+        for rows in (slice(i, min(i + chunk_rows, geodict["ny"])) for i in range(0, geodict["ny"], chunk_rows))
+    )
+    return exposure_stats_chunks(chunks, bin_edges)
+
+
+def grid_exposure(grid_files, imt="mmi", bin_edges=MMI_BIN_EDGES, chunk_rows=CHUNK_ROWS):
+    """
+    Exposure statistics of grid.xml files, each over its own full extent.
+    Args:
+        grid_files: List of grid.xml paths (read through the gridxml cache).
+        imt: IMT to bin.
+        bin_edges: Increasing bin edges.
+        chunk_rows: Number of rows processed at a time.
+    Returns:
+        Dict of arrays (see exposure_from_sums), one row per grid.
+    """
+    sums = []
+    for grid_file in grid_files:
+        layer, geodict = load_imt(grid_file, imt, chunk_rows=chunk_rows)
+        total = 0
+        for i in range(0, geodict["ny"], chunk_rows):
+            rows = slice(i, min(i + chunk_rows, geodict["ny"]))
+            total = total + slot_sums(layer[None, rows], row_areas(geodict, rows), bin_edges)
+        sums.append(total[0])
+    return exposure_from_sums(np.array(sums), bin_edges)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+# Bounding-box index of the segments of a GMT multi-segment file (the GEM
+# active faults and Slab2 contour files).
+#
+# The index is a packed array with the byte offset, byte length and
+# (xmin, xmax, ymin, ymax) of every ">" segment, built once and stored next to
+# the file as FILE.bbox.npz. A region query is a vectorized comparison against
+# the bbox array, and the matching segments are copied byte for byte (with the
+# file header and their "# @D" attribute lines) into a small file for GMT.
+#
+# The index is rebuilt automatically when the size or mtime of the file
+# changes. To build the indexes ahead of time:
+# python /Users/hyin/soft/shakemap-postprocess-tools/shakemap_utils/fault_index.py
+
+import argparse
+import os
+
+import numpy as np
+
+INDEX_VERSION = 1
+
+# Padding (degrees) added around the query region, so segments that straddle
+# the map frame are still drawn up to the edge.
+QUERY_PAD = 0.1
+
+
+def index_path(file):
+    """
+    Path of the bbox index of a GMT file.
+    """
+    return f"{file}.bbox.npz"
+
+
+def build_index(file):
+    """
+    Scan a GMT multi-segment file and record the extent of every segment.
+    Args:
+        file: Path to the GMT/OGR-GMT file.
+    Returns:
+        Dict with header_len (bytes before the first ">"), offsets and lengths
+        (bytes) of the segments and bbox, a float array of shape (n_segments, 4)
+        with xmin, xmax, ymin, ymax. Segments without points have a NaN bbox.
+    """
+    offsets, lengths, bboxes = [], [], []
+    header_len = None
+    pos = 0
+    start = None
+    xs, ys = [], []
+
+    def close(end):
+        if start is None:
+            return
+        offsets.append(start)
+        lengths.append(end - start)
+        if xs:
+            bboxes.append((min(xs), max(xs), min(ys), max(ys)))
+        else:
+            bboxes.append((np.nan,) * 4)
+
+    with open(file, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if header_len is None:
+                    header_len = pos
+                close(pos)
+                start = pos
+                xs, ys = [], []
+            elif start is not None and not line.startswith(b"#"):
+                fields = line.split()
+                if len(fields) >= 2:
+                    xs.append(float(fields[0]))
+                    ys.append(float(fields[1]))
+            pos += len(line)
+        close(pos)
+
+    return {
+        "header_len": pos if header_len is None else header_len,
+        "offsets": np.array(offsets, dtype=np.int64),
+        "lengths": np.array(lengths, dtype=np.int64),
+        "bbox": np.array(bboxes, dtype=np.float64).reshape(-1, 4),
+    }
+
+
+def load_index(file):
+    """
+    Load the bbox index of a GMT file, (re)building it if missing or stale.
+    Args:
+        file: Path to the GMT/OGR-GMT file.
+    Returns:
+        The index dict (see build_index).
+    """
+    st = os.stat(file)
+    npz_file = index_path(file)
+    try:
+        with np.load(npz_file) as data:
+            if (
+                int(data["version"]) == INDEX_VERSION
+                and int(data["size"]) == st.st_size
+                and int(data["mtime_ns"]) == st.st_mtime_ns
+            ):
+                index = {key: data[key] for key in ("offsets", "lengths", "bbox")}
+                index["header_len"] = int(data["header_len"])
+                return index
+    except (OSError, KeyError, ValueError):
+        pass
+
+    index = build_index(file)
+    try:
+        tmp = f"{npz_file}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp,
+            version=INDEX_VERSION,
+            size=st.st_size,
+            mtime_ns=st.st_mtime_ns,
+            **index,
+        )
+        os.replace(tmp, npz_file)
+    except OSError as e:
+        print(f"WARNING: Could not write the bbox index for {file}: {e}")
+    return index
+
+
+def query(index, rgn, pad=QUERY_PAD):
+    """
+    Segments whose bounding box intersects a region.
+    Args:
+        index: Index dict from load_index.
+        rgn: Region [xmin, xmax, ymin, ymax].
+        pad: Padding in degrees added around the region.
+    Returns:
+        Sorted array of segment numbers.
+    """
+    xmin, xmax, ymin, ymax = rgn
+    xmin, xmax, ymin, ymax = xmin - pad, xmax + pad, ymin - pad, ymax + pad
+    bbox = index["bbox"]
+    hit = (bbox[:, 3] >= ymin) & (bbox[:, 2] <= ymax)
+    # Also test the segments shifted by 360 degrees for regions across the dateline
+    lon_hit = np.zeros(len(bbox), dtype=bool)
+    for shift in (-360.0, 0.0, 360.0):
+        lon_hit |= (bbox[:, 1] + shift >= xmin) & (bbox[:, 0] + shift <= xmax)
+    return np.flatnonzero(hit & lon_hit)
+
+
+def write_region_subset(file, rgn, outfile, pad=QUERY_PAD):
+    """
+    Write the header and the segments of a GMT file that intersect a region.
+    Args:
+        file: Path to the GMT/OGR-GMT file.
+        rgn: Region [xmin, xmax, ymin, ymax].
+        outfile: Path of the subset file.
+        pad: Padding in degrees added around the region.
+    Returns:
+        Number of segments written.
+    """
+    index = load_index(file)
+    selected = query(index, rgn, pad)
+    offsets = index["offsets"][selected]
+    lengths = index["lengths"][selected]
+
+    with open(file, "rb") as fin, open(outfile, "wb") as fout:
+        fout.write(fin.read(index["header_len"]))
+        # Merge runs of consecutive segments into single reads
+        if len(selected):
+            breaks = np.flatnonzero(offsets[1:] != offsets[:-1] + lengths[:-1]) + 1
+            run_starts = np.concatenate(([0], breaks))
+            run_ends = np.concatenate((breaks, [len(selected)]))
+            for i, j in zip(run_starts, run_ends):
+                fin.seek(offsets[i])
+                fout.write(fin.read(offsets[j - 1] + lengths[j - 1] - offsets[i]))
+    return len(selected)
+
+
+def main():
+    import map_layers
+
+    parser = argparse.ArgumentParser(
+        description="Build the bbox indexes of GMT fault and slab files."
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        default=[map_layers.SLAB2, map_layers.FAULTS_GLOBAL],
+        help="GMT multi-segment files to index (default: the Slab2 and GEM active faults files)",
+    )
+    args = parser.parse_args()
+
+    for file in args.files:
+        index = load_index(file)
+        print(f"{file}: {len(index['offsets'])} segments indexed in {index_path(file)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# Cache of region subsets of the global map grids (SRTM15 topo, GEM PSHA).
+#
+# cached_grid cuts a buffered region out of a local global grid with grdcut,
+# computes its hillshade gradient with grdgradient and stores both under
+# GRID_CACHE_DIR. Later maps with the same cache region load the small subset
+# and the precomputed gradient instead of reading the global grid and shading
+# it again.
+#
+# The region is snapped outwards to REGION_SNAP degrees after adding the
+# buffer, and entries are keyed on that snapped region. Maps with slightly
+# different regions share one entry only if they snap to the same region; a
+# smaller region inside a cached one that snaps differently is cut again.
+# Entries are evicted when they have not been used for CACHE_MAX_AGE, and the
+# least recently used entries are dropped while the cache is larger than
+# CACHE_MAX_BYTES.
+
+import hashlib
+import json
+import math
+import os
+import pathlib
+import time
+
+CACHE_DIR = pathlib.Path(
+    os.environ.get(
+        "GRID_CACHE_DIR",
+        pathlib.Path.home() / ".cache" / "shakemap-postprocess-tools" / "grids",
+    )
+)
+CACHE_MAX_BYTES = 2 * 1024**3
+CACHE_MAX_AGE = 30 * 24 * 3600  # seconds
+REGION_BUFFER = 0.5  # degrees
+REGION_SNAP = 0.5  # degrees
+# Same illumination as grdimage's "shading=True" (-I+d)
+SHADING = dict(azimuth=-45, normalize="t1")
+
+
+def cache_region(rgn, buffer=REGION_BUFFER, snap=REGION_SNAP):
+    """
+    Buffered region snapped outwards to a multiple of snap degrees.
+    Args:
+        rgn: Region [xmin, xmax, ymin, ymax].
+    Returns:
+        The cache region [xmin, xmax, ymin, ymax].
+    """
+    xmin, xmax, ymin, ymax = rgn
+    return [
+        math.floor((xmin - buffer) / snap) * snap,
+        math.ceil((xmax + buffer) / snap) * snap,
+        max(math.floor((ymin - buffer) / snap) * snap, -90.0),
+        min(math.ceil((ymax + buffer) / snap) * snap, 90.0),
+    ]
+
+
+def cache_key(grid, region):
+    """
+    Cache key of a grid subset: the source grid (path, size, mtime) and the cache region.
+    """
+    st = os.stat(grid)
+    ident = json.dumps(
+        [os.path.abspath(grid), st.st_size, st.st_mtime_ns, region, SHADING]
+    )
+    return hashlib.sha1(ident.encode()).hexdigest()
+
+
+def cached_grid(grid, rgn, cache_dir=CACHE_DIR, shading=True):
+    """
+    Region subset (and hillshade gradient) of a global grid, from the cache if possible.
+    Args:
+        grid: Path to the global grid.
+        rgn: Region [xmin, xmax, ymin, ymax] of the map.
+        cache_dir: Cache directory.
+        shading: Also return the hillshade gradient of the subset.
+    Returns:
+        (subset, gradient) paths. gradient is True (let grdimage shade) if
+        shading was requested but could not be cached, and None if not requested.
+    """
+    import pygmt
+
+    cache_dir = pathlib.Path(cache_dir)
+    region = cache_region(rgn)
+    key = cache_key(grid, region)
+    subset = cache_dir / f"{key}.nc"
+    gradient = cache_dir / f"{key}_grad.nc"
+    meta_file = cache_dir / f"{key}.json"
+
+    if not subset.exists():
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cache_dir / f"{key}.{os.getpid()}.tmp.nc"
+        pygmt.grdcut(grid=grid, region=region, outgrid=tmp)
+        os.replace(tmp, subset)
+        _write_meta(meta_file, {"source": os.path.abspath(grid), "region": region})
+        evict_cache(cache_dir, keep=key)
+    if shading and not gradient.exists():
+        tmp = cache_dir / f"{key}.{os.getpid()}.tmp_grad.nc"
+        try:
+            pygmt.grdgradient(grid=subset, outgrid=tmp, **SHADING)
+            os.replace(tmp, gradient)
+        except Exception as e:
+            print(f"WARNING: Could not compute the gradient of {subset}: {e}")
+            tmp.unlink(missing_ok=True)
+            return str(subset), True
+
+    # Use time drives the least recently used eviction
+    now = time.time()
+    for path in (subset, gradient, meta_file):
+        if path.exists():
+            os.utime(path, (now, now))
+
+    if not shading:
+        return str(subset), None
+    return str(subset), str(gradient)
+
+
+def evict_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE, keep=None):
+    """
+    Drop entries unused for longer than max_age, then the least recently used
+    entries until the cache is no larger than max_bytes.
+    Args:
+        cache_dir: Cache directory.
+        max_bytes: Size limit of the cache in bytes.
+        max_age: Age limit (seconds since last use).
+        keep: Key of an entry that is never evicted (e.g. the one just written).
+    Returns:
+        Number of entries removed.
+    """
+    cache_dir = pathlib.Path(cache_dir)
+    entries = {}
+    for path in cache_dir.glob("*.nc"):
+        if ".tmp" in path.name:
+            continue
+        key = path.name.split(".")[0].removesuffix("_grad")
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        size, used = entries.get(key, (0, 0.0))
+        entries[key] = (size + st.st_size, max(used, st.st_mtime))
+
+    now = time.time()
+    removed = 0
+    total = sum(size for size, _ in entries.values())
+    for key, (size, used) in sorted(entries.items(), key=lambda item: item[1][1]):
+        if key == keep:
+            continue
+        if now - used > max_age or total > max_bytes:
+            for suffix in (".nc", "_grad.nc", ".json"):
+                (cache_dir / f"{key}{suffix}").unlink(missing_ok=True)
+            total -= size
+            removed += 1
+    return removed
+
+
+def _write_meta(path, data):
+    tmp = pathlib.Path(f"{path}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
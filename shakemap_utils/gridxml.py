@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+# Streaming reader for ShakeMap grid.xml files that extracts a single IMT.
+#
+# grid.xml stores every IMT (and its uncertainty) as one text column per grid
+# point:
+#
+#   <grid_specification lon_min=".." lat_min=".." lon_max=".." lat_max=".."
+#       nominal_lon_spacing=".." nominal_lat_spacing=".." nlon=".." nlat=".."/>
+#   <grid_field index="1" name="LON" units="dd"/>
+#   <grid_field index="2" name="LAT" units="dd"/>
+#   <grid_field index="3" name="PGA" units="pctg"/>
+#   ...
+#   <grid_data>
+#   lon lat pga pgv mmi ...
+#   </grid_data>
+#
+# read_imt_layer parses the data block in chunks of rows and keeps only the
+# requested column, so memory holds one float32 layer plus one chunk instead of
+# every IMT (as ShakeGrid.load does).
+#
+# Parsing the text is still the slow part, so convert_grid parses a grid.xml
+# once and writes every field as a float32 .npy file next to it
+# (grid_mmi.npy, grid_pga.npy, ...) with a small JSON header (grid_cache.json)
+# holding the geodict and the size and mtime of the grid.xml. load_imt
+# memory-maps the .npy of an IMT and only converts the grid.xml again when it
+# has changed. To convert the grids ahead of time:
+# python /Users/hyin/soft/shakemap-postprocess-tools/shakemap_utils/gridxml.py EVENTPATH/*/products/grid.xml
+
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+
+CHUNK_ROWS = 256
+CACHE_VERSION = 1
+_ATTR = re.compile(r'(\w+)="([^"]*)"')
+
+
+def read_grid_header(file):
+    """
+    Read the grid specification and field list of a grid.xml file.
+    Args:
+        file: Path to the grid.xml file.
+    Returns:
+        geodict: Dict with xmin, xmax, ymin, ymax, dx, dy, nx, ny (row 0 is ymax).
+        fields: List of field names in column order (e.g. ["LON", "LAT", "PGA", ...]).
+        offset: Byte offset of the first data line.
+    """
+    spec = None
+    fields = {}
+    offset = 0
+    with open(file, "rb") as f:
+        for raw in f:
+            offset += len(raw)
+            line = raw.decode()
+            if "<grid_specification" in line:
+                spec = dict(_ATTR.findall(line))
+            elif "<grid_field" in line:
+                attrs = dict(_ATTR.findall(line))
+                fields[int(attrs["index"])] = attrs["name"]
+            elif "<grid_data" in line:
+                break
+        else:
+            raise ValueError(f"No <grid_data> block in {file}")
+    if spec is None:
+        raise ValueError(f"No <grid_specification> in {file}")
+
+    geodict = {
+        "xmin": float(spec["lon_min"]),
+        "xmax": float(spec["lon_max"]),
+        "ymin": float(spec["lat_min"]),
+        "ymax": float(spec["lat_max"]),
+        "dx": float(spec["nominal_lon_spacing"]),
+        "dy": float(spec["nominal_lat_spacing"]),
+        "nx": int(spec["nlon"]),
+        "ny": int(spec["nlat"]),
+    }
+    return geodict, [fields[i] for i in sorted(fields)], offset
+
+
+def field_index(fields, imt):
+    """
+    Column of an IMT in the field list (case-insensitive, e.g. "mmi", "PSA10").
+    """
+    names = [name.upper() for name in fields]
+    try:
+        return names.index(imt.upper())
+    except ValueError:
+        raise ValueError(f"IMT {imt} not in grid fields {fields}") from None
+
+
+def iter_imt_rows(file, imt, chunk_rows=CHUNK_ROWS):
+    """
+    Read one IMT from a grid.xml file in chunks of grid rows.
+    Args:
+        file: Path to the grid.xml file.
+        imt: IMT name (grid_field name, case-insensitive).
+        chunk_rows: Number of grid rows (nlon points each) parsed at a time.
+    Yields:
+        (lon, lat, value) float arrays for each chunk of grid points.
+    """
+    geodict, fields, offset = read_grid_header(file)
+    column = field_index(fields, imt)
+    nfields = len(fields)
+    npoints = chunk_rows * geodict["nx"]
+    with open(file, "rb") as f:
+        f.seek(offset)
+        while True:
+            lines = []
+            for raw in f:
+                if raw.lstrip().startswith(b"<"):
+                    break
+                lines.append(raw)
+                if len(lines) == npoints:
+                    break
+            if not lines:
+                return
+            data = np.fromstring(b"".join(lines).decode(), sep=" ").reshape(-1, nfields)
+            yield data[:, 0], data[:, 1], data[:, column]
+            if len(lines) < npoints:
+                return
+
+
+def read_imt_layer(file, imt, chunk_rows=CHUNK_ROWS):
+    """
+    Read one IMT of a grid.xml file into a 2D array.
+    Points are placed by their LON/LAT columns, so the row order in the file
+    does not matter.
+    Args:
+        file: Path to the grid.xml file.
+        imt: IMT name (grid_field name, case-insensitive).
+        chunk_rows: Number of grid rows parsed at a time.
+    Returns:
+        layer: float32 array of shape (ny, nx), row 0 at ymax. Missing points are NaN.
+        geodict: Grid specification (see read_grid_header).
+    """
+    geodict, _, _ = read_grid_header(file)
+    layer = np.full((geodict["ny"], geodict["nx"]), np.nan, dtype=np.float32)
+    for lon, lat, value in iter_imt_rows(file, imt, chunk_rows):
+        row = np.rint((geodict["ymax"] - lat) / geodict["dy"]).astype(int)
+        col = np.rint((lon - geodict["xmin"]) / geodict["dx"]).astype(int)
+        layer[row, col] = value
+    return layer, geodict
+
+
+def cache_paths(file):
+    """
+    Paths of the binary cache of a grid.xml file.
+    Returns:
+        header: Path of the JSON header.
+        layer: Function of an IMT name giving the path of its .npy file.
+    """
+    base = os.path.splitext(file)[0]
+    return f"{base}_cache.json", lambda imt: f"{base}_{imt.lower()}.npy"
+
+
+def _read_cache_header(file):
+    # Header of the cache if it matches the current grid.xml, else None
+    header_file, _ = cache_paths(file)
+    st = os.stat(file)
+    try:
+        with open(header_file) as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        header.get("version") == CACHE_VERSION
+        and header.get("size") == st.st_size
+        and header.get("mtime_ns") == st.st_mtime_ns
+    ):
+        return header
+    return None
+
+
+def convert_grid(file, chunk_rows=CHUNK_ROWS):
+    """
+    Parse a grid.xml once and write every field to its binary cache.
+    Args:
+        file: Path to the grid.xml file.
+        chunk_rows: Number of grid rows parsed at a time.
+    Returns:
+        The cache header: geodict, fields (lower case, without LON/LAT),
+        and the size and mtime of the grid.xml.
+    """
+    st = os.stat(file)
+    geodict, fields, offset = read_grid_header(file)
+    header_file, layer_path = cache_paths(file)
+    names = [name.lower() for name in fields[2:]]
+    shape = (geodict["ny"], geodict["nx"])
+
+    tmp_files = {name: f"{layer_path(name)}.{os.getpid()}.tmp.npy" for name in names}
+    layers = {}
+    try:
+        for name in names:
+            layers[name] = np.lib.format.open_memmap(tmp_files[name], mode="w+", dtype=np.float32, shape=shape)
+            layers[name][:] = np.nan
+
+        npoints = chunk_rows * geodict["nx"]
+        with open(file, "rb") as f:
+            f.seek(offset)
+            done = False
+            while not done:
+                lines = []
+                for raw in f:
+                    if raw.lstrip().startswith(b"<"):
+                        break
+                    lines.append(raw)
+                    if len(lines) == npoints:
+                        break
+                done = len(lines) < npoints
+                if not lines:
+                    break
+                data = np.fromstring(b"".join(lines).decode(), sep=" ").reshape(-1, len(fields))
+                row = np.rint((geodict["ymax"] - data[:, 1]) / geodict["dy"]).astype(int)
+                col = np.rint((data[:, 0] - geodict["xmin"]) / geodict["dx"]).astype(int)
+                for k, name in enumerate(names):
+                    layers[name][row, col] = data[:, k + 2]
+
+        for name in names:
+            layers[name].flush()
+        layers.clear()
+        for name in names:
+            os.replace(tmp_files[name], layer_path(name))
+    finally:
+        layers.clear()
+        for tmp in tmp_files.values():
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    # The header is written last, so a cache without a valid header is never used
+    header = {
+        "version": CACHE_VERSION,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "geodict": geodict,
+        "fields": names,
+    }
+    tmp = f"{header_file}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp, header_file)
+    return header
+
+
+def load_imt(file, imt, mmap=True, chunk_rows=CHUNK_ROWS):
+    """
+    One IMT of a grid.xml from its binary cache, converting the grid.xml first
+    if the cache is missing or older than the file.
+    Args:
+        file: Path to the grid.xml file.
+        imt: IMT name (grid_field name, case-insensitive).
+        mmap: Memory-map the layer (read-only) instead of reading it into memory.
+        chunk_rows: Number of grid rows parsed at a time when converting.
+    Returns:
+        layer: float32 array of shape (ny, nx), row 0 at ymax. Missing points are NaN.
+        geodict: Grid specification (see read_grid_header).
+    """
+    header = _read_cache_header(file)
+    if header is None:
+        try:
+            header = convert_grid(file, chunk_rows)
+        except OSError as e:
+            # e.g. a read-only products directory
+            print(f"WARNING: Could not write the grid cache of {file}: {e}")
+            return read_imt_layer(file, imt, chunk_rows)
+    field_index(header["fields"], imt)
+    _, layer_path = cache_paths(file)
+    return np.load(layer_path(imt), mmap_mode="r" if mmap else None), header["geodict"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert ShakeMap grid.xml files to their per-IMT binary cache."
+    )
+    parser.add_argument("grids", nargs="+", help="grid.xml files")
+    parser.add_argument("-f", "--force", action="store_true", help="convert even if the cache is up to date")
+    args = parser.parse_args()
+
+    for file in args.grids:
+        header = None if args.force else _read_cache_header(file)
+        if header is None:
+            header = convert_grid(file)
+            status = "converted"
+        else:
+            status = "up to date"
+        geodict = header["geodict"]
+        print(f"{file}: {status} ({geodict['nx']} x {geodict['ny']}, {', '.join(header['fields'])})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+# Static background layers for the rupture maps (topo, PSHA, Slab2 and GEM
+# active faults).
+#
+# The global files are large, but every map of an event uses the same region.
+# prepare_static_layers clips each layer to the region once, so several maps
+# can be drawn from the small files instead of each re-reading the global
+# grids and fault databases. The grid subsets and their hillshade gradients
+# come from the persistent grid cache (grid_cache.py), so they are also reused
+# by later plots of the same event, and the fault files are filtered with
+# their bbox index (fault_index.py).
+
+import os
+
+import fault_index
+import grid_cache
+
+TOPO = "/Users/hyin/usgs_mendenhall/topo/global_srtm15p/SRTM15_V2.7.nc"
+PSHA = "/Users/hyin/usgs_mendenhall/ffsimmer/map-layers/psha/GEM-GSHM_PGA-475y-rock_v2023/v2023_1_pga_475_rock_3min.tif"
+SLAB2 = "/Users/hyin/usgs_mendenhall/ffsimmer/map-layers/faults/slab2.0/slab2.gmt"
+FAULTS_GLOBAL = "/Users/hyin/usgs_mendenhall/ffsimmer/map-layers/faults/gem-global-active-faults-master/gmt/gem_active_faults_harmonized.gmt"
+
+
+def prepare_static_layers(rgn, workdir, topo=True, psha=True, slab2=True, faults=True):
+    """
+    Clip the static map layers to a region once.
+    Args:
+        rgn: Region [xmin, xmax, ymin, ymax] shared by all maps.
+        workdir: Directory for the clipped fault files.
+        topo, psha, slab2, faults: Which layers to prepare.
+    Returns:
+        Dict of layer name ("topo", "psha", "slab2", "faults") -> path of the
+        clipped file, for the layers that were prepared. The grids also have a
+        "topo_shading"/"psha_shading" entry with their hillshade gradient.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    layers = {}
+    if topo:
+        layers["topo"], layers["topo_shading"] = grid_cache.cached_grid(TOPO, rgn)
+    if psha:
+        layers["psha"], layers["psha_shading"] = grid_cache.cached_grid(PSHA, rgn)
+    if slab2:
+        layers["slab2"] = os.path.join(workdir, "slab2.gmt")
+        fault_index.write_region_subset(SLAB2, rgn, layers["slab2"])
+    if faults:
+        layers["faults"] = os.path.join(workdir, "gem_active_faults.gmt")
+        fault_index.write_region_subset(FAULTS_GLOBAL, rgn, layers["faults"])
+    return layers
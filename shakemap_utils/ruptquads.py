@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+# Shared reader for the rupt_quads.txt files written by ShakeMap's ffsimmer.
+#
+# The file is a list of rupture realizations. Each realization is optionally
+# preceded by "#Origin"/"#Source" header lines, followed by 5 points (the
+# 4 corners plus the closing point) and terminated by a ">" line:
+#
+#   #Origin ...
+#   lat lon depth
+#   lat lon depth
+#   lat lon depth
+#   lat lon depth
+#   lat lon depth
+#   >
+#
+# Parsed results are cached in a binary sidecar next to the text file
+# (rupt_quads.txt.npy for the corners, rupt_quads.txt.json for the cache key
+# and header lines), so repeated plots of the same run memory-map the corners
+# instead of re-tokenizing the text.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+HEADER_PREFIXES = ("#Origin", "#Source")
+CORNERS = ["p1", "p2", "p3", "p4"]
+SIDECAR_VERSION = 1
+
+
+def read_ruptquads(file, as_dataframe=False, cache=True):
+    """
+    Read a rupt_quads.txt file in a single pass.
+    All point lines are converted to floats in one bulk call and then
+    grouped into realizations with array indexing, instead of splitting
+    and appending line by line.
+    Args:
+        file: Path to the rupt_quads.txt file.
+        as_dataframe: If True, return the DataFrame view (see ruptquads_to_dataframe)
+            instead of the corner array.
+        cache: If True, load the corners from the binary sidecar when it is
+            still valid for the file, and (re)write the sidecar otherwise.
+    Returns:
+        corners: float array of shape (n_ruptures, 4, 3), with (lat, lon, depth)
+            for corners p1..p4 of each realization. Read-only when memory-mapped
+            from the sidecar.
+        origins: List (one entry per realization) of the "#Origin"/"#Source"
+            header lines that precede it, without the leading "#".
+    """
+    cached = load_sidecar(file) if cache else None
+    if cached is not None:
+        corners, origins = cached
+    else:
+        with open(file, "rb") as f:
+            raw = f.read()
+        corners, origins = parse_ruptquads_text(raw.decode())
+        if cache:
+            write_sidecar(file, corners, origins, hashlib.sha1(raw).hexdigest())
+
+    if as_dataframe:
+        return ruptquads_to_dataframe(corners)
+    return corners, origins
+
+
+def parse_ruptquads_text(text):
+    """
+    Parse the contents of a rupt_quads.txt file.
+    Args:
+        text: File contents as a string.
+    Returns:
+        corners and origins, as described in read_ruptquads.
+    """
+    lines = np.char.strip(np.array(text.splitlines(), dtype=str))
+
+    is_sep = lines == ">"
+    is_head = np.zeros(len(lines), dtype=bool)
+    for prefix in HEADER_PREFIXES:
+        is_head |= np.char.startswith(lines, prefix)
+    is_point = (np.char.str_len(lines) > 0) & ~np.char.startswith(lines, "#") & ~is_sep
+
+    # Parse every point line at once (lat, lon, depth)
+    points = np.array(" ".join(lines[is_point]).split(), dtype=np.float64).reshape(-1, 3)
+
+    # A header or a ">" ends the current rupture, so points belong to the
+    # block numbered by how many of those came before them.
+    boundary = is_sep | is_head
+    boundary_idx = np.flatnonzero(boundary)
+    point_block = np.cumsum(boundary)[is_point]
+    counts = np.bincount(point_block, minlength=len(boundary_idx) + 1)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    # Only keep blocks that are closed by ">" and hold exactly 5 points
+    closed = np.zeros(len(counts), dtype=bool)
+    closed[:len(boundary_idx)] = is_sep[boundary_idx]
+    keep = np.flatnonzero(closed & (counts == 5))
+    corners = np.ascontiguousarray(points[starts[keep][:, None] + np.arange(4)])
+
+    # Collect the header lines written since the previous ">" for each rupture
+    sep_count = np.cumsum(is_sep) - is_sep
+    headers = {}
+    for i in np.flatnonzero(is_head):
+        headers.setdefault(sep_count[i], []).append(lines[i].lstrip("#").strip())
+    block_group = np.zeros(len(counts), dtype=int)
+    block_group[1:] = np.cumsum(is_sep[boundary_idx])
+    origins = [headers.get(g, []) for g in block_group[keep]]
+
+    return corners, origins
+
+
+def sidecar_paths(file):
+    """
+    Paths of the binary sidecar files for a rupt_quads.txt file.
+    """
+    return f"{file}.npy", f"{file}.json"
+
+
+def load_sidecar(file):
+    """
+    Load the parsed corners of a rupt_quads.txt file from its sidecar.
+    The sidecar is keyed on the size, mtime and SHA-1 of the text file. If
+    only the mtime changed (e.g. the file was copied), the content hash decides
+    and the stored mtime is refreshed.
+    Args:
+        file: Path to the rupt_quads.txt file.
+    Returns:
+        (corners, origins) with corners memory-mapped, or None if there is no
+        valid sidecar.
+    """
+    npy_file, meta_file = sidecar_paths(file)
+    if not (os.path.exists(npy_file) and os.path.exists(meta_file)):
+        return None
+    try:
+        with open(meta_file, "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    st = os.stat(file)
+    if meta.get("version") != SIDECAR_VERSION or meta.get("size") != st.st_size:
+        return None
+    if meta.get("mtime_ns") != st.st_mtime_ns:
+        if meta.get("sha1") != file_sha1(file):
+            return None
+        meta["mtime_ns"] = st.st_mtime_ns
+        try:
+            _write_json(meta_file, meta)
+        except OSError:
+            pass  # e.g. read-only products directory: the sidecar is still valid
+
+    corners = np.load(npy_file, mmap_mode="r")
+    if corners.shape != (meta["n_ruptures"], 4, 3):
+        return None
+    return corners, meta["origins"]
+
+
+def write_sidecar(file, corners, origins, sha1=None):
+    """
+    Write the binary sidecar for a rupt_quads.txt file.
+    Both files are written to a temporary name and moved into place, so a
+    reader never sees a partially written sidecar. Failures (e.g. a read-only
+    product directory) are reported and otherwise ignored.
+    Args:
+        file: Path to the rupt_quads.txt file.
+        corners: Corner array from parse_ruptquads_text.
+        origins: Header lines from parse_ruptquads_text.
+        sha1: SHA-1 of the file contents, computed if not given.
+    """
+    npy_file, meta_file = sidecar_paths(file)
+    st = os.stat(file)
+    meta = {
+        "version": SIDECAR_VERSION,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha1": sha1 if sha1 is not None else file_sha1(file),
+        "n_ruptures": len(corners),
+        "origins": origins,
+    }
+    try:
+        tmp = f"{npy_file}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.asarray(corners, dtype=np.float64))
+        os.replace(tmp, npy_file)
+        _write_json(meta_file, meta)
+    except OSError as e:
+        print(f"WARNING: Could not write rupt_quads sidecar for {file}: {e}")
+
+
+def file_sha1(file):
+    """
+    SHA-1 hex digest of a file's contents.
+    """
+    sha1 = hashlib.sha1()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def ruptquads_to_dataframe(corners):
+    """
+    DataFrame view of a rupture corner array, one row per realization.
+    Args:
+        corners: float array of shape (n_ruptures, 4, 3) from read_ruptquads.
+    Returns:
+        Pandas dataframe with rupture_id and the lat, lon and depth of p1..p4.
+    """
+    data = {"rupture_id": np.arange(1, len(corners) + 1)}
+    for i, p in enumerate(CORNERS):
+        data[f"{p}_lat"] = corners[:, i, 0]
+        data[f"{p}_lon"] = corners[:, i, 1]
+        data[f"{p}_depth"] = corners[:, i, 2]
+    return pd.DataFrame(data)
+
+
+def write_gmt_segments(corners, outfile, updip=False):
+    """
+    Write all rupture outlines (or up-dip edges) as one GMT multi-segment file.
+    Each realization becomes a ">"-separated segment of lon/lat points, so GMT can
+    draw every realization in a single plot call.
+    Args:
+        corners: float array of shape (n_ruptures, 4, 3) from read_ruptquads.
+        outfile: Path to the output text file.
+        updip: If True, write only the up-dip edge (p1-p2) of each realization
+            instead of the closed outline (p1-p2-p3-p4-p1).
+    Returns:
+        outfile
+    """
+    idx = [0, 1] if updip else [0, 1, 2, 3, 0]
+    lonlat = np.asarray(corners)[:, idx][:, :, [1, 0]]
+    segment = "\n".join([">"] + ["%.6f %.6f"] * len(idx)) + "\n"
+    with open(outfile, "w") as f:
+        f.write((segment * len(lonlat)) % tuple(lonlat.ravel()))
+    return outfile
@@ -8,6 +8,10 @@
 # Leonard, 2010; 
 # Skarlatoudis et al., 2016)
 
+import math
+
+import numpy as np
+
 def calc_thingbaijam_si(M):
     """
     Calculate the fault length, width, and area based on the moment magnitude (M).
@@ -55,6 +59,25 @@ def calc_thingbaijam_sc(M):
 
     return length, width, area
 
+def huang_aspect_ratio(M, dip):
+    """
+    Aspect ratio (length / width) from Huang et al. (2024), EQ 2 & 3.
+    Below the break magnitude M_BP = c2 + c3 * dip the aspect ratio is constant.
+    Args:
+        M: Moment magnitude(s).
+        dip: Dip(s) in degrees, broadcastable against M.
+    Returns:
+        Aspect ratio array of the broadcast shape.
+    """
+    c0 = 0.1139
+    c1 = 0.532
+    c2 = 7.17
+    c3 = -0.0105
+
+    M, dip = np.broadcast_arrays(np.asarray(M, dtype=float), np.asarray(dip, dtype=float))
+    M_BP = c2 + c3 * dip
+    return 10 ** (c0 + c1 * np.maximum(M - M_BP, 0.0))
+
 # def SEA10_SLAB(M):
 #     # elif rup_dim_model == MagScaling.SEA10_SLAB:
 #     # Strasser et al. (2010), coefficients for slab events
@@ -83,171 +106,159 @@ def SEA10_INTERFACE(M):
     area = 10 ** (-3.49 + 0.952 * M)
     return length, width, area
 
-# def dimensions_from_magnitude(
-#     mag, rup_dim_model, neps, trunc, mech=Mechanism.ALL
-# ):
-#     """
-#     Compute dimensions of rupture from magnitude for a specified
-#     magnitude scaling relation.
-
-#     Args:
-#         mag (float): Magnitude.
-#         rup_dim_model (MagScaling enum): Specifies the model for compputing the
-#             rupture dimensions from magnitude.
-#         neps (int): The number of steps to integrate from -trunc to +trunc.
-#             Larger numbers increase the accuracy of the result, but take
-#             longer to run.
-#         trunc (float): For the integration in area (or length and width), trunc
-#             is the truncation of the normal distribution (in units of sigma).
-#         mech (Mechanism enum): Optional string indicating earthquake
-#             mechanism, used by some of the models.
-
-#     Returns:
-#         tuple: A tuple containing the following, noting that some of these will
-#         be empty if the selected model does not provide them:
-
-#                 - length: rupture length (km).
-#                 - sig_length: standard deviation of rupture length.
-#                 - W: rupture width (km).
-#                 - sigw: standard devation of rupture width.
-#                 - A: rupture area (km).
-#                 - siga: standard deivaiton of rupture area.
-
-#     """
-#     epsmid, _, _ = compute_epsilon(neps, trunc)
-#     if not isinstance(rup_dim_model, MagScaling):
-#         raise TypeError("rup_dim_model must be of type MagScaling")
-#     if not isinstance(mech, Mechanism):
-#         raise TypeError("mech must be of type Mechanism")
-
-#     if rup_dim_model is MagScaling.WC94:
-#         # Use mech to get either M-A or (M-W) and (M-R) from Wells and
-#         # Coppersmith.
-#         if mech is Mechanism.SS:
-#             sig_length = 0.15
-#             length = 10 ** (-2.57 + 0.62 * mag + sig_length * epsmid)
-#             sig_width = 0.14
-#             width = 10 ** (-0.76 + 0.27 * mag + sig_width * epsmid)
-#             sig_area = 0.22
-#             area = 10 ** (-3.42 + 0.90 * mag + sig_area * epsmid)
-#         elif mech is Mechanism.RS:
-#             sig_length = 0.16
-#             length = 10 ** (-2.42 + 0.58 * mag + sig_length * epsmid)
-#             sig_width = 0.15
-#             width = 10 ** (-1.61 + 0.41 * mag + sig_width * epsmid)
-#             sig_area = 0.26
-#             area = 10 ** (-3.99 + 0.98 * mag + sig_area * epsmid)
-#         elif mech is Mechanism.NM:
-#             sig_length = 0.17
-#             length = 10 ** (-1.88 + 0.50 * mag + sig_length * epsmid)
-#             sig_width = 0.12
-#             width = 10 ** (-1.14 + 0.35 * mag + sig_width * epsmid)
-#             sig_area = 0.22
-#             area = 10 ** (-2.78 + 0.82 * mag + sig_area * epsmid)
-#         elif mech is Mechanism.ALL:
-#             sig_length = 0.16
-#             length = 10 ** (-2.44 + 0.59 * mag + sig_length * epsmid)
-#             sig_width = 0.15
-#             width = 10 ** (-1.01 + 0.32 * mag + sig_width * epsmid)
-#             sig_area = 0.24
-#             area = 10 ** (-3.49 + 0.91 * mag + sig_area * epsmid)
-#         else:
-#             raise TypeError("Unsupported value of 'mech'")
-#     elif rup_dim_model is MagScaling.S14:
-#         # Somerville (2014) model:
-#         #     - No length or width
-#         #     - No mechanism dependence
-#         sig_area = 0.3
-#         area = 10 ** (mag - 4.25 + sig_area * epsmid)
-#         length = None
-#         sig_length = None
-#         width = None
-#         sig_width = None
-#     elif rup_dim_model == MagScaling.HB08:
-#         # Hanks and Bakun (2008)
-#         # These are the equations reported in the paper:
-#         #     M =       log10(A) + 3.98   for A <= 537 km^2 w/ se=0.03
-#         #     M = 4/3 * log10(A) + 3.07   for A >  537 km^2 w/ se=0.04
-#         # Using them is not so straight-forward beacuse we need to compute
-#         # the area from magnitude. Of course, this gives a different result
-#         # than if the equations were regressed for A as a function of M,
-#         # although since the equations were derived theoretically, this may
-#         # not be so bad.
-#         #
-#         # The inverted equation is simple enough:
-#         #     log10(A) =      M - 3.98    for M <= 6.71
-#         #     log10(A) = 3/4*(M - 3.07))  for M > 6.71
-#         #
-#         # The standard deviations are a little trickier.
-#         # First, convert standard errors of M to standard deviations of M:
-#         # (by my count, n=62 for A<=537, and n=28 for A>537)
-#         #     0.03*sqrt(62) = 0.236       for M <= 6.71
-#         #     0.04*sqrt(28) = 0.212       for M > 6.71
-#         # And convert to standard deviations of log(A) using the partial
-#         # derivatives
-#         #     dM/d(log10(A)) = 1          for M <= 6.71
-#         #     dM/d(log10(A)) = 3/4        for M >  6.71
-#         # So
-#         #     0.236*1   = 0.236 (pretty close to WC94)
-#         #     0.212*3/4 = 0.159 (seems a bit low...)
-#         if mag > 6.71:
-#             sig_area = 0.236
-#             area = 10 ** (3 / 4 * (mag - 3.07) + sig_area * epsmid)
-#         else:
-#             sig_area = 0.159
-#             area = 10 ** ((mag - 3.98) + sig_area * epsmid)
-#         length = None
-#         sig_length = None
-#         width = None
-#         sig_width = None
-#     elif rup_dim_model == MagScaling.SEA10_INTERFACE:
-#         # Strasser et al. (2010), coefficients for interface events
-#         sig_length = 0.18
-#         length = 10 ** (-2.477 + 0.585 * mag + sig_length * epsmid)
-#         sig_width = 0.173
-#         width = 10 ** (-0.882 + 0.351 * mag + sig_width * epsmid)
-#         sig_area = 0.304
-#         area = 10 ** (-3.49 + 0.952 * mag + sig_area * epsmid)
-#     elif rup_dim_model == MagScaling.SEA10_SLAB:
-#         # Strasser et al. (2010), coefficients for slab events
-#         sig_length = 0.146
-#         length = 10 ** (-2.35 + 0.562 * mag + sig_length * epsmid)
-#         sig_width = 0.067
-#         width = 10 ** (-1.058 + 0.356 * mag + sig_width * epsmid)
-#         sig_area = 0.184
-#         area = 10 ** (-3.225 + 0.89 * mag + sig_area * epsmid)
-#     elif rup_dim_model is MagScaling.TEA17:
-#         if mech is Mechanism.SS:
-#             sig_length = 0.151
-#             length = 10 ** (-2.943 + 0.681 * mag + sig_length * epsmid)
-#             sig_width = 0.105
-#             width = 10 ** (-0.543 + 0.261 * mag + sig_width * epsmid)
-#             sig_area = 0.184
-#             area = 10 ** (-3.486 + 0.942 * mag + sig_area * epsmid)
-#         elif mech is Mechanism.RS:
-#             sig_length = 0.083
-#             length = 10 ** (-2.693 + 0.614 * mag + sig_length * epsmid)
-#             sig_width = 0.087
-#             width = 10 ** (-1.669 + 0.435 * mag + sig_width * epsmid)
-#             sig_area = 0.121
-#             area = 10 ** (-4.632 + 1.049 * mag + sig_area * epsmid)
-#         elif mech is Mechanism.NM:
-#             sig_length = 0.128
-#             length = 10 ** (-1.722 + 0.485 * mag + sig_length * epsmid)
-#             sig_width = 0.128
-#             width = 10 ** (-0.829 + 0.323 * mag + sig_width * epsmid)
-#             sig_area = 0.181
-#             area = 10 ** (-2.551 + 0.808 * mag + sig_area * epsmid)
-#         elif mech is Mechanism.ALL:
-#             raise TypeError("TEA17: Unsupported value of 'mech'")
-#     elif rup_dim_model is MagScaling.TEA17_INTERFACE:
-#         sig_length = 0.107
-#         length = 10 ** (-2.412 + 0.583 * mag + sig_length * epsmid)
-#         sig_width = 0.099
-#         width = 10 ** (-0.880 + 0.366 * mag + sig_width * epsmid)
-#         sig_area = 0.150
-#         area = 10 ** (-3.292 + 0.949 * mag + sig_area * epsmid)
-#     else:
-#         raise TypeError("Unsupported value of 'rup_dim_model'")
-#     return length, sig_length, width, sig_width, area, sig_area
+# Coefficient table for the ShakeLib magnitude scaling relations (MagScaling /
+# Mechanism in esi_shakelib.ffsimmer). Each entry gives (a, b, sigma) of
+# log10(X) = a + b * M for the rupture length, width and area in km / km^2.
+# None marks a dimension the model does not provide. Models that do not depend
+# on the mechanism only have an "ALL" entry, which is used for every mechanism.
+SCALING_COEFFS = {
+    # Wells and Coppersmith (1994)
+    ("WC94", "SS"): ((-2.57, 0.62, 0.15), (-0.76, 0.27, 0.14), (-3.42, 0.90, 0.22)),
+    ("WC94", "RS"): ((-2.42, 0.58, 0.16), (-1.61, 0.41, 0.15), (-3.99, 0.98, 0.26)),
+    ("WC94", "NM"): ((-1.88, 0.50, 0.17), (-1.14, 0.35, 0.12), (-2.78, 0.82, 0.22)),
+    ("WC94", "ALL"): ((-2.44, 0.59, 0.16), (-1.01, 0.32, 0.15), (-3.49, 0.91, 0.24)),
+    # Somerville (2014): area only
+    ("S14", "ALL"): (None, None, (-4.25, 1.0, 0.3)),
+    # Hanks and Bakun (2008): area only, for M <= HB08_BREAK (see HB08_ABOVE)
+    ("HB08", "ALL"): (None, None, (-3.98, 1.0, 0.159)),
+    # Strasser et al. (2010)
+    ("SEA10_INTERFACE", "ALL"): ((-2.477, 0.585, 0.18), (-0.882, 0.351, 0.173), (-3.49, 0.952, 0.304)),
+    ("SEA10_SLAB", "ALL"): ((-2.35, 0.562, 0.146), (-1.058, 0.356, 0.067), (-3.225, 0.89, 0.184)),
+    # Thingbaijam et al. (2017), no "ALL" mechanism
+    ("TEA17", "SS"): ((-2.943, 0.681, 0.151), (-0.543, 0.261, 0.105), (-3.486, 0.942, 0.184)),
+    # Area intercept as in ShakeLib (-4.632); calc_thingbaijam_sc uses -4.362
+    ("TEA17", "RS"): ((-2.693, 0.614, 0.083), (-1.669, 0.435, 0.087), (-4.632, 1.049, 0.121)),
+    ("TEA17", "NM"): ((-1.722, 0.485, 0.128), (-0.829, 0.323, 0.128), (-2.551, 0.808, 0.181)),
+    ("TEA17_INTERFACE", "ALL"): ((-2.412, 0.583, 0.107), (-0.880, 0.366, 0.099), (-3.292, 0.949, 0.150)),
+}
+MODELS = list(dict.fromkeys(model for model, _ in SCALING_COEFFS))
+MECHANISMS = ["ALL", "SS", "RS", "NM"]
+DIMENSIONS = ["length", "width", "area"]
+
+# Hanks and Bakun (2008) above the break magnitude: log10(A) = 3/4 * (M - 3.07).
+# The sigmas of the two branches follow ShakeLib (0.236 above, 0.159 below).
+HB08_BREAK = 6.71
+HB08_ABOVE = (-0.75 * 3.07, 0.75, 0.236)
+
+
+def _coefficient_arrays():
+    """
+    Pack SCALING_COEFFS into arrays indexed by [model, mechanism, dimension, (a, b, sigma)].
+    Unsupported combinations and missing dimensions are NaN.
+    """
+    coeffs = np.full((len(MODELS), len(MECHANISMS), len(DIMENSIONS), 3), np.nan)
+    for i, model in enumerate(MODELS):
+        for j, mech in enumerate(MECHANISMS):
+            entry = SCALING_COEFFS.get((model, mech), SCALING_COEFFS.get((model, "ALL")))
+            if model == "TEA17" and mech == "ALL":
+                entry = None
+            if entry is None:
+                continue
+            for k, dim in enumerate(entry):
+                if dim is not None:
+                    coeffs[i, j, k] = dim
+    return coeffs
+
+
+_COEFFS = _coefficient_arrays()
+
+
+def _names(values, choices, kind):
+    # Accept names or the ShakeLib MagScaling / Mechanism enums
+    names = np.vectorize(lambda v: getattr(v, "name", v), otypes=[object])(np.asarray(values, dtype=object))
+    idx = np.vectorize(lambda v: choices.index(v) if v in choices else -1, otypes=[int])(names)
+    if np.any(idx < 0):
+        raise ValueError(f"Unsupported {kind}: {sorted(set(names[idx < 0].ravel()))}")
+    return idx
+
 
+def _norm_cdf(x):
+    return 0.5 * (1.0 + np.vectorize(math.erf)(np.asarray(x, dtype=float) / math.sqrt(2.0)))
+
+
+def compute_epsilon(neps, trunc):
+    """
+    Epsilon values and weights for integrating over a truncated normal distribution.
+    Args:
+        neps: Number of integration steps from -trunc to +trunc.
+        trunc: Truncation of the normal distribution (in units of sigma). With
+            trunc = 0 (or neps = 1) only the median (epsilon = 0) is used.
+    Returns:
+        epsmid: Midpoints of the neps epsilon bins.
+        peps: Probability of each bin (sums to 1).
+    """
+    if trunc == 0 or neps <= 1:
+        return np.zeros(1), np.ones(1)
+    deps = 2.0 * trunc / neps
+    epsmid = -trunc + deps * (np.arange(neps) + 0.5)
+    peps = _norm_cdf(epsmid + deps / 2) - _norm_cdf(epsmid - deps / 2)
+    return epsmid, peps / peps.sum()
+
+
+def scaling_dimensions(mag, models=None, mech="ALL", neps=1, trunc=0):
+    """
+    Rupture length, width and area for arrays of magnitudes and every scaling model
+    in one broadcast call.
+    Args:
+        mag: Magnitude(s), any shape.
+        models: Model name(s) from MODELS (or MagScaling enums). Defaults to all models.
+        mech: Mechanism name(s) ("ALL", "SS", "RS", "NM" or Mechanism enums),
+            broadcastable against mag.
+        neps: Number of epsilon integration steps (see compute_epsilon).
+        trunc: Truncation of the normal distribution in units of sigma.
+    Returns:
+        Dict with
+            - models: list of model names (first axis of the arrays below).
+            - epsmid, peps: epsilon values and weights (last axis of the dimensions).
+            - length, width, area: dimensions at each epsilon, shape
+              (n_models, *broadcast(mag, mech).shape, neps).
+            - length_mean, width_mean, area_mean: peps-weighted means over epsilon.
+            - sig_length, sig_width, sig_area: log10 standard deviations, shape
+              (n_models, *broadcast(mag, mech).shape).
+        Dimensions a model does not provide (or an unsupported model/mechanism
+        combination, e.g. TEA17 with "ALL") are NaN.
+    """
+    if models is None:
+        models = MODELS
+    models = list(np.atleast_1d(np.asarray(models, dtype=object)))
+    model_idx = _names(models, MODELS, "model")
+    mag, mech_idx = np.broadcast_arrays(np.asarray(mag, dtype=float), _names(mech, MECHANISMS, "mechanism"))
+    epsmid, peps = compute_epsilon(neps, trunc)
+
+    # coeffs: (n_models, *mag.shape, n_dims, 3)
+    coeffs = _COEFFS[model_idx[(slice(None),) + (None,) * mag.ndim], mech_idx[None]]
+    is_hb08 = (np.array([MODELS[i] for i in model_idx]) == "HB08")[(slice(None),) + (None,) * mag.ndim]
+    above = is_hb08 & (mag > HB08_BREAK)[None]
+    coeffs[..., 2, :] = np.where(above[..., None], HB08_ABOVE, coeffs[..., 2, :])
+
+    a, b, sig = coeffs[..., 0], coeffs[..., 1], coeffs[..., 2]
+    log_dims = a + b * mag[None, ..., None]
+    dims = 10 ** (log_dims[..., None] + sig[..., None] * epsmid)
+
+    result = {"models": [MODELS[i] for i in model_idx], "epsmid": epsmid, "peps": peps}
+    for k, name in enumerate(DIMENSIONS):
+        result[name] = dims[..., k, :]
+        result[f"{name}_mean"] = np.sum(dims[..., k, :] * peps, axis=-1)
+        result[f"sig_{name}"] = sig[..., k]
+    return result
+
+
+def dimensions_from_magnitude(mag, rup_dim_model, neps, trunc, mech="ALL"):
+    """
+    Vectorized equivalent of the ShakeLib dimensions_from_magnitude for a single model.
+    Args:
+        mag: Magnitude(s), any shape.
+        rup_dim_model: Model name or MagScaling enum.
+        neps: Number of epsilon integration steps.
+        trunc: Truncation of the normal distribution in units of sigma.
+        mech: Mechanism name(s) or Mechanism enum(s).
+    Returns:
+        (length, sig_length, width, sig_width, area, sig_area), with the
+        dimensions of shape (*mag.shape, neps) and NaN where the model does not
+        provide a dimension (ShakeLib returns None).
+    """
+    dims = scaling_dimensions(mag, [rup_dim_model], mech, neps, trunc)
+    return tuple(
+        dims[key][0]
+        for key in ("length", "sig_length", "width", "sig_width", "area", "sig_area")
+    )
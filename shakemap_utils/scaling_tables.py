@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+# Precomputed magnitude-dimension lookup tables for bulk scenario generation.
+#
+# build_tables evaluates every scaling model in scalingRelationships.py (median
+# length, width and area per model and mechanism) and the Huang et al. (2024)
+# aspect ratio over a dense Mw (x dip) grid. load_tables keeps the tables on
+# disk under SCALING_TABLE_DIR, keyed on the grid, so they are built once.
+# Queries interpolate log10 of the tabulated values linearly, for arrays of
+# magnitudes, dips, models and mechanisms at once.
+#
+# Error bound: every relation is log10(X) = a + b * M (+ c * dip), so linear
+# interpolation of log10(X) is exact (to rounding) except in grid cells that
+# contain a slope break:
+#   - HB08 area at Mw 6.71 (slope 1 -> 3/4),
+#   - the Huang aspect ratio at M_BP = 7.17 - 0.0105 * dip (slope 0 -> 0.532).
+# In such a cell the error in log10(X) is at most |slope change| * dmag / 4
+# (plus 0.532 * 0.0105 * ddip / 4 for the aspect ratio). With the default
+# dmag = 0.01 and ddip = 1 that is 6.3e-4 in log10 units (0.15 % relative) for
+# the dimensions and 2.7e-3 (0.63 %) for the aspect ratio. error_bound gives
+# the bound for a table, and build_tables also records the largest error
+# measured at the cell midpoints.
+
+import hashlib
+import json
+import os
+import pathlib
+
+import numpy as np
+
+from scalingRelationships import (
+    DIMENSIONS,
+    HB08_ABOVE,
+    HB08_BREAK,
+    MECHANISMS,
+    MODELS,
+    SCALING_COEFFS,
+    _COEFFS,
+    _names,
+    huang_aspect_ratio,
+    scaling_dimensions,
+)
+
+TABLE_DIR = pathlib.Path(
+    os.environ.get(
+        "SCALING_TABLE_DIR",
+        pathlib.Path.home() / ".cache" / "shakemap-postprocess-tools" / "scaling_tables",
+    )
+)
+TABLE_VERSION = 1
+
+MAG_RANGE = (4.0, 9.5)
+DMAG = 0.01
+DIP_RANGE = (0.0, 90.0)
+DDIP = 1.0
+
+# Slope change (in log10 units per magnitude) at the breaks of the piecewise relations
+HB08_SLOPE_CHANGE = abs(HB08_ABOVE[1] - SCALING_COEFFS[("HB08", "ALL")][2][1])
+HUANG_C1 = 0.532
+HUANG_C3 = -0.0105
+
+
+def error_bound(dmag=DMAG, ddip=DDIP):
+    """
+    Upper bound of the interpolation error in log10 units.
+    Returns:
+        Dict with "dimensions" (length, width, area) and "aspect_ratio".
+    """
+    return {
+        "dimensions": HB08_SLOPE_CHANGE * dmag / 4,
+        "aspect_ratio": HUANG_C1 * (dmag + abs(HUANG_C3) * ddip) / 4,
+    }
+
+
+def _grid(start, stop, step):
+    n = int(round((stop - start) / step)) + 1
+    return start + step * np.arange(n)
+
+
+def build_tables(mag_range=MAG_RANGE, dmag=DMAG, dip_range=DIP_RANGE, ddip=DDIP):
+    """
+    Tabulate the scaling relations over a magnitude (x dip) grid.
+    Args:
+        mag_range: (min, max) magnitude of the grid.
+        dmag: Magnitude spacing.
+        dip_range: (min, max) dip of the aspect ratio grid in degrees.
+        ddip: Dip spacing in degrees.
+    Returns:
+        Dict of arrays:
+            - mags, dips: the grid axes.
+            - log_dims: log10 of the median length, width and area, shape
+              (n_models, n_mechanisms, 3, n_mags), NaN where not provided.
+            - log_aspect: log10 of the Huang et al. aspect ratio, shape (n_mags, n_dips).
+            - max_error_dims, max_error_aspect: largest log10 error of the
+              interpolation measured at the cell midpoints.
+    """
+    mags = _grid(*mag_range, dmag)
+    dips = _grid(*dip_range, ddip)
+
+    def log_dims_at(m):
+        dims = scaling_dimensions(m[None, :], MODELS, np.array(MECHANISMS)[:, None])
+        return np.log10(np.stack([dims[f"{name}_mean"] for name in DIMENSIONS], axis=-2))
+
+    tables = {
+        "mags": mags,
+        "dips": dips,
+        "log_dims": log_dims_at(mags),
+        "log_aspect": np.log10(huang_aspect_ratio(mags[:, None], dips[None, :])),
+    }
+
+    # Check the interpolation against the exact values halfway between the nodes
+    mid_mags = (mags[1:] + mags[:-1]) / 2
+    mid_dips = (dips[1:] + dips[:-1]) / 2
+    with np.errstate(invalid="ignore"):
+        err = np.abs(
+            (tables["log_dims"][..., 1:] + tables["log_dims"][..., :-1]) / 2 - log_dims_at(mid_mags)
+        )
+    tables["max_error_dims"] = np.nanmax(err)
+    corners = tables["log_aspect"]
+    interp = (corners[1:, 1:] + corners[1:, :-1] + corners[:-1, 1:] + corners[:-1, :-1]) / 4
+    exact = np.log10(huang_aspect_ratio(mid_mags[:, None], mid_dips[None, :]))
+    tables["max_error_aspect"] = np.abs(interp - exact).max()
+    return tables
+
+
+def table_path(mag_range=MAG_RANGE, dmag=DMAG, dip_range=DIP_RANGE, ddip=DDIP, table_dir=TABLE_DIR):
+    """
+    Path of the stored tables for a grid.
+    """
+    key = json.dumps([TABLE_VERSION, MODELS, MECHANISMS, sorted(SCALING_COEFFS.items()), mag_range, dmag, dip_range, ddip])
+    return pathlib.Path(table_dir) / f"scaling_{hashlib.sha1(key.encode()).hexdigest()[:16]}.npz"
+
+
+def load_tables(mag_range=MAG_RANGE, dmag=DMAG, dip_range=DIP_RANGE, ddip=DDIP, table_dir=TABLE_DIR):
+    """
+    Load the tables for a grid from disk, building and storing them on first use.
+    Arguments as in build_tables, plus the directory the tables are stored in.
+    """
+    path = table_path(mag_range, dmag, dip_range, ddip, table_dir)
+    try:
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+    except (OSError, ValueError):
+        pass
+
+    tables = build_tables(mag_range, dmag, dip_range, ddip)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp, **tables)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"WARNING: Could not store the scaling tables in {path}: {e}")
+    return tables
+
+
+def _interp_index(values, axis):
+    # Cell index and fractional position along a regular grid axis (NaN outside)
+    step = axis[1] - axis[0]
+    pos = (np.asarray(values, dtype=float) - axis[0]) / step
+    outside = (pos < -1e-9) | (pos > len(axis) - 1 + 1e-9)
+    i = np.clip(np.floor(pos).astype(int), 0, len(axis) - 2)
+    frac = np.where(outside, np.nan, np.clip(pos - i, 0.0, 1.0))
+    return i, frac
+
+
+def lookup_dimensions(mag, model, mech="ALL", tables=None):
+    """
+    Median rupture dimensions by interpolation in the lookup tables.
+    Args:
+        mag: Magnitude(s), any shape.
+        model: Model name(s) (or MagScaling enums), broadcastable against mag.
+        mech: Mechanism name(s) (or Mechanism enums), broadcastable against mag.
+        tables: Tables from load_tables (default: the default grid).
+    Returns:
+        Dict with length, width, area (km, km^2) and sig_length, sig_width,
+        sig_area (log10) of the broadcast shape. Magnitudes outside the grid,
+        and dimensions the model does not provide, are NaN.
+    """
+    if tables is None:
+        tables = load_tables()
+    mag, model_idx, mech_idx = np.broadcast_arrays(
+        np.asarray(mag, dtype=float),
+        _names(model, MODELS, "model"),
+        _names(mech, MECHANISMS, "mechanism"),
+    )
+    i, frac = _interp_index(mag, tables["mags"])
+    log_dims = tables["log_dims"]
+    lo = log_dims[model_idx, mech_idx, :, i]
+    hi = log_dims[model_idx, mech_idx, :, i + 1]
+    values = 10 ** (lo + (hi - lo) * frac[..., None])
+
+    sig = _COEFFS[model_idx, mech_idx, :, 2]
+    above = (np.array(MODELS)[model_idx] == "HB08") & (mag > HB08_BREAK)
+    sig[..., 2] = np.where(above, HB08_ABOVE[2], sig[..., 2])
+
+    result = {}
+    for k, name in enumerate(DIMENSIONS):
+        result[name] = values[..., k]
+        result[f"sig_{name}"] = sig[..., k]
+    return result
+
+
+def lookup_aspect_ratio(mag, dip, tables=None):
+    """
+    Huang et al. (2024) aspect ratio by bilinear interpolation in the lookup tables.
+    Args:
+        mag: Magnitude(s).
+        dip: Dip(s) in degrees, broadcastable against mag.
+        tables: Tables from load_tables (default: the default grid).
+    Returns:
+        Aspect ratio (length / width) of the broadcast shape, NaN outside the grid.
+    """
+    if tables is None:
+        tables = load_tables()
+    mag, dip = np.broadcast_arrays(np.asarray(mag, dtype=float), np.asarray(dip, dtype=float))
+    i, fm = _interp_index(mag, tables["mags"])
+    j, fd = _interp_index(dip, tables["dips"])
+    t = tables["log_aspect"]
+    log_aspect = (
+        t[i, j] * (1 - fm) * (1 - fd)
+        + t[i + 1, j] * fm * (1 - fd)
+        + t[i, j + 1] * (1 - fm) * fd
+        + t[i + 1, j + 1] * fm * fd
+    )
+    return 10 ** log_aspect
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# Content-hash based skip/rebuild cache for ShakeMap workflow stages.
+#
+# A stage (e.g. the NP1 ShakeMap run) is described by its inputs: files such as
+# event.xml, model.conf, rupture.json and station lists, or generated text such
+# as the model.conf contents. The SHA-256 of every input is recorded, and the
+# stage counts as complete only if its products/ directory holds a completion
+# marker with the same combined hash. The marker is written atomically after
+# all outputs exist, so a partially written run never looks complete.
+#
+# Every completed stage is also recorded in an event-level manifest
+# (stage_manifest.json) listing the input hashes of each stage.
+
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+MARKER = ".stage_complete.json"
+MANIFEST = "stage_manifest.json"
+
+_manifest_lock = threading.Lock()
+
+
+def sha256_file(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def input_digests(inputs):
+    """
+    Hash the inputs of a stage.
+    Args:
+        inputs: Dict of input name -> pathlib.Path (file contents are hashed),
+            str or bytes (hashed directly, e.g. generated config text or a
+            command line). Missing files are recorded as "missing".
+    Returns:
+        Dict of input name -> SHA-256 hex digest.
+    """
+    digests = {}
+    for name, value in inputs.items():
+        if isinstance(value, pathlib.Path):
+            digests[name] = sha256_file(value) if value.is_file() else "missing"
+        else:
+            if isinstance(value, str):
+                value = value.encode()
+            digests[name] = hashlib.sha256(value).hexdigest()
+    return digests
+
+
+def combined_hash(digests):
+    return hashlib.sha256(json.dumps(digests, sort_keys=True).encode()).hexdigest()
+
+
+def marker_path(stage_dir):
+    return pathlib.Path(stage_dir) / "products" / MARKER
+
+
+def is_complete(stage_dir, digests):
+    """
+    True if the stage finished with exactly these inputs.
+    Args:
+        stage_dir: Stage directory (its products/ holds the marker).
+        digests: Input digests from input_digests.
+    """
+    try:
+        with open(marker_path(stage_dir)) as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return marker.get("hash") == combined_hash(digests)
+
+
+def clear(stage_dir):
+    """
+    Remove the completion marker before (re-)running a stage.
+    """
+    marker_path(stage_dir).unlink(missing_ok=True)
+
+
+def mark_complete(stage_dir, stage, digests, manifest_dir=None):
+    """
+    Atomically mark a stage as complete and record it in the manifest.
+    Args:
+        stage_dir: Stage directory (its products/ holds the marker).
+        stage: Stage name.
+        digests: Input digests from input_digests.
+        manifest_dir: Directory of the event-level manifest (default: the
+            parent of stage_dir).
+    """
+    entry = {
+        "stage": stage,
+        "hash": combined_hash(digests),
+        "inputs": digests,
+        "completed": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    marker = marker_path(stage_dir)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    _write_json(marker, entry)
+
+    manifest = pathlib.Path(manifest_dir or pathlib.Path(stage_dir).parent) / MANIFEST
+    with _manifest_lock:
+        try:
+            with open(manifest) as f:
+                stages = json.load(f)
+        except (OSError, ValueError):
+            stages = {}
+        stages[stage] = entry
+        _write_json(manifest, stages)
+
+
+def _write_json(path, data):
+    tmp = pathlib.Path(f"{path}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,76 @@
+import json
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+pytest.importorskip("configobj")
+pytest.importorskip("esi_utils_rupture")
+import extract_shake  # noqa: E402
+
+STATION_LIST = {
+    "a": -1.5e10,
+    "b": [1, -2.25, 3e-5, 1E+2, True, None],
+    "name": "e.5-1",
+    "features": [
+        {"type": "Feature", "id": "CI.ABC", "properties": {"distance": 12.345678, "pga": -0.0001e3}},
+        {"type": "Feature", "id": "NC.XYZ", "properties": {"distance": 1234567890123, "pga": 0.5}},
+    ],
+    "z": 0.000123,
+}
+
+
+def read_stream(path, chunk_size):
+    # Rebuild the object from the streamed events
+    data = {}
+    for kind, key, value in extract_shake.iter_station_list(path, chunk_size):
+        if kind == "member":
+            data[key] = value
+        elif kind == "features":
+            data[key] = []
+        else:
+            data["features"].append(value)
+    return data
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 17))
+def test_stream_matches_json_load(tmp_path, chunk_size):
+    path = tmp_path / "stationlist.json"
+    path.write_text(json.dumps(STATION_LIST))
+    assert read_stream(path, chunk_size) == json.loads(path.read_text())
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 17))
+def test_top_level_number_split_across_chunks(tmp_path, chunk_size):
+    path = tmp_path / "stationlist.json"
+    path.write_text('{"a":-1.5e10}')
+    assert read_stream(path, chunk_size) == {"a": -1.5e10}
+
+
+def test_select_versions_keeps_requested_event(tmp_path):
+    for name in [
+        "us6000jllz_us_2_stationlist.json",
+        "us6000jllz_us_2_rupture.json",
+        "us6000jllz_us_3_stationlist.json",
+        "us7000abcd_us_2_stationlist.json",
+        "us7000abcd_us_2_rupture.json",
+    ]:
+        (tmp_path / name).write_text("{}")
+    index = extract_shake.index_folder(tmp_path)
+
+    selected = extract_shake.select_versions(index, "us6000jllz", [2])
+    assert list(selected) == [("us6000jllz", 2)]
+    assert sorted(f.name for files in selected[("us6000jllz", 2)].values() for f in files) == [
+        "us6000jllz_us_2_rupture.json",
+        "us6000jllz_us_2_stationlist.json",
+    ]
+    assert sorted(extract_shake.select_versions(index)) == [
+        ("us6000jllz", 2),
+        ("us6000jllz", 3),
+        ("us7000abcd", 2),
+    ]
+    # An alias id that matches no file takes the whole folder, as before
+    alias = extract_shake.select_versions(index, "ci12345678", [2])
+    assert list(alias) == [("ci12345678", 2)]
+    assert len(alias[("ci12345678", 2)]["stationlist"]) == 2
@@ -0,0 +1,66 @@
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "shakemap_utils"))
+pytest.importorskip("pygmt")
+pytest.importorskip("pyproj")
+import custom_utils  # noqa: E402
+
+
+def ring(top, bottom):
+    # ShakeMap ring: top edge, bottom edge reversed, first vertex again
+    return [list(p) for p in top] + [list(p) for p in bottom[::-1]] + [list(top[0])]
+
+
+def edge(lon0, lon1, lat, z0, z1=None):
+    return [(lon0, lat, z0), (lon1, lat, z0 if z1 is None else z1)]
+
+
+def rupture(*rings):
+    return {"features": [{"type": "Feature", "geometry": {"type": "MultiPolygon", "coordinates": [[r] for r in rings]}}]}
+
+
+def dims(*rings):
+    segments = custom_utils.rupture_segments(rupture(*rings))
+    return segments, custom_utils.rupture_length_width(segments)
+
+
+def test_along_strike_with_different_depths():
+    segments, (length, width) = dims(
+        ring(edge(10, 10.5, 0, 0), edge(10, 10.5, -0.1, 20)),
+        ring(edge(10.5, 11, 0, 0), edge(10.5, 11, -0.1, 15)),
+    )
+    assert list(segments["dip_row"]) == [0, 0]
+    assert list(segments["strike_index"]) == [0, 1]
+    assert length == pytest.approx(111e3, rel=0.01)
+    assert width == pytest.approx(segments["dip_length"].mean())
+
+
+def test_along_dip():
+    segments, (length, width) = dims(
+        ring(edge(10, 11, 0, 0), edge(10, 11, -0.1, 10)),
+        ring(edge(10, 11, -0.1, 10), edge(10, 11, -0.2, 20)),
+        ring(edge(10, 11, -0.2, 20), edge(10, 11, -0.4, 40)),
+    )
+    assert list(segments["dip_row"]) == [0, 1, 2]
+    assert length == pytest.approx(segments["strike_length"].mean())
+    assert width == pytest.approx(segments["dip_length"].sum())
+
+
+def test_along_strike_and_dip_with_sloping_top_edge():
+    # The top edge deepens along strike, so no two rings share a depth range
+    segments, (length, width) = dims(
+        ring(edge(10, 10.5, 0, 0, 2), edge(10, 10.5, -0.1, 10, 12)),
+        ring(edge(10.5, 11, 0, 2, 4), edge(10.5, 11, -0.1, 12, 14)),
+        ring(edge(10, 10.5, -0.1, 10, 12), edge(10, 10.5, -0.2, 20, 22)),
+        ring(edge(10.5, 11, -0.1, 12, 14), edge(10.5, 11, -0.2, 22, 24)),
+    )
+    assert list(segments["dip_row"]) == [0, 0, 1, 1]
+    assert list(segments["strike_index"]) == [0, 1, 0, 1]
+    assert length == pytest.approx(111e3, rel=0.01)
+    row_width = [segments["dip_length"][segments["dip_row"] == row].mean() for row in (0, 1)]
+    assert width == pytest.approx(np.sum(row_width))
+
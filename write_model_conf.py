@@ -3,8 +3,8 @@
 import argparse
 from pathlib import Path
 
-def write_model_conf(outfile, nsim, true_grid, strike, dip):
-    content = f"""[modeling]
+def model_conf_text(nsim, true_grid, strike, dip):
+    return f"""[modeling]
     ffsim_nsim = {nsim}
     ffsim_true_grid = {true_grid}
     ffsim_min_strike = {strike}
@@ -12,6 +12,9 @@ def write_model_conf(outfile, nsim, true_grid, strike, dip):
     ffsim_min_dip = {dip}
     ffsim_max_dip = {dip}
 """
+
+def write_model_conf(outfile, nsim, true_grid, strike, dip):
+    content = model_conf_text(nsim, true_grid, strike, dip)
     Path(outfile).write_text(content)
     print(f"Wrote {outfile}")
 